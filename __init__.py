@@ -5,6 +5,8 @@ else:
     from add_mesh_SpaceshipGenerator import spaceship_generator
 
 import bpy
+import random
+import time
 from add_mesh_SpaceshipGenerator import spaceship_generator
 
 bl_info = {
@@ -42,6 +44,10 @@ class GenerateSpaceship(bpy.types.Operator):
     # allow_vertical_symmetry = bpy.props. BoolProperty(default=False, name='Allow Vertical Symmetry')
     # apply_bevel_modifier = bpy.props.BoolProperty(default=True,  name='Apply Bevel Modifier')
     # assign_materials = bpy.props.BoolProperty(default=True,  name='Assign Materials')
+    # compact = bpy.props.BoolProperty(default=False,  name='Compact Topology')
+    # loft_hull = bpy.props.BoolProperty(default=False,  name='Loft Hull')
+    # node_detail = bpy.props.BoolProperty(default=False,  name='Node Detail')
+    # collision_hull = bpy.props.BoolProperty(default=False,  name='Collision Hull')
     # reset_scene = bpy.props.BoolProperty(default=False,  name='Reset')
 
     random_seed = ''
@@ -58,6 +64,10 @@ class GenerateSpaceship(bpy.types.Operator):
     allow_vertical_symmetry = False
     apply_bevel_modifier = True
     assign_materials = True
+    compact = False
+    loft_hull = False
+    node_detail = False
+    collision_hull = False
     reset_scene = False
 
     CreatedObject = None
@@ -89,6 +99,10 @@ class GenerateSpaceship(bpy.types.Operator):
     #     box.prop(self, 'allow_vertical_symmetry')
     #     box.prop(self, 'apply_bevel_modifier')
     #     box.prop(self, 'assign_materials')
+    #     box.prop(self, 'compact')
+    #     box.prop(self, 'loft_hull')
+    #     box.prop(self, 'node_detail')
+    #     box.prop(self, 'collision_hull')
     #     box.operator("spaceship.create", text='Create SpaceShip', icon='ACTION')
     #     box.prop(self, "reset_scene", text="Reset", icon='FILE_REFRESH')
 
@@ -108,6 +122,10 @@ class GenerateSpaceship(bpy.types.Operator):
         self.allow_vertical_symmetry = False
         self.apply_bevel_modifier = True
         self.assign_materials = True
+        self.compact = False
+        self.loft_hull = False
+        self.node_detail = False
+        self.collision_hull = False
         self.reset_scene = False
 
         self.CreatedObject = spaceship_generator.generate_spaceship(
@@ -124,7 +142,11 @@ class GenerateSpaceship(bpy.types.Operator):
             self.allow_horizontal_symmetry,
             self.allow_vertical_symmetry,
             self.apply_bevel_modifier,
-            self.assign_materials)
+            self.assign_materials,
+            self.compact,
+            self.loft_hull,
+            self.node_detail,
+            self.collision_hull)
 
     def execute(self, context):
         print("Execute on GenerateSpaceship")
@@ -148,7 +170,11 @@ class GenerateSpaceship(bpy.types.Operator):
                 # self.allow_horizontal_symmetry,
                 # self.allow_vertical_symmetry,
                 # self.apply_bevel_modifier,
-                # self.assign_materials
+                # self.assign_materials,
+                # self.compact,
+                # self.loft_hull,
+                # self.node_detail,
+                # self.collision_hull
             )
             StartCreation = False
             return {'FINISHED'}
@@ -168,7 +194,11 @@ class GenerateSpaceship(bpy.types.Operator):
                 # self.allow_horizontal_symmetry,
                 # self.allow_vertical_symmetry,
                 # self.apply_bevel_modifier,
-                # self.assign_materials
+                # self.assign_materials,
+                # self.compact,
+                # self.loft_hull,
+                # self.node_detail,
+                # self.collision_hull
             )
             self.count += 1
             return {'FINISHED'}
@@ -176,12 +206,150 @@ class GenerateSpaceship(bpy.types.Operator):
             return {'RUNNING_MODAL'}
 
 
+class GenerateSpaceshipModal(GenerateSpaceship):
+    """Generate a spaceship in timed steps, keeping the UI responsive (Esc to cancel)."""
+    bl_idname = "mesh.generate_spaceship_modal"
+    bl_label = "Spaceship (Interactive)"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    # Seconds of generation work per timer tick, and the tick interval
+    time_budget = 0.03
+    timer_interval = 0.01
+    # Show a coarse hull-only ship straight away, swapped for the full one when done
+    show_preview = True
+
+    _timer = None
+    _steps = None
+    _rng_state = None
+    _preview = None
+
+    def update_preview(self, bm, stage):
+        """Show the in-progress bmesh in the viewport between stages."""
+        if self.show_preview and stage in {'hull', 'asymmetry'}:
+            # The coarse preview already shows exactly this
+            return
+        if self._preview is None:
+            me = bpy.data.meshes.new('Spaceship Preview')
+            self._preview = bpy.data.objects.new('Spaceship Preview', me)
+            bpy.context.collection.objects.link(self._preview)
+        bm.to_mesh(self._preview.data)
+        self._preview.data.update()
+        bpy.context.workspace.status_text_set(f"Spaceship: {stage} stage done (Esc to cancel)")
+
+    def remove_preview(self):
+        if self._preview is not None:
+            me = self._preview.data
+            bpy.data.objects.remove(self._preview)
+            bpy.data.meshes.remove(me)
+            self._preview = None
+
+    def finish(self, context):
+        context.window_manager.event_timer_remove(self._timer)
+        context.window_manager.progress_end()
+        context.workspace.status_text_set(None)
+        self.remove_preview()
+        self._timer = None
+        self._steps = None
+
+    def invoke(self, context, event):
+        print("Invoke on GenerateSpaceshipModal")
+        self._rng_state = None
+        # The preview and the ship are seeded separately, so pick the seed
+        # now when it is left to chance: '' follows the current random state,
+        # None the OS
+        random_seed = self.random_seed
+        if random_seed == '':
+            random_seed = str(random.randrange(1 << 31))
+        elif random_seed is None:
+            random_seed = str(random.SystemRandom().randrange(1 << 31))
+        if self.show_preview:
+            self._preview = spaceship_generator.generate_spaceship_preview(
+                random_seed,
+                self.x_segments,
+                self.y_segments,
+                self.z_segments,
+                self.num_hull_segments_min,
+                self.num_hull_segments_max,
+                self.create_asymmetry_segments,
+                self.num_asymmetry_segments_min,
+                self.num_asymmetry_segments_max)
+        self._steps = spaceship_generator.generate_spaceship_steps(
+            random_seed,
+            self.x_segments,
+            self.y_segments,
+            self.z_segments,
+            self.num_hull_segments_min,
+            self.num_hull_segments_max,
+            self.create_asymmetry_segments,
+            self.num_asymmetry_segments_min,
+            self.num_asymmetry_segments_max,
+            self.create_face_detail,
+            self.allow_horizontal_symmetry,
+            self.allow_vertical_symmetry,
+            self.apply_bevel_modifier,
+            self.assign_materials,
+            self.compact,
+            self.loft_hull,
+            self.node_detail,
+            self.collision_hull,
+            on_stage=self.update_preview)
+        wm = context.window_manager
+        wm.progress_begin(0, 100)
+        self._timer = wm.event_timer_add(self.timer_interval, window=context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self.cancel(context)
+            return {'CANCELLED'}
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        # Keep our own random state so other scripts running between ticks
+        # can't change the ship, and we don't disturb theirs
+        outer_state = random.getstate()
+        if self._rng_state is not None:
+            random.setstate(self._rng_state)
+        deadline = time.perf_counter() + self.time_budget
+        try:
+            while time.perf_counter() < deadline:
+                context.window_manager.progress_update(next(self._steps))
+        except StopIteration as stop:
+            self.CreatedObject = stop.value
+            self.finish(context)
+            return {'FINISHED'}
+        except Exception:
+            self.finish(context)
+            raise
+        finally:
+            self._rng_state = random.getstate()
+            random.setstate(outer_state)
+
+        if context.area:
+            context.area.tag_redraw()
+        return {'RUNNING_MODAL'}
+
+    def cancel(self, context):
+        print("Cancel on GenerateSpaceshipModal")
+        if self._steps is not None:
+            # Closing the generator frees its bmesh, and removes the ship
+            # again if it was already linked into the scene
+            self._steps.close()
+        self.finish(context)
+
+
 def menu_func(self, context):
     self.layout.operator(GenerateSpaceship.bl_idname, text="Spaceship")
 
 
+def menu_func_modal(self, context):
+    self.layout.operator(GenerateSpaceshipModal.bl_idname, text="Spaceship (Interactive)")
+
+
 classes = (
     GenerateSpaceship,
+    GenerateSpaceshipModal,
 )
 register_tool, unregister_tool = bpy.utils.register_classes_factory(classes)
 
@@ -189,10 +357,12 @@ register_tool, unregister_tool = bpy.utils.register_classes_factory(classes)
 def register():
     register_tool()
     bpy.types.VIEW3D_MT_mesh_add.append(menu_func)
+    bpy.types.VIEW3D_MT_mesh_add.append(menu_func_modal)
 
 
 def unregister():
     unregister_tool()
+    bpy.types.VIEW3D_MT_mesh_add.remove(menu_func_modal)
     bpy.types.VIEW3D_MT_mesh_add.remove(menu_func)
 
 
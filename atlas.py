@@ -0,0 +1,239 @@
+# Export time bake of the five spaceship materials into one texture atlas.
+# The ship (or a fleet batch, whose ships share one material set) gets its
+# modifiers applied and is unwrapped, then Cycles bakes the look of each
+# Material slot into a color and an emission image, and a single 'Spaceship
+# Atlas' material using them replaces the five slots: one draw call per ship
+# instead of five.
+#
+# The color is baked as emission, which needs a single sample and no
+# lighting, from bake shaders that reproduce each Material:
+#   hull, hull_dark       the hull color
+#   hull_lights           the hull color plus the window texture, and the
+#                         glowing windows as emission
+#   exhaust_burn, glow_disc  the glow color, also as emission
+#
+#   blender -b --python atlas.py -- <output.glb> [<number of ships>]
+
+import sys
+from contextlib import contextmanager
+from math import radians
+import bpy
+import numpy as np
+from add_mesh_SpaceshipGenerator.spaceship_generator import Material
+
+UV_NAME = 'Atlas'
+
+
+@contextmanager
+def bake_settings(scene=None, margin=4):
+    '''Set up Cycles for fast CPU emission bakes, restoring the previous
+    render settings afterwards. Bake many objects inside one with block to
+    reuse the setup.
+    Args:
+        scene: scene to bake in, the current one by default.
+        margin (int): bake margin in pixels, keeps mip maps from bleeding.
+    '''
+    scene = scene or bpy.context.scene
+    previous = (scene.render.engine, scene.cycles.device, scene.cycles.samples,
+                scene.render.bake.margin, scene.render.bake.use_clear)
+    scene.render.engine = 'CYCLES'
+    scene.cycles.device = 'CPU'
+    scene.cycles.samples = 1
+    scene.render.bake.margin = margin
+    scene.render.bake.use_clear = True
+    try:
+        yield scene
+    finally:
+        (scene.render.engine, scene.cycles.device, scene.cycles.samples,
+         scene.render.bake.margin, scene.render.bake.use_clear) = previous
+
+
+def apply_modifiers(obj):
+    '''Replace the mesh of obj with its evaluated mesh and drop the modifiers.'''
+    evaluated = obj.evaluated_get(bpy.context.evaluated_depsgraph_get())
+    mesh = bpy.data.meshes.new_from_object(evaluated)
+    old_mesh = obj.data
+    obj.modifiers.clear()
+    obj.data = mesh
+    if not old_mesh.users:
+        bpy.data.meshes.remove(old_mesh)
+
+
+def select_only(obj):
+    '''Make obj the only selected and the active object.'''
+    bpy.ops.object.select_all(action='DESELECT')
+    obj.select_set(True)
+    bpy.context.view_layer.objects.active = obj
+
+
+def unwrap(obj, island_margin=0.003):
+    '''Add the atlas UV map to obj and fill it with a smart projection.'''
+    uv_layer = obj.data.uv_layers.get(UV_NAME) or obj.data.uv_layers.new(name=UV_NAME)
+    obj.data.uv_layers.active = uv_layer
+    select_only(obj)
+    bpy.ops.object.mode_set(mode='EDIT')
+    bpy.ops.mesh.select_all(action='SELECT')
+    bpy.ops.uv.smart_project(angle_limit=radians(66), island_margin=island_margin)
+    bpy.ops.object.mode_set(mode='OBJECT')
+
+
+def find_image_node(mat, filename):
+    '''Get the image texture node of mat showing an image loaded from filename.'''
+    for node in mat.node_tree.nodes:
+        if node.type == 'TEX_IMAGE' and node.image and node.image.filepath.endswith(filename):
+            return node
+    return None
+
+
+def add_bake_shader(mat, material, channel, target):
+    '''Wire mat to emit what should be baked for it, into the target image.
+    Args:
+        mat: material of the Material slot.
+        material (Material): which Material it is.
+        channel (str): 'color' or 'emission'.
+        target: image to bake into.
+    Returns:
+        nodes: the added nodes, to remove with remove_bake_shader.
+    '''
+    tree = mat.node_tree
+    nodes = []
+
+    def new(node_type):
+        node = tree.nodes.new(node_type)
+        nodes.append(node)
+        return node
+
+    def box_mapped(filename):
+        # Windows are box mapped in object space, like the original texture slots
+        tex_node = find_image_node(mat, filename)
+        if tex_node is None:
+            return None
+        image_node = new('ShaderNodeTexImage')
+        image_node.image = tex_node.image
+        image_node.projection = 'BOX'
+        image_node.projection_blend = 0.2
+        tree.links.new(new('ShaderNodeTexCoord').outputs['Object'], image_node.inputs['Vector'])
+        return image_node.outputs['Color']
+
+    emission = new('ShaderNodeEmission')
+    color = tuple(mat.diffuse_color)
+    glowing = material in (Material.exhaust_burn, Material.glow_disc)
+    if channel == 'color' or glowing:
+        emission.inputs['Color'].default_value = color
+    else:
+        emission.inputs['Color'].default_value = (0, 0, 0, 1)
+    if material == Material.hull_lights:
+        windows = box_mapped('hull_lights_diffuse.png' if channel == 'color' else 'hull_lights_emit.png')
+        if windows is not None:
+            if channel == 'color':
+                mix = new('ShaderNodeMixRGB')
+                mix.blend_type = 'ADD'
+                mix.inputs['Fac'].default_value = 1.0
+                mix.inputs['Color1'].default_value = color
+                tree.links.new(windows, mix.inputs['Color2'])
+                tree.links.new(mix.outputs['Color'], emission.inputs['Color'])
+            else:
+                tree.links.new(windows, emission.inputs['Color'])
+
+    output = new('ShaderNodeOutputMaterial')
+    output.target = 'CYCLES'
+    tree.links.new(emission.outputs['Emission'], output.inputs['Surface'])
+    output.is_active_output = True
+
+    # The bake writes to the active image node
+    target_node = new('ShaderNodeTexImage')
+    target_node.image = target
+    tree.nodes.active = target_node
+    return nodes
+
+
+def remove_bake_shader(mat, nodes):
+    '''Remove the nodes added by add_bake_shader.'''
+    for node in nodes:
+        mat.node_tree.nodes.remove(node)
+    for node in mat.node_tree.nodes:
+        if node.type == 'OUTPUT_MATERIAL':
+            node.is_active_output = True
+            break
+
+
+def create_atlas_material(name, color_image, emission_image):
+    '''Create the single material using the baked atlas.'''
+    mat = bpy.data.materials.new(name)
+    mat.use_nodes = True
+    tree = mat.node_tree
+    principled = tree.nodes.get('Principled BSDF')
+    uv_node = tree.nodes.new('ShaderNodeUVMap')
+    uv_node.uv_map = UV_NAME
+    for image, socket_name in ((color_image, 'Base Color'), (emission_image, 'Emission Color')):
+        image_node = tree.nodes.new('ShaderNodeTexImage')
+        image_node.image = image
+        tree.links.new(uv_node.outputs['UV'], image_node.inputs['Vector'])
+        tree.links.new(image_node.outputs['Color'], principled.inputs[socket_name])
+    principled.inputs['Emission Strength'].default_value = 1.0
+    principled.inputs['Specular IOR Level'].default_value = 0.1
+    return mat
+
+
+def bake_atlas(obj, size=512, island_margin=0.003):
+    '''Bake the Material slots of a spaceship into one atlas material.
+    Call inside bake_settings to reuse the bake setup over many ships.
+    Args:
+        obj: spaceship object from generate_spaceship, or a fleet batch.
+        size (int): width and height of the atlas images.
+        island_margin (float): UV island margin of the unwrap.
+    Returns:
+        mat: the atlas material, now the only material of obj.
+    '''
+    apply_modifiers(obj)
+    unwrap(obj, island_margin)
+    select_only(obj)
+    old_materials = list(obj.data.materials)
+    images = {}
+    for channel in ('color', 'emission'):
+        image = bpy.data.images.new('%s Atlas %s' % (obj.name, channel.title()), size, size)
+        images[channel] = image
+        added = []
+        for index, mat in enumerate(old_materials):
+            if mat is not None and mat.use_nodes and index < len(Material):
+                added.append((mat, add_bake_shader(mat, Material(index), channel, image)))
+        try:
+            bpy.ops.object.bake(type='EMIT')
+        finally:
+            for mat, nodes in added:
+                remove_bake_shader(mat, nodes)
+        image.pack()
+
+    mat = create_atlas_material('%s Atlas' % obj.name, images['color'], images['emission'])
+    mesh = obj.data
+    mesh.materials.clear()
+    mesh.materials.append(mat)
+    mesh.polygons.foreach_set('material_index', np.zeros(len(mesh.polygons), dtype=np.int32))
+    mesh.update()
+    for old_mat in old_materials:
+        if old_mat is not None and not old_mat.users:
+            bpy.data.materials.remove(old_mat)
+    return mat
+
+
+def bake_atlases(objects, size=512, island_margin=0.003):
+    '''Bake atlas materials for many spaceships (or fleet batches) with one
+    bake setup.
+    Returns:
+        materials: the atlas material per object.
+    '''
+    with bake_settings():
+        return [bake_atlas(obj, size, island_margin) for obj in objects]
+
+
+if __name__ == "__main__":
+    from add_mesh_SpaceshipGenerator import fleet
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    count = int(argv[1]) if len(argv) > 1 else 1
+    batches = fleet.generate_fleet(str(i) for i in range(count))
+    bake_atlases(batches)
+    if argv:
+        select_only(batches[0])
+        for batch in batches:
+            batch.select_set(True)
+        bpy.ops.export_scene.gltf(filepath=argv[0], export_format='GLB', use_selection=True)
@@ -21,6 +21,17 @@ with zipfile.ZipFile('add_mesh_SpaceshipGenerator.zip', 'w', zipfile.ZIP_DEFLATE
     for filename in [
             '__init__.py',
             'spaceship_generator.py',
+            'ship_format.py',
+            'leak_tracker.py',
+            'generation_server.py',
+            'fingerprint.py',
+            'dataset_writer.py',
+            'detail_nodes.py',
+            'fleet.py',
+            'atlas.py',
+            'seed_search.py',
+            'kitbash.py',
+            'hull_cache.py',
             'textures/hull_normal.png',
             'textures/hull_lights_emit.png',
             'textures/hull_lights_diffuse.png']:
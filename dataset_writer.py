@@ -0,0 +1,320 @@
+# Dataset mode: generates spaceships for many seeds and streams them into
+# fixed size .npz shards for training.
+#
+#   blender -b --python dataset_writer.py -- --output /data/ships --count 100000
+#   blender -b --python dataset_writer.py -- --output /data/ships --count 100000 --worker 1 --workers 4
+#
+# Each shard holds ships_per_shard ships with their triangle buffers
+# concatenated:
+#   positions (V, 3) float32, normals (V, 3) float32, indices (T, 3) uint32
+#   (relative to the ship's first vertex), materials (T,) uint8, details (T,)
+#   uint8 (spaceship_generator.Detail), vertex_offsets and triangle_offsets
+#   (S + 1,) int64, seeds (S,), bounds (S, 2, 3) float32, polygon_counts (S,)
+#   int64, plus the generation params and material names as JSON.
+#
+# Worker i of n takes the seeds at positions i, i + n, i + 2n... and writes
+# 'shard-w<i>-<n>.npz' and 'manifest-w<i>.jsonl', so workers never touch the
+# same file. A shard is written to a temporary file and renamed into place,
+# and only then recorded in the manifest with its sha256, so after a crash
+# rerunning the same command skips every seed in the manifests and redoes
+# only the unfinished shard. Shards are saved on a background thread so disk
+# I/O overlaps generating the next ships.
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+import numpy as np
+
+MANIFEST_PATTERN = 'manifest-w*.jsonl'
+
+
+def shard_name(worker_index, shard_index):
+    '''Get the file name of a worker's shard.'''
+    return 'shard-w%d-%06d.npz' % (worker_index, shard_index)
+
+
+def manifest_path(output_dir, worker_index):
+    '''Get the path of a worker's manifest.'''
+    return os.path.join(output_dir, 'manifest-w%d.jsonl' % worker_index)
+
+
+def read_manifests(output_dir):
+    '''Read the manifest entries of all workers.
+    Entries whose shard is missing are dropped, and a partial last line (from
+    a crash while appending) is ignored.
+    Returns:
+        entries: list of dicts with 'shard', 'worker', 'index', 'sha256',
+            'seeds', 'ships', 'triangles' and 'params'.
+    '''
+    entries = []
+    for path in sorted(glob.glob(os.path.join(output_dir, MANIFEST_PATTERN))):
+        with open(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if os.path.exists(os.path.join(output_dir, entry['shard'])):
+                    entries.append(entry)
+    return entries
+
+
+def completed_seeds(output_dir):
+    '''Get the set of seeds already written to a shard by any worker.'''
+    return {random_seed for entry in read_manifests(output_dir) for random_seed in entry['seeds']}
+
+
+def file_sha256(path):
+    '''Get the sha256 hex digest of a file.'''
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def verify_dataset(output_dir):
+    '''Check every shard in the manifests against its recorded sha256.
+    Returns:
+        bad: list of shard names that are missing or don't match.
+    '''
+    bad = []
+    for path in sorted(glob.glob(os.path.join(output_dir, MANIFEST_PATTERN))):
+        with open(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                shard_path = os.path.join(output_dir, entry['shard'])
+                if not os.path.exists(shard_path) or file_sha256(shard_path) != entry['sha256']:
+                    bad.append(entry['shard'])
+    return bad
+
+
+def ship_record(obj, random_seed):
+    '''Get the dataset record of a generated spaceship.
+    Args:
+        obj: spaceship object from generate_spaceship.
+        random_seed (str): seed it was generated from.
+    Returns:
+        record: dict of numpy buffers and metadata for one ship.
+    '''
+    from add_mesh_SpaceshipGenerator import ship_format
+    buffers = ship_format.triangle_buffers(obj)
+    positions = buffers['positions'].astype(np.float32)
+    if len(positions):
+        bounds = np.stack((positions.min(axis=0), positions.max(axis=0)))
+    else:
+        bounds = np.zeros((2, 3), dtype=np.float32)
+    return {'seed': random_seed,
+            'positions': positions,
+            'normals': buffers['normals'].astype(np.float32),
+            'indices': buffers['indices'].astype(np.uint32),
+            'materials': buffers['materials'].astype(np.uint8),
+            'details': buffers['details'].astype(np.uint8),
+            'bounds': bounds,
+            'polygon_count': len(obj.data.polygons),
+            'material_names': buffers['material_names']}
+
+
+def pack_shard(records, params):
+    '''Concatenate ship records into the arrays of one shard.'''
+    vertex_counts = [len(record['positions']) for record in records]
+    triangle_counts = [len(record['indices']) for record in records]
+    return {
+        'positions': np.concatenate([record['positions'] for record in records]).reshape(-1, 3),
+        'normals': np.concatenate([record['normals'] for record in records]).reshape(-1, 3),
+        'indices': np.concatenate([record['indices'] for record in records]).reshape(-1, 3),
+        'materials': np.concatenate([record['materials'] for record in records]),
+        'details': np.concatenate([record['details'] for record in records]),
+        'vertex_offsets': np.concatenate(([0], np.cumsum(vertex_counts))).astype(np.int64),
+        'triangle_offsets': np.concatenate(([0], np.cumsum(triangle_counts))).astype(np.int64),
+        'seeds': np.array([record['seed'] for record in records]),
+        'bounds': np.stack([record['bounds'] for record in records]).astype(np.float32),
+        'polygon_counts': np.array([record['polygon_count'] for record in records], dtype=np.int64),
+        'params': np.array(json.dumps(params, sort_keys=True)),
+        'material_names': np.array(json.dumps(records[0]['material_names'])),
+    }
+
+
+def save_shard(output_dir, worker_index, shard_index, records, params, compress=False):
+    '''Write a shard atomically, then record it in the worker's manifest.
+    Returns:
+        entry: the manifest entry.
+    '''
+    name = shard_name(worker_index, shard_index)
+    path = os.path.join(output_dir, name)
+    temp_path = path + '.tmp'
+    arrays = pack_shard(records, params)
+    with open(temp_path, 'wb') as f:
+        (np.savez_compressed if compress else np.savez)(f, **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    sha256 = file_sha256(temp_path)
+    os.replace(temp_path, path)
+
+    entry = {'shard': name,
+             'worker': worker_index,
+             'index': shard_index,
+             'sha256': sha256,
+             'seeds': [record['seed'] for record in records],
+             'ships': len(records),
+             'triangles': int(arrays['triangle_offsets'][-1]),
+             'params': params}
+    with open(manifest_path(output_dir, worker_index), 'a+b') as f:
+        # Cut a partial last line left by a crash, or the entry would join it
+        size = f.seek(0, os.SEEK_END)
+        if size:
+            f.seek(size - 1)
+            if f.read(1) != b'\n':
+                f.seek(0)
+                f.truncate(f.read().rfind(b'\n') + 1)
+        f.write((json.dumps(entry) + '\n').encode())
+        f.flush()
+        os.fsync(f.fileno())
+    return entry
+
+
+def load_shard(path):
+    '''Load a shard written by write_dataset.
+    Returns:
+        ships: list of dicts with the per ship 'seed', 'positions', 'normals',
+            'indices', 'materials', 'details', 'bounds' and 'polygon_count'.
+    '''
+    with np.load(path) as shard:
+        arrays = {name: shard[name] for name in shard.files}
+    ships = []
+    vertex_offsets = arrays['vertex_offsets']
+    triangle_offsets = arrays['triangle_offsets']
+    for i, random_seed in enumerate(arrays['seeds']):
+        vertices = slice(vertex_offsets[i], vertex_offsets[i + 1])
+        triangles = slice(triangle_offsets[i], triangle_offsets[i + 1])
+        ships.append({'seed': str(random_seed),
+                      'positions': arrays['positions'][vertices],
+                      'normals': arrays['normals'][vertices],
+                      'indices': arrays['indices'][triangles],
+                      'materials': arrays['materials'][triangles],
+                      'details': arrays['details'][triangles],
+                      'bounds': arrays['bounds'][i],
+                      'polygon_count': int(arrays['polygon_counts'][i])})
+    return ships
+
+
+def write_dataset(output_dir,
+                  seeds,
+                  worker_index=0,
+                  worker_count=1,
+                  ships_per_shard=256,
+                  compress=False,
+                  **params):
+    '''Generate a spaceship per seed and stream them into shards.
+    Seeds already recorded in any manifest in output_dir are skipped.
+    Args:
+        output_dir (str): dataset directory, shared by all workers.
+        seeds: seeds of the whole dataset, the same for every worker.
+        worker_index (int): index of this worker.
+        worker_count (int): total number of workers.
+        ships_per_shard (int): number of ships per shard.
+        compress (bool): whether to deflate the shards, slower but smaller.
+        params: extra keyword arguments for generate_spaceship.
+    Returns:
+        entries: the manifest entries written by this call.
+    '''
+    from add_mesh_SpaceshipGenerator import spaceship_generator
+
+    os.makedirs(output_dir, exist_ok=True)
+    for temp_path in glob.glob(os.path.join(output_dir, 'shard-w%d-*.tmp' % worker_index)):
+        os.remove(temp_path)  # Unfinished shard from a crashed run
+    done = completed_seeds(output_dir)
+    own_entries = [entry for entry in read_manifests(output_dir) if entry['worker'] == worker_index]
+    shard_index = max([entry['index'] + 1 for entry in own_entries] or [0])
+    todo = [str(random_seed) for i, random_seed in enumerate(seeds)
+            if i % worker_count == worker_index and str(random_seed) not in done]
+    print("Dataset worker %d/%d: %d ships to generate into %s" % (
+        worker_index, worker_count, len(todo), output_dir))
+
+    # One shard waiting to be saved at most, so memory use stays bounded
+    pending = queue.Queue(maxsize=1)
+    entries = []
+    errors = []
+
+    def saver():
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            try:
+                entries.append(save_shard(output_dir, worker_index, *item, params, compress))
+            except Exception as error:
+                errors.append(error)
+
+    thread = threading.Thread(target=saver, daemon=True)
+    thread.start()
+    start = time.perf_counter()
+    records = []
+    try:
+        for count, random_seed in enumerate(todo, 1):
+            obj = spaceship_generator.generate_spaceship(random_seed, **params)
+            try:
+                records.append(ship_record(obj, random_seed))
+            finally:
+                spaceship_generator.reset_scene()
+            if len(records) == ships_per_shard or count == len(todo):
+                if errors:
+                    raise errors[0]
+                pending.put((shard_index, records))
+                shard_index += 1
+                records = []
+                print("%d/%d ships, %.1f ships/s" % (
+                    count, len(todo), count / (time.perf_counter() - start)))
+    finally:
+        pending.put(None)
+        thread.join()
+    if errors:
+        raise errors[0]
+    return entries
+
+
+def launch_workers(count, output_dir, seed_count, blender='blender', extra_args=()):
+    '''Start background Blender processes writing one dataset together.
+    Returns:
+        processes: list of subprocess.Popen.
+    '''
+    processes = []
+    for i in range(count):
+        args = [blender, '-b', '--python', os.path.abspath(__file__), '--',
+                '--output', output_dir,
+                '--count', str(seed_count),
+                '--worker', str(i),
+                '--workers', str(count)]
+        processes.append(subprocess.Popen(args + list(extra_args)))
+    return processes
+
+
+if __name__ == "__main__":
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    parser = argparse.ArgumentParser(description="Write a sharded spaceship dataset")
+    parser.add_argument('--output', required=True, help="dataset directory")
+    parser.add_argument('--start', type=int, default=0, help="first seed")
+    parser.add_argument('--count', type=int, default=1000, help="number of seeds")
+    parser.add_argument('--worker', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--shard-size', type=int, default=256, help="ships per shard")
+    parser.add_argument('--compress', action='store_true')
+    parser.add_argument('--params', default='{}', help="generate_spaceship keyword arguments as JSON")
+    args = parser.parse_args(argv)
+    write_dataset(args.output,
+                  range(args.start, args.start + args.count),
+                  args.worker,
+                  args.workers,
+                  args.shard_size,
+                  args.compress,
+                  **json.loads(args.params))
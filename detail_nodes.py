@@ -0,0 +1,405 @@
+# Geometry Nodes backend for the face detail stage.
+# With generate_spaceship(node_detail=True) Python only categorizes the hull
+# faces, writing the 'detail' (spaceship_generator.Detail) and 'detail_seed'
+# face attributes. A 'Detail' modifier running the shared node group built
+# here then adds the exhausts, grids, antennas, turrets, spheres, discs and
+# cylinders in Blender's own evaluator, so the modifier's Density and Seed
+# inputs can be changed live without generating the ship again.
+#
+#   blender -b --python detail_nodes.py -- <number of seeds>
+#
+# benchmarks the node backend against the bmesh one.
+
+import sys
+import time
+from math import radians
+import bpy
+from add_mesh_SpaceshipGenerator.spaceship_generator import Detail, Material
+
+NODE_GROUP_NAME = 'Spaceship Detail'
+
+# Material inputs of the node group, in Material order
+MATERIAL_INPUTS = ('Hull', 'Hull Lights', 'Hull Dark', 'Exhaust Burn', 'Glow Disc')
+
+# Each detail with the way the plain hull faces it can spread to face and
+# its share of categorize_faces' wheel for those faces. Above Density 1 that
+# share of the plain faces gets the detail per unit of Density over 1.
+DETAIL_SHARES = {Detail.grid: (None, 0.2),
+                 Detail.exhaust: ('-X', 0.25),
+                 Detail.antenna: ('+Z', 0.3),
+                 Detail.weapon: ('Y', 0.25),
+                 Detail.sphere: ('Y', 0.2),
+                 Detail.disc: ('-Z', 0.25),
+                 Detail.cylinder: ('+Z', 0.3)}
+
+
+def socket(sockets, name):
+    '''Get the enabled socket called name.
+    Nodes such as Compare and Random Value have one socket per data type with
+    the same name, only the one for the current data type is enabled.
+    '''
+    for item in sockets:
+        if item.name == name and item.enabled:
+            return item
+    raise KeyError(name)
+
+
+def add_node(group, node_type, inputs=None, **properties):
+    '''Add a node to a node group.
+    Args:
+        group: node group.
+        node_type (str): node type, e.g. 'GeometryNodeExtrudeMesh'.
+        inputs (dict): input socket name to default value or output socket to link.
+        properties: node properties to set before connecting, e.g. mode='FACES'.
+    Returns:
+        node: the new node.
+    '''
+    node = group.nodes.new(node_type)
+    for name, value in properties.items():
+        setattr(node, name, value)
+    for name, value in (inputs or {}).items():
+        if isinstance(value, bpy.types.NodeSocket):
+            group.links.new(value, socket(node.inputs, name))
+        else:
+            socket(node.inputs, name).default_value = value
+    return node
+
+
+def output(node, name=None):
+    '''Get an output socket of a node, the first enabled one by default.'''
+    if name is None:
+        return next(item for item in node.outputs if item.enabled)
+    return socket(node.outputs, name)
+
+
+def math_node(group, operation, a, b=None, node_type='ShaderNodeMath'):
+    '''Add a float (or with node_type='FunctionNodeBooleanMath', boolean) math
+    node on values or sockets and get its output.'''
+    node = add_node(group, node_type, operation=operation)
+    values = (a,) if b is None else (a, b)
+    for item, value in zip([item for item in node.inputs if item.enabled], values):
+        if isinstance(value, bpy.types.NodeSocket):
+            group.links.new(value, item)
+        else:
+            item.default_value = value
+    return output(node)
+
+
+def named_attribute(group, name, data_type):
+    '''Read a named attribute as a field.'''
+    return output(add_node(group, 'GeometryNodeInputNamedAttribute', {'Name': name}, data_type=data_type),
+                  'Attribute')
+
+
+def random_value(group, data_type, seed, **inputs):
+    '''Get a random value field, e.g. random_value(group, 'FLOAT', seed, Min=0, Max=1).'''
+    return output(add_node(group, 'FunctionNodeRandomValue', dict(inputs, Seed=seed), data_type=data_type))
+
+
+def is_detail(group, detail):
+    '''Get a boolean field selecting the faces labelled with detail.'''
+    compare = add_node(group, 'FunctionNodeCompare', data_type='INT', operation='EQUAL')
+    group.links.new(named_attribute(group, 'detail', 'INT'), socket(compare.inputs, 'A'))
+    socket(compare.inputs, 'B').default_value = int(detail)
+    return output(compare, 'Result')
+
+
+def facing(group, normal, direction):
+    '''Get a boolean field selecting the faces whose normal points along
+    direction, e.g. '-X' or '+Z', or 'Y' for either way along Y.'''
+    component = output(add_node(group, 'ShaderNodeSeparateXYZ', {'Vector': normal}), direction[-1])
+    if direction.startswith('-'):
+        component = math_node(group, 'MULTIPLY', component, -1.0)
+    elif not direction.startswith('+'):
+        component = math_node(group, 'ABSOLUTE', component)
+    compare = add_node(group, 'FunctionNodeCompare', data_type='FLOAT', operation='GREATER_THAN')
+    group.links.new(component, socket(compare.inputs, 'A'))
+    socket(compare.inputs, 'B').default_value = 0.9
+    return output(compare, 'Result')
+
+
+def set_material(group, geometry, material, selection=None):
+    '''Assign a group material input to (a selection of) geometry.'''
+    inputs = {'Geometry': geometry, 'Material': material}
+    if selection is not None:
+        inputs['Selection'] = selection
+    return output(add_node(group, 'GeometryNodeSetMaterial', inputs), 'Geometry')
+
+
+def instance_on_points(group, points, instance, rotation, scale):
+    '''Instance a mesh on points and get the instances.'''
+    return output(add_node(group, 'GeometryNodeInstanceOnPoints',
+                           {'Points': points, 'Instance': instance, 'Rotation': rotation, 'Scale': scale}),
+                  'Instances')
+
+
+def transform(group, geometry, translation=(0, 0, 0), rotation=(0, 0, 0), scale=(1, 1, 1)):
+    '''Transform geometry by constant values.'''
+    return output(add_node(group, 'GeometryNodeTransform',
+                           {'Geometry': geometry, 'Translation': translation,
+                            'Rotation': rotation, 'Scale': scale}),
+                  'Geometry')
+
+
+def build_detail_node_group():
+    '''Build the detail node group, or get it if it already exists.
+    Inputs: Geometry (hull with 'detail' and 'detail_seed' face attributes),
+    Density (0 to 4, 1 is roughly the bmesh backend), Seed and one material
+    per Material. The added detail isn't recorded as features.
+    Returns:
+        group: the GeometryNodeTree.
+    '''
+    group = bpy.data.node_groups.get(NODE_GROUP_NAME)
+    if group is not None:
+        return group
+    group = bpy.data.node_groups.new(NODE_GROUP_NAME, 'GeometryNodeTree')
+    group.is_modifier = True
+    interface = group.interface
+    interface.new_socket('Geometry', in_out='INPUT', socket_type='NodeSocketGeometry')
+    density_input = interface.new_socket('Density', in_out='INPUT', socket_type='NodeSocketFloat')
+    density_input.default_value = 1.0
+    density_input.min_value = 0.0
+    density_input.max_value = 4.0
+    interface.new_socket('Seed', in_out='INPUT', socket_type='NodeSocketInt')
+    for name in MATERIAL_INPUTS:
+        interface.new_socket(name, in_out='INPUT', socket_type='NodeSocketMaterial')
+    interface.new_socket('Geometry', in_out='OUTPUT', socket_type='NodeSocketGeometry')
+
+    group_input = group.nodes.new('NodeGroupInput')
+    group_output = group.nodes.new('NodeGroupOutput')
+    density = output(group_input, 'Density')
+    seed = output(group_input, 'Seed')
+    materials = {material: output(group_input, name) for material, name in zip(Material, MATERIAL_INPUTS)}
+    face_seed = named_attribute(group, 'detail_seed', 'INT')
+
+    def chosen(detail):
+        # Faces of a category, thinned out when Density is below 1. Above 1
+        # plain faces are added too, as categorize_faces would have picked
+        # them, see DETAIL_SHARES.
+        keep = random_value(group, 'BOOLEAN', seed, Probability=density, ID=face_seed)
+        selection = math_node(group, 'AND', is_detail(group, detail), keep, 'FunctionNodeBooleanMath')
+        direction, share = DETAIL_SHARES[detail]
+        probability = math_node(group, 'MAXIMUM', math_node(group, 'MULTIPLY',
+                                                            math_node(group, 'SUBTRACT', density, 1.0), share), 0.0)
+        # Plain faces have no detail_seed, their index tells them apart
+        extra = random_value(group, 'BOOLEAN', math_node(group, 'ADD', seed, float(detail)),
+                             Probability=probability)
+        plain = math_node(group, 'AND', is_detail(group, Detail.hull), extra, 'FunctionNodeBooleanMath')
+        if direction is not None:
+            plain = math_node(group, 'AND', plain, facing(group, face_normal, direction), 'FunctionNodeBooleanMath')
+        return math_node(group, 'OR', selection, plain, 'FunctionNodeBooleanMath')
+
+    # Remember the face size and normal, they are needed after the faces are
+    # turned into points
+    size = math_node(group, 'SQRT', output(add_node(group, 'GeometryNodeInputMeshFaceArea'), 'Area'))
+    hull = output(add_node(group, 'GeometryNodeStoreNamedAttribute',
+                           {'Geometry': output(group_input, 'Geometry'), 'Name': 'detail_size', 'Value': size},
+                           data_type='FLOAT', domain='FACE'), 'Geometry')
+    hull = output(add_node(group, 'GeometryNodeStoreNamedAttribute',
+                           {'Geometry': hull, 'Name': 'detail_normal',
+                            'Value': output(add_node(group, 'GeometryNodeInputNormal'), 'Normal')},
+                           data_type='FLOAT_VECTOR', domain='FACE'), 'Geometry')
+    face_size = named_attribute(group, 'detail_size', 'FLOAT')
+    face_normal = named_attribute(group, 'detail_normal', 'FLOAT_VECTOR')
+    results = []
+
+    # Grids: subdivide and extrude every cell by a random amount
+    split = add_node(group, 'GeometryNodeSeparateGeometry',
+                     {'Geometry': hull, 'Selection': chosen(Detail.grid)}, domain='FACE')
+    grid = output(add_node(group, 'GeometryNodeSubdivideMesh',
+                           {'Mesh': output(split, 'Selection'), 'Level': 2}), 'Mesh')
+    cell_height = math_node(group, 'MULTIPLY', face_size,
+                       random_value(group, 'FLOAT', seed, Min=0.02, Max=0.15, ID=face_seed))
+    cells = add_node(group, 'GeometryNodeExtrudeMesh',
+                     {'Mesh': grid, 'Offset Scale': cell_height, 'Individual': True}, mode='FACES')
+    grid = set_material(group, output(cells, 'Mesh'), materials[Material.hull])
+    lights = random_value(group, 'BOOLEAN', seed, Probability=0.5)
+    results.append(set_material(group, grid, materials[Material.hull_lights],
+                                math_node(group, 'AND', output(cells, 'Top'), lights, 'FunctionNodeBooleanMath')))
+    rest = output(split, 'Inverted')
+
+    # Exhausts: a short extrusion with a burning inset nozzle
+    split = add_node(group, 'GeometryNodeSeparateGeometry',
+                     {'Geometry': rest, 'Selection': chosen(Detail.exhaust)}, domain='FACE')
+    rim = add_node(group, 'GeometryNodeExtrudeMesh',
+                   {'Mesh': output(split, 'Selection'), 'Offset Scale': math_node(group, 'MULTIPLY', face_size, 0.1)},
+                   mode='FACES')
+    nozzle = add_node(group, 'GeometryNodeScaleElements',
+                      {'Geometry': output(rim, 'Mesh'), 'Selection': output(rim, 'Top'), 'Scale': 0.75},
+                      domain='FACE')
+    burn = add_node(group, 'GeometryNodeExtrudeMesh',
+                    {'Mesh': output(nozzle, 'Geometry'), 'Selection': output(rim, 'Top'),
+                     'Offset Scale': math_node(group, 'MULTIPLY', face_size, -0.3)},
+                    mode='FACES')
+    results.append(set_material(group, output(burn, 'Mesh'), materials[Material.exhaust_burn],
+                                output(burn, 'Top')))
+    rest = output(split, 'Inverted')
+
+    # The split off faces were cut loose from the hull, weld them back on
+    hull_parts = add_node(group, 'GeometryNodeJoinGeometry')
+    for result in [rest] + results:
+        group.links.new(result, hull_parts.inputs[0])
+    weld = add_node(group, 'GeometryNodeMergeByDistance',
+                    {'Geometry': output(hull_parts, 'Geometry'), 'Distance': 0.0001}, mode='ALL')
+    results = [output(weld, 'Geometry')]
+
+    # Everything else is instanced on points of the remaining hull faces
+    align = add_node(group, 'FunctionNodeAlignEulerToVector', {'Vector': face_normal}, axis='Z')
+    center_rotation = output(align, 'Rotation')
+
+    def face_centers(detail):
+        return output(add_node(group, 'GeometryNodeMeshToPoints',
+                               {'Mesh': rest, 'Selection': chosen(detail)}, mode='FACES'), 'Points')
+
+    def scattered(detail, per_face):
+        # About per_face points on each chosen face whatever its size
+        area = math_node(group, 'MULTIPLY', face_size, face_size)
+        points = add_node(group, 'GeometryNodeDistributePointsOnFaces',
+                          {'Mesh': rest, 'Selection': chosen(detail),
+                           'Density': math_node(group, 'DIVIDE', per_face, area), 'Seed': seed},
+                          distribute_method='RANDOM')
+        return output(points, 'Points'), output(points, 'Rotation')
+
+    # Spheres
+    sphere = output(add_node(group, 'GeometryNodeMeshIcoSphere', {'Radius': 0.35, 'Subdivisions': 2}), 'Mesh')
+    sphere = set_material(group, sphere, materials[Material.hull])
+    scale = math_node(group, 'MULTIPLY', face_size, random_value(group, 'FLOAT', seed, Min=0.6, Max=1.0))
+    results.append(instance_on_points(group, face_centers(Detail.sphere), sphere, center_rotation, scale))
+
+    # Glowing discs
+    disc = add_node(group, 'GeometryNodeMeshCone',
+                    {'Vertices': 32, 'Radius Top': 0.5, 'Radius Bottom': 0.375, 'Depth': 0.125},
+                    fill_type='NGON')
+    disc_mesh = set_material(group, output(disc, 'Mesh'), materials[Material.hull])
+    disc_mesh = set_material(group, disc_mesh, materials[Material.glow_disc], output(disc, 'Top'))
+    disc_mesh = transform(group, disc_mesh, translation=(0, 0, 0.0625))
+    results.append(instance_on_points(group, face_centers(Detail.disc), disc_mesh, center_rotation, face_size))
+
+    # Surface antennas
+    antenna = output(add_node(group, 'GeometryNodeMeshCone',
+                              {'Vertices': 4, 'Radius Top': 0.0, 'Radius Bottom': 0.02, 'Depth': 0.6}), 'Mesh')
+    antenna = set_material(group, transform(group, antenna, translation=(0, 0, 0.3)), materials[Material.hull_dark])
+    points, rotation = scattered(Detail.antenna, 6)
+    scale = math_node(group, 'MULTIPLY', face_size, random_value(group, 'FLOAT', seed, Min=0.1, Max=1.5))
+    results.append(instance_on_points(group, points, antenna, rotation, scale))
+
+    # Turrets: a foundation with a barrel
+    foundation = output(add_node(group, 'GeometryNodeMeshCone',
+                                 {'Vertices': 12, 'Radius Top': 0.1, 'Radius Bottom': 0.09, 'Depth': 0.05},
+                                 fill_type='NGON'), 'Mesh')
+    barrel = output(add_node(group, 'GeometryNodeMeshCylinder',
+                             {'Vertices': 8, 'Radius': 0.015, 'Depth': 0.3}, fill_type='NGON'), 'Mesh')
+    barrel = transform(group, barrel, translation=(0.15, 0, 0.06), rotation=(0, radians(90), 0))
+    turret = add_node(group, 'GeometryNodeJoinGeometry')
+    group.links.new(foundation, turret.inputs[0])
+    group.links.new(barrel, turret.inputs[0])
+    turret = set_material(group, output(turret, 'Geometry'), materials[Material.hull])
+    points, rotation = scattered(Detail.weapon, 2)
+    scale = math_node(group, 'MULTIPLY', face_size, random_value(group, 'FLOAT', seed, Min=0.8, Max=1.2))
+    results.append(instance_on_points(group, points, turret, rotation, scale))
+
+    # Cylinders lying on the face
+    cylinder = output(add_node(group, 'GeometryNodeMeshCylinder',
+                               {'Vertices': 8, 'Radius': 0.06, 'Depth': 0.25}, fill_type='NGON'), 'Mesh')
+    cylinder = transform(group, cylinder, translation=(0, 0, 0.03), rotation=(radians(90), 0, 0))
+    cylinder = set_material(group, cylinder, materials[Material.hull])
+    points, rotation = scattered(Detail.cylinder, 8)
+    results.append(instance_on_points(group, points, cylinder, rotation, face_size))
+
+    join = add_node(group, 'GeometryNodeJoinGeometry')
+    for result in results:
+        group.links.new(result, join.inputs[0])
+    realize = add_node(group, 'GeometryNodeRealizeInstances', {'Geometry': output(join, 'Geometry')})
+    group.links.new(output(realize, 'Geometry'), group_output.inputs[0])
+    return group
+
+
+def input_identifiers(group):
+    '''Map the group input names to the identifiers used as modifier keys.'''
+    return {item.name: item.identifier for item in group.interface.items_tree
+            if item.item_type == 'SOCKET' and item.in_out == 'INPUT'}
+
+
+def add_detail_modifier(obj, seed=0, density=1.0):
+    '''Add a 'Detail' modifier running the detail node group to a spaceship.
+    Returns:
+        modifier: the new modifier.
+    '''
+    modifier = obj.modifiers.new('Detail', 'NODES')
+    modifier.node_group = build_detail_node_group()
+    identifiers = input_identifiers(modifier.node_group)
+    modifier[identifiers['Seed']] = seed
+    modifier[identifiers['Density']] = density
+    return modifier
+
+
+def set_detail_materials(obj, materials):
+    '''Set the material inputs of a spaceship's Detail modifier.
+    Args:
+        obj: spaceship with a Detail modifier.
+        materials: materials in Material order, e.g. from create_materials.
+    '''
+    modifier = obj.modifiers['Detail']
+    identifiers = input_identifiers(modifier.node_group)
+    for name, material in zip(MATERIAL_INPUTS, materials):
+        modifier[identifiers[name]] = material
+
+
+def set_detail_density(obj, density):
+    '''Change the detail density of a spaceship live, without regenerating it.'''
+    modifier = obj.modifiers['Detail']
+    modifier[input_identifiers(modifier.node_group)['Density']] = density
+    obj.update_tag()
+
+
+def evaluated_polygons(obj):
+    '''Evaluate a spaceship's modifiers.
+    Returns:
+        count: number of polygons of the evaluated mesh.
+    '''
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    depsgraph.update()
+    return len(obj.evaluated_get(depsgraph).data.polygons)
+
+
+def benchmark_detail_backends(seeds, **params):
+    '''Time generating and evaluating spaceships with both detail backends.
+    The node backend is also timed re-evaluating after a density change,
+    which is all a live density edit costs.
+    Args:
+        seeds: seeds to generate.
+        params: extra keyword arguments for generate_spaceship.
+    Returns:
+        report: dict of backend to the mean 'seconds' and 'polygons' per ship,
+            plus 'density_change_seconds' for the node backend.
+    '''
+    from add_mesh_SpaceshipGenerator import spaceship_generator
+    seeds = list(seeds)
+    report = {}
+    for backend, node_detail in (('bmesh', False), ('nodes', True)):
+        seconds = 0.0
+        polygons = 0
+        density_seconds = 0.0
+        for random_seed in seeds:
+            start = time.perf_counter()
+            obj = spaceship_generator.generate_spaceship(random_seed, node_detail=node_detail, **params)
+            polygons += evaluated_polygons(obj)
+            seconds += time.perf_counter() - start
+            if node_detail:
+                start = time.perf_counter()
+                set_detail_density(obj, 2.0)
+                evaluated_polygons(obj)
+                density_seconds += time.perf_counter() - start
+            spaceship_generator.reset_scene()
+        count = float(max(1, len(seeds)))
+        report[backend] = {'seconds': seconds / count, 'polygons': polygons / count}
+        if node_detail:
+            report[backend]['density_change_seconds'] = density_seconds / count
+        print("%s: %.3f s/ship, %d polygons/ship" % (backend, seconds / count, polygons / count))
+    print("nodes density change: %.3f s/ship" % report['nodes']['density_change_seconds'])
+    return report
+
+
+if __name__ == "__main__":
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    benchmark_detail_backends(str(i) for i in range(int(argv[0]) if argv else 10))
@@ -0,0 +1,169 @@
+# Geometry fingerprints for generated spaceships.
+# exact_hash detects bit identical meshes (e.g. to confirm an optimized path
+# builds the same ship), shape_signature detects near identical ones (e.g. to
+# dedupe a fleet where different seeds gave practically the same ship).
+# Both work on plain numpy buffers, so they can also be run over .ship files
+# in a cache without Blender.
+
+import hashlib
+import numpy as np
+
+# Number of radial distance bins in the shape signature
+RADIAL_BINS = 8
+# Number of material slots counted in the shape signature
+MATERIAL_BINS = 8
+
+
+def mesh_buffers(obj):
+    '''Read the buffers of a mesh object (without modifiers) into numpy.
+    Args:
+        obj: mesh object, e.g. from generate_spaceship.
+    Returns:
+        buffers: dict with 'positions' (N, 3) float32, 'face_verts' (L,) int32,
+            'face_sizes' (F,) int32, 'materials' (F,) int32 and 'areas' (F,) float32.
+    '''
+    mesh = obj.data
+    positions = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get('co', positions)
+    face_verts = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.polygons.foreach_get('vertices', face_verts)
+    face_sizes = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get('loop_total', face_sizes)
+    materials = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get('material_index', materials)
+    areas = np.empty(len(mesh.polygons), dtype=np.float32)
+    mesh.polygons.foreach_get('area', areas)
+    return {'positions': positions.reshape(-1, 3),
+            'face_verts': face_verts,
+            'face_sizes': face_sizes,
+            'materials': materials,
+            'areas': areas}
+
+
+def ship_buffers(ship):
+    '''Get fingerprint buffers from a ship read with ship_format.read_ship.'''
+    from add_mesh_SpaceshipGenerator import ship_format
+    positions = ship_format.dequantize_positions(ship)
+    triangles = positions[ship['indices'].astype(np.int64)]
+    areas = 0.5 * np.linalg.norm(np.cross(triangles[:, 1] - triangles[:, 0],
+                                          triangles[:, 2] - triangles[:, 0]), axis=1)
+    return {'positions': positions,
+            'face_verts': ship['indices'].reshape(-1).astype(np.int32),
+            'face_sizes': np.full(len(ship['indices']), 3, dtype=np.int32),
+            'materials': ship['materials'].astype(np.int32),
+            'areas': areas.astype(np.float32)}
+
+
+def exact_hash(buffers):
+    '''Hash the geometry buffers, equal only for bit identical meshes.
+    Args:
+        buffers: dict from mesh_buffers or ship_buffers.
+    Returns:
+        digest (str): hex digest.
+    '''
+    digest = hashlib.blake2b(digest_size=16)
+    for name in ('positions', 'face_verts', 'face_sizes', 'materials'):
+        array = np.ascontiguousarray(buffers[name])
+        digest.update(name.encode('ascii'))
+        digest.update(np.int64(array.size).tobytes())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def shape_signature(buffers):
+    '''Summarize the shape of a mesh in a small float vector that changes
+    little for small changes to the mesh.
+    Contains the bounding box size, the centroid offset within the bounds,
+    the principal extents, a radial distance histogram, the area weighted
+    material histogram and the log2 vertex and face counts.
+    Args:
+        buffers: dict from mesh_buffers or ship_buffers.
+    Returns:
+        signature: float32 array.
+    '''
+    positions = buffers['positions'].astype(np.float64)
+    if not len(positions):
+        return np.zeros(3 + 3 + 3 + RADIAL_BINS + MATERIAL_BINS + 2, dtype=np.float32)
+    bounds_min = positions.min(axis=0)
+    bounds_max = positions.max(axis=0)
+    size = bounds_max - bounds_min
+    scale = max(size.max(), 1e-9)
+    centroid = positions.mean(axis=0)
+    centroid_offset = (centroid - (bounds_min + bounds_max) * 0.5) / scale
+
+    centered = positions - centroid
+    extents = np.sqrt(np.maximum(np.linalg.eigvalsh(centered.T @ centered / len(positions)), 0))[::-1]
+
+    distances = np.linalg.norm(centered, axis=1)
+    radial, _ = np.histogram(distances / max(distances.max(), 1e-9), bins=RADIAL_BINS, range=(0, 1))
+    radial = radial / float(len(positions))
+
+    areas = buffers['areas'].astype(np.float64)
+    materials = np.clip(buffers['materials'], 0, MATERIAL_BINS - 1)
+    material_histogram = np.bincount(materials, weights=areas, minlength=MATERIAL_BINS)
+    material_histogram = material_histogram / max(areas.sum(), 1e-9)
+
+    counts = np.log2([len(positions) + 1, len(buffers['face_sizes']) + 1])
+    return np.concatenate((size, centroid_offset, extents / scale, radial,
+                           material_histogram, counts)).astype(np.float32)
+
+
+def signature_distance(a, b):
+    '''Largest difference between two shape signatures, relative to the larger
+    value of each element, in 0-1.'''
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    scale = np.maximum(np.maximum(np.abs(a), np.abs(b)), 1e-3)
+    return float((np.abs(a - b) / scale).max())
+
+
+def signature_key(signature, resolution=0.05):
+    '''Quantize a shape signature into a string usable as a dict key.
+    Near identical ships usually share a key, use signature_distance to
+    confirm matches close to a quantization boundary.
+    Args:
+        signature: array from shape_signature.
+        resolution (float): relative quantization step.
+    Returns:
+        key (str)
+    '''
+    signature = np.asarray(signature, dtype=np.float64)
+    steps = np.sign(signature) * np.floor(np.log1p(np.abs(signature) / resolution) / np.log1p(1.0))
+    return ','.join('%d' % step for step in steps)
+
+
+def fingerprint(obj_or_buffers):
+    '''Fingerprint a mesh object or a buffers dict.
+    Returns:
+        fingerprint: dict with 'exact', 'signature' and 'key'.
+    '''
+    buffers = obj_or_buffers if isinstance(obj_or_buffers, dict) else mesh_buffers(obj_or_buffers)
+    signature = shape_signature(buffers)
+    return {'exact': exact_hash(buffers),
+            'signature': signature,
+            'key': signature_key(signature)}
+
+
+def find_duplicates(fingerprints, tolerance=0.02):
+    '''Group near identical ships.
+    Args:
+        fingerprints: dict of name (e.g. seed) to fingerprint.
+        tolerance (float): largest signature_distance counted as a duplicate.
+    Returns:
+        groups: list of lists of names, each with more than one ship.
+    '''
+    buckets = {}
+    for name, item in fingerprints.items():
+        buckets.setdefault(item['key'], []).append(name)
+    groups = []
+    for names in buckets.values():
+        while len(names) > 1:
+            first = fingerprints[names[0]]
+            group = [name for name in names
+                     if name == names[0] or
+                     first['exact'] == fingerprints[name]['exact'] or
+                     signature_distance(first['signature'], fingerprints[name]['signature']) <= tolerance]
+            if len(group) > 1:
+                groups.append(group)
+            names = [name for name in names if name not in group]
+    return groups
@@ -0,0 +1,316 @@
+# Fleet layout with merged batches.
+# Large fleets are slow to draw and export mostly because of per object
+# overhead: one object, modifier stack and material set per ship. Here ships
+# are generated one at a time, their evaluated meshes baked into a few
+# 'Spaceship Fleet <n>' batch meshes holding many ships each, and the ship
+# itself removed again. Each batch has a 'ship_id' face attribute, and the
+# seed and 4x4 transform of every ship as 'ship_seeds' and 'ship_transforms'
+# custom properties, so split_ship can get any ship back as its own object.
+# Every ship keeps its own materials: the batch has the material slots of all
+# its ships, and 'ship_material_slots' records which are whose.
+#
+#   blender -b --python fleet.py -- <number of ships>
+#
+# benchmarks exporting a fleet of separate ships against merged batches.
+
+import os
+import sys
+import tempfile
+import time
+from math import ceil, sqrt
+import bpy
+import numpy as np
+from mathutils import Matrix, Vector
+from add_mesh_SpaceshipGenerator import spaceship_generator
+
+
+def grid_layout(count, spacing=12.0):
+    '''Lay ships out on a square grid on the XY plane.
+    Returns:
+        transforms: list of 4x4 Matrix, one per ship.
+    '''
+    columns = max(1, ceil(sqrt(count)))
+    return [Matrix.Translation(Vector(((i % columns) * spacing, (i // columns) * spacing, 0)))
+            for i in range(count)]
+
+
+def ship_arrays(obj):
+    '''Read the evaluated mesh (with modifiers) of a ship into numpy.
+    Returns:
+        arrays: dict with 'positions' (V, 3) float32, 'loop_verts' (L,) int32,
+            'loop_starts' (F,) int32, 'materials' (F,) int32 and the
+            'slot_materials' list of the ship.
+    '''
+    source = obj.evaluated_get(bpy.context.evaluated_depsgraph_get())
+    mesh = source.to_mesh()
+    try:
+        positions = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        mesh.vertices.foreach_get('co', positions)
+        loop_verts = np.empty(len(mesh.loops), dtype=np.int32)
+        mesh.loops.foreach_get('vertex_index', loop_verts)
+        loop_starts = np.empty(len(mesh.polygons), dtype=np.int32)
+        mesh.polygons.foreach_get('loop_start', loop_starts)
+        materials = np.empty(len(mesh.polygons), dtype=np.int32)
+        mesh.polygons.foreach_get('material_index', materials)
+    finally:
+        source.to_mesh_clear()
+    return {'positions': positions.reshape(-1, 3),
+            'loop_verts': loop_verts,
+            'loop_starts': loop_starts,
+            'materials': materials,
+            'slot_materials': list(obj.data.materials)}
+
+
+def transform_positions(positions, matrix):
+    '''Apply a 4x4 Matrix to (N, 3) positions.'''
+    matrix = np.array(matrix, dtype=np.float64)
+    return (positions @ matrix[:3, :3].T + matrix[:3, 3]).astype(np.float32)
+
+
+def build_mesh(name, positions, loop_verts, loop_starts, materials):
+    '''Create a mesh datablock from flat numpy buffers.'''
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(len(positions))
+    mesh.vertices.foreach_set('co', positions.reshape(-1))
+    mesh.loops.add(len(loop_verts))
+    mesh.loops.foreach_set('vertex_index', loop_verts)
+    mesh.polygons.add(len(loop_starts))
+    mesh.polygons.foreach_set('loop_start', loop_starts)
+    mesh.polygons.foreach_set('material_index', materials)
+    mesh.update(calc_edges=True)
+    return mesh
+
+
+def build_batch(name, ships):
+    '''Merge ship arrays into one batch object.
+    Each ship's materials go into the batch's material slots, once for
+    materials ships share, and its faces are moved onto those slots.
+    Args:
+        name (str): name of the batch object and mesh.
+        ships: list of (ship_id, seed, transform, arrays) with arrays from ship_arrays.
+    Returns:
+        obj: the batch object, linked to the current collection.
+    '''
+    positions = []
+    loop_verts = []
+    loop_starts = []
+    face_materials = []
+    face_ids = []
+    materials = []
+    material_slots = {}
+    ship_slots = []
+    vertex_offset = 0
+    loop_offset = 0
+    for ship_id, random_seed, transform, arrays in ships:
+        slots = []
+        for material in arrays['slot_materials']:
+            if material not in material_slots:
+                material_slots[material] = len(materials)
+                materials.append(material)
+            slots.append(material_slots[material])
+        ship_slots.append(slots)
+        positions.append(transform_positions(arrays['positions'], transform))
+        loop_verts.append(arrays['loop_verts'] + vertex_offset)
+        loop_starts.append(arrays['loop_starts'] + loop_offset)
+        face_materials.append(np.array(slots, dtype=np.int32)[arrays['materials']] if slots
+                              else arrays['materials'])
+        face_ids.append(np.full(len(arrays['loop_starts']), ship_id, dtype=np.int32))
+        vertex_offset += len(arrays['positions'])
+        loop_offset += len(arrays['loop_verts'])
+
+    mesh = build_mesh(name,
+                      np.concatenate(positions),
+                      np.concatenate(loop_verts),
+                      np.concatenate(loop_starts),
+                      np.concatenate(face_materials))
+    mesh.attributes.new('ship_id', 'INT', 'FACE').data.foreach_set('value', np.concatenate(face_ids))
+    for material in materials:
+        mesh.materials.append(material)
+
+    obj = bpy.data.objects.new(name, mesh)
+    bpy.context.collection.objects.link(obj)
+    obj['ship_ids'] = [ship_id for ship_id, _, _, _ in ships]
+    obj['ship_seeds'] = [str(random_seed) for _, random_seed, _, _ in ships]
+    obj['ship_transforms'] = [value for _, _, transform, _ in ships
+                              for row in transform for value in row]
+    obj['ship_material_slots'] = [slot for slots in ship_slots for slot in slots]
+    obj['ship_material_counts'] = [len(slots) for slots in ship_slots]
+    return obj
+
+
+def remove_ship(obj):
+    '''Remove a generated ship with its children and meshes, but not its materials.'''
+    spaceship_generator.remove_spaceship(obj, remove_materials=False)
+
+
+def remove_unused_materials():
+    '''Remove the materials made by create_materials that no object uses anymore.'''
+    for material in bpy.data.materials[:]:
+        if 'spaceship_material' in material and not material.users:
+            bpy.data.materials.remove(material)
+
+
+def merge_ships(objects, transforms=None, ships_per_batch=256, seeds=None):
+    '''Merge existing ships into batches and remove the ships.
+    Args:
+        objects: spaceship objects.
+        transforms: a 4x4 Matrix per ship, their matrix_world by default.
+        ships_per_batch (int): number of ships per batch.
+        seeds: seed per ship to record, the object names by default.
+    Returns:
+        batches: list of batch objects.
+    '''
+    objects = list(objects)
+    transforms = transforms or [obj.matrix_world.copy() for obj in objects]
+    seeds = seeds or [obj.name for obj in objects]
+    batches = []
+    for start in range(0, len(objects), ships_per_batch):
+        chunk = range(start, min(start + ships_per_batch, len(objects)))
+        ships = [(i, seeds[i], transforms[i], ship_arrays(objects[i])) for i in chunk]
+        batches.append(build_batch('Spaceship Fleet %d' % len(batches), ships))
+        for i in chunk:
+            remove_ship(objects[i])
+    remove_unused_materials()
+    return batches
+
+
+def generate_fleet(seeds, transforms=None, ships_per_batch=256, **params):
+    '''Generate a fleet straight into merged batches.
+    Ships are generated one at a time and removed once read, so only one ship
+    object exists at any time.
+    Args:
+        seeds: seed per ship.
+        transforms: a 4x4 Matrix per ship, grid_layout by default.
+        ships_per_batch (int): number of ships per batch.
+        params: extra keyword arguments for generate_spaceship.
+    Returns:
+        batches: list of batch objects.
+    '''
+    seeds = list(seeds)
+    transforms = transforms or grid_layout(len(seeds))
+    batches = []
+    ships = []
+    for ship_id, random_seed in enumerate(seeds):
+        obj = spaceship_generator.generate_spaceship(random_seed, **params)
+        ships.append((ship_id, random_seed, transforms[ship_id], ship_arrays(obj)))
+        remove_ship(obj)
+        if len(ships) == ships_per_batch or ship_id == len(seeds) - 1:
+            batches.append(build_batch('Spaceship Fleet %d' % len(batches), ships))
+            ships = []
+            remove_unused_materials()
+    return batches
+
+
+def split_ship(batch, ship_id):
+    '''Copy one ship out of a batch into its own object.
+    Args:
+        batch: batch object from generate_fleet or merge_ships.
+        ship_id (int): id of the ship in the batch.
+    Returns:
+        obj: new 'Spaceship' object with the ship's mesh in its local space
+            and its transform as matrix_world, or None if it isn't in the batch.
+    '''
+    ship_ids = list(batch['ship_ids'])
+    if ship_id not in ship_ids:
+        return None
+    index = ship_ids.index(ship_id)
+    transform = Matrix([batch['ship_transforms'][index * 16 + row * 4:index * 16 + row * 4 + 4]
+                        for row in range(4)])
+
+    mesh = batch.data
+    positions = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get('co', positions)
+    loop_verts = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get('vertex_index', loop_verts)
+    loop_starts = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get('loop_start', loop_starts)
+    loop_totals = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get('loop_total', loop_totals)
+    materials = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get('material_index', materials)
+    face_ids = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.attributes['ship_id'].data.foreach_get('value', face_ids)
+
+    # The ship's own material slots, and the ship slot of each batch slot
+    start = sum(batch['ship_material_counts'][:index])
+    slots = list(batch['ship_material_slots'][start:start + batch['ship_material_counts'][index]])
+    ship_slot = np.zeros(max(len(mesh.materials), 1), dtype=np.int32)
+    for i, slot in reversed(list(enumerate(slots))):
+        ship_slot[slot] = i
+
+    faces = np.flatnonzero(face_ids == ship_id)
+    totals = loop_totals[faces]
+    starts = np.repeat(loop_starts[faces] - np.concatenate(([0], np.cumsum(totals)[:-1])), totals)
+    loops = starts + np.arange(totals.sum())
+    used, ship_loop_verts = np.unique(loop_verts[loops], return_inverse=True)
+    ship_positions = transform_positions(positions.reshape(-1, 3)[used], transform.inverted())
+
+    ship_mesh = build_mesh('Mesh',
+                           ship_positions,
+                           ship_loop_verts.astype(np.int32),
+                           np.concatenate(([0], np.cumsum(totals)[:-1])).astype(np.int32),
+                           ship_slot[materials[faces]] if slots else materials[faces])
+    for slot in slots:
+        ship_mesh.materials.append(mesh.materials[slot])
+    obj = bpy.data.objects.new('Spaceship', ship_mesh)
+    bpy.context.collection.objects.link(obj)
+    obj.matrix_world = transform
+    obj['seed'] = batch['ship_seeds'][index]
+    return obj
+
+
+def time_export(objects, filepath):
+    '''Time a glTF export of objects.
+    Returns:
+        seconds (float)
+    '''
+    bpy.ops.object.select_all(action='DESELECT')
+    for obj in objects:
+        obj.select_set(True)
+    start = time.perf_counter()
+    bpy.ops.export_scene.gltf(filepath=filepath, export_format='GLB', use_selection=True,
+                              export_materials='NONE')
+    return time.perf_counter() - start
+
+
+def time_redraw(iterations=10):
+    '''Time a viewport redraw, or None in background mode.'''
+    if bpy.app.background:
+        return None
+    start = time.perf_counter()
+    bpy.ops.wm.redraw_timer(type='DRAW_WIN_SWAP', iterations=iterations)
+    return (time.perf_counter() - start) / iterations
+
+
+def benchmark_fleet(count=1000, directory=None, ships_per_batch=256, **params):
+    '''Compare a fleet of separate ship objects with merged batches.
+    Args:
+        count (int): number of ships.
+        directory (str): where to write the test exports.
+        ships_per_batch (int): number of ships per batch.
+        params: extra keyword arguments for generate_spaceship.
+    Returns:
+        results: dict of export and redraw seconds for 'separate' and 'merged'.
+    '''
+    directory = directory or tempfile.gettempdir()
+    seeds = [str(i) for i in range(count)]
+    transforms = grid_layout(count)
+    objects = []
+    for random_seed, transform in zip(seeds, transforms):
+        obj = spaceship_generator.generate_spaceship(random_seed, **params)
+        obj.name = 'Spaceship %s' % random_seed
+        obj.matrix_world = transform
+        objects.append(obj)
+    results = {'separate_redraw': time_redraw(),
+               'separate_export': time_export(objects, os.path.join(directory, 'fleet_separate.glb'))}
+    batches = merge_ships(objects, transforms, ships_per_batch, seeds)
+    results['merged_redraw'] = time_redraw()
+    results['merged_export'] = time_export(batches, os.path.join(directory, 'fleet_merged.glb'))
+    for key, value in results.items():
+        print("%s: %s" % (key, value))
+    return results
+
+
+if __name__ == "__main__":
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    benchmark_fleet(int(argv[0]) if argv else 1000)
@@ -0,0 +1,295 @@
+# Warm worker service for generating spaceships without paying Blender's
+# start up cost per ship. A worker is a background Blender process with
+# spaceship_generator imported and the hull textures already loaded; it takes
+# jobs over a local socket or from a directory queue.
+#
+#   blender -b --python generation_server.py -- --port 5555
+#   blender -b --python generation_server.py -- --queue /tmp/ship_jobs
+#
+# A job is a JSON object:
+#   {"id": "42", "seed": "42", "params": {"create_face_detail": true},
+#    "format": "ship" | "glb" | "blend" | "buffers", "output": "/tmp/42.ship"}
+# "params" are generate_spaceship keyword arguments. With "buffers" the encoded
+# .ship bytes are sent back in the reply instead of being written to disk.
+# Replies include the placed "features" (see spaceship_generator.record_feature),
+# and with a "time_budget" param what was "degraded" to meet it, or null.
+#
+# Socket messages are a JSON header line, followed by header["payload_size"]
+# bytes of payload. Only the worker side needs Blender, the protocol and
+# clients are plain Python.
+
+import argparse
+import glob
+import json
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import time
+
+DEFAULT_PORT = 5555
+FORMATS = ('ship', 'glb', 'blend', 'buffers')
+
+
+def write_message(stream, header, payload=b''):
+    '''Write a JSON header line and an optional binary payload to a stream.'''
+    header = dict(header, payload_size=len(payload))
+    stream.write(json.dumps(header).encode('utf-8') + b'\n')
+    if payload:
+        stream.write(payload)
+    stream.flush()
+
+
+def read_message(stream):
+    '''Read a message written by write_message.
+    Returns:
+        header, payload: or (None, None) once the stream is closed.
+    '''
+    line = stream.readline()
+    if not line:
+        return None, None
+    header = json.loads(line)
+    payload = stream.read(header.get('payload_size', 0))
+    return header, payload
+
+
+def run_job(job, output_dir=None):
+    '''Generate one spaceship for a job and export it.
+    Args:
+        job (dict): see the top of this file.
+        output_dir (str): directory for outputs when the job has no 'output'.
+    Returns:
+        header, payload: reply header and binary payload (only for 'buffers').
+    '''
+    from add_mesh_SpaceshipGenerator import spaceship_generator, ship_format
+    import bpy
+
+    output_format = job.get('format', 'ship')
+    if output_format not in FORMATS:
+        raise ValueError("Unknown format: %s" % output_format)
+    random_seed = job.get('seed', '')
+    output = job.get('output')
+    if output is None and output_format != 'buffers':
+        output = os.path.join(output_dir or tempfile.gettempdir(),
+                              '%s.%s' % (job.get('id', random_seed) or 'spaceship', output_format))
+
+    start = time.perf_counter()
+    obj = spaceship_generator.generate_spaceship(random_seed, **job.get('params', {}))
+    generated = time.perf_counter()
+    payload = b''
+    try:
+        if output_format == 'buffers':
+            buffers = ship_format.triangle_buffers(obj)
+            payload = ship_format.encode_ship(buffers['positions'],
+                                              buffers['normals'],
+                                              buffers['indices'],
+                                              buffers['materials'],
+                                              buffers['material_names'])
+        elif output_format == 'ship':
+            ship_format.export_ship(obj, output)
+        elif output_format == 'glb':
+            bpy.ops.object.select_all(action='DESELECT')
+            obj.select_set(True)
+            for child in obj.children:
+                child.select_set(True)  # The collision hull, if any
+            bpy.ops.export_scene.gltf(filepath=output, export_format='GLB', use_selection=True,
+                                      export_extras=True)
+        elif output_format == 'blend':
+            bpy.data.libraries.write(output, {obj, *obj.children}, fake_user=True)
+        features = json.loads(obj.get('features', '[]'))
+        degraded = json.loads(obj.get('degraded', 'null'))
+    finally:
+        # Leave the worker as clean as we found it for the next job
+        spaceship_generator.reset_scene()
+
+    header = {'id': job.get('id'),
+              'ok': True,
+              'format': output_format,
+              'generate_seconds': generated - start,
+              'total_seconds': time.perf_counter() - start,
+              'features': features,
+              'degraded': degraded}
+    if output_format != 'buffers':
+        header['path'] = output
+    return header, payload
+
+
+def handle(job, handler, output_dir):
+    '''Run a job through handler, turning errors into a failed reply.'''
+    try:
+        return handler(job, output_dir)
+    except Exception as error:
+        return {'id': job.get('id'), 'ok': False, 'error': '%s: %s' % (type(error).__name__, error)}, b''
+
+
+def serve_socket(host='127.0.0.1', port=DEFAULT_PORT, handler=run_job, output_dir=None):
+    '''Serve jobs over a local TCP socket until interrupted.
+    Jobs run one at a time on the calling thread, as bpy isn't thread safe.
+    A connection can send any number of jobs, each gets one reply.
+    Args:
+        host (str): address to listen on.
+        port (int): port to listen on.
+        handler: function(job, output_dir) returning (header, payload).
+        output_dir (str): default directory for outputs.
+    '''
+    class JobHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            while True:
+                job, _ = read_message(self.rfile)
+                if job is None:
+                    return
+                if job.get('command') == 'shutdown':
+                    write_message(self.wfile, {'id': job.get('id'), 'ok': True})
+                    self.server.shutdown_requested = True
+                    return
+                header, payload = handle(job, handler, output_dir)
+                write_message(self.wfile, header, payload)
+
+    socketserver.TCPServer.allow_reuse_address = True
+    with socketserver.TCPServer((host, port), JobHandler) as server:
+        server.shutdown_requested = False
+        print("Spaceship worker listening on %s:%d" % (host, port))
+        while not server.shutdown_requested:
+            server.handle_request()
+
+
+def request_ship(job, host='127.0.0.1', port=DEFAULT_PORT, timeout=None):
+    '''Send one job to a socket worker and wait for the reply.
+    Returns:
+        header, payload: the worker's reply.
+    '''
+    with socket.create_connection((host, port), timeout) as sock:
+        stream = sock.makefile('rwb')
+        write_message(stream, job)
+        return read_message(stream)
+
+
+def shutdown_worker(host='127.0.0.1', port=DEFAULT_PORT, timeout=None):
+    '''Ask a socket worker to exit after its current job.'''
+    return request_ship({'command': 'shutdown'}, host, port, timeout)[0]
+
+
+def serve_directory(queue_dir, handler=run_job, output_dir=None, poll_interval=0.05):
+    '''Serve jobs from a directory queue until a 'shutdown' file appears.
+    Jobs are '<id>.job.json' files. Several workers can share a queue: a job
+    is claimed by atomically renaming it, and its reply is published as
+    '<id>.result.json' by atomic replace once complete.
+    Args:
+        queue_dir (str): queue directory.
+        handler: function(job, output_dir) returning (header, payload).
+        output_dir (str): default directory for outputs, the queue by default.
+        poll_interval (float): seconds to sleep when the queue is empty.
+    '''
+    os.makedirs(queue_dir, exist_ok=True)
+    output_dir = output_dir or queue_dir
+    claim_suffix = '.claimed.%d' % os.getpid()
+    print("Spaceship worker %d watching %s" % (os.getpid(), queue_dir))
+    while not os.path.exists(os.path.join(queue_dir, 'shutdown')):
+        jobs = sorted(glob.glob(os.path.join(queue_dir, '*.job.json')))
+        if not jobs:
+            time.sleep(poll_interval)
+            continue
+        for job_path in jobs:
+            claimed_path = job_path + claim_suffix
+            try:
+                os.rename(job_path, claimed_path)
+            except OSError:
+                continue  # Another worker got there first
+            job_id = os.path.basename(job_path)[:-len('.job.json')]
+            try:
+                with open(claimed_path) as f:
+                    job = json.load(f)
+                if not isinstance(job, dict):
+                    raise ValueError("Job is not a JSON object")
+            except ValueError as error:
+                # Reply to a broken job too, so it isn't left claimed forever
+                header, payload = {'id': job_id, 'ok': False,
+                                   'error': '%s: %s' % (type(error).__name__, error)}, b''
+            else:
+                job.setdefault('id', job_id)
+                header, payload = handle(job, handler, output_dir)
+            if payload:
+                header['path'] = os.path.join(output_dir, job_id + '.ship')
+                with open(header['path'], 'wb') as f:
+                    f.write(payload)
+            publish_json(os.path.join(queue_dir, job_id + '.result.json'), header)
+            os.remove(claimed_path)
+
+
+def publish_json(path, data):
+    '''Write JSON to path atomically, so readers never see a partial file.'''
+    temp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(temp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+
+def submit_to_directory(queue_dir, job, job_id=None):
+    '''Add a job to a directory queue.
+    Returns:
+        job_id (str): id to wait for with wait_for_result.
+    '''
+    job_id = str(job_id or job.get('id') or '%d-%d' % (os.getpid(), time.time_ns()))
+    os.makedirs(queue_dir, exist_ok=True)
+    publish_json(os.path.join(queue_dir, job_id + '.job.json'), dict(job, id=job_id))
+    return job_id
+
+
+def wait_for_result(queue_dir, job_id, timeout=None, poll_interval=0.01):
+    '''Wait for the reply to a job submitted with submit_to_directory.
+    Returns:
+        header: the reply, or None on timeout.
+    '''
+    result_path = os.path.join(queue_dir, job_id + '.result.json')
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while not os.path.exists(result_path):
+        if deadline is not None and time.monotonic() > deadline:
+            return None
+        time.sleep(poll_interval)
+    with open(result_path) as f:
+        header = json.load(f)
+    os.remove(result_path)
+    return header
+
+
+def preload():
+    '''Warm up a worker: import the generator and load the cached hull
+    textures by generating and removing one spaceship.'''
+    from add_mesh_SpaceshipGenerator import spaceship_generator
+    spaceship_generator.generate_spaceship('warmup')
+    spaceship_generator.reset_scene()
+
+
+def launch_workers(count, blender='blender', queue_dir=None, port=DEFAULT_PORT):
+    '''Start background Blender workers.
+    With a queue_dir all workers share the directory queue, otherwise each
+    worker listens on its own port starting at port.
+    Returns:
+        processes: list of subprocess.Popen.
+    '''
+    processes = []
+    for i in range(count):
+        args = [blender, '-b', '--python', os.path.abspath(__file__), '--']
+        if queue_dir:
+            args += ['--queue', queue_dir]
+        else:
+            args += ['--port', str(port + i)]
+        processes.append(subprocess.Popen(args))
+    return processes
+
+
+if __name__ == "__main__":
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    parser = argparse.ArgumentParser(description="Warm spaceship generation worker")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--queue', help="serve a directory queue instead of a socket")
+    parser.add_argument('--output', help="default output directory")
+    args = parser.parse_args(argv)
+    preload()
+    if args.queue:
+        serve_directory(args.queue, output_dir=args.output)
+    else:
+        serve_socket(args.host, args.port, output_dir=args.output)
@@ -0,0 +1,324 @@
+# Process safe cache of the hull stage.
+# Parameter sweeps over the detail, asymmetry or symmetry settings of one seed
+# rebuild the same hull from the cube every time, in every worker process.
+# With generate_spaceship(..., hull_cache=<dir>) the hull is built once for
+# the whole pool: the first process to need it builds it under a lock and
+# publishes it, and every other process loads the published entry.
+#
+# An entry is a directory named after the seed and the hull parameters
+# (x/y/z_segments, num_hull_segments_min/max and the hull engine) holding
+# the mesh as .npy files, plus the random state after the hull stage so the
+# later stages draw the same numbers as without the cache. Entries are
+# written to a temporary directory and renamed into place, which is atomic:
+# readers see a whole entry or none. Seeds '' and None depend on the
+# current random state and are never cached.
+#
+# Matching the random numbers is not enough on its own: every extrusion
+# frees the slot of the face it extruded, and BMesh puts the next new face
+# in the most recently freed slot. Where new faces land decides the order
+# the later stages walk the faces in, and so which face draws which random
+# number. An entry therefore also records where the free face slots are,
+# and loading recreates them. compare_cached_hull checks a seed gives the
+# same ship with and without the cache.
+#
+# The lock is an OS file lock, released by the OS if its process dies.
+#
+#   blender -b --python hull_cache.py -- <cache dir> [<number of seeds>]
+#
+# fills the cache for the seeds '0', '1'... with the default hull parameters.
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from random import getstate, setstate
+import numpy as np
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+# Bump when the hull stage or the entry layout changes, so stale entries are not used
+CACHE_VERSION = 2
+
+
+def hull_key(random_seed, engine, hull_args):
+    '''Get the cache key of a hull.
+    Args:
+        random_seed: seed the generator was seeded with.
+        engine (str): name of the hull function.
+        hull_args: x/y/z_segments and num_hull_segments_min/max.
+    Returns:
+        key (str), or None if the hull can't be cached.
+    '''
+    if random_seed is None or random_seed == "" or type(random_seed) not in (str, int):
+        return None
+    description = json.dumps([CACHE_VERSION, type(random_seed).__name__, random_seed,
+                              engine, list(hull_args)])
+    return hashlib.sha1(description.encode()).hexdigest()
+
+
+def entry_path(cache_dir, key):
+    '''Get the directory of a cache entry.'''
+    return os.path.join(cache_dir, 'hull-' + key)
+
+
+def try_lock(f):
+    '''Take an exclusive lock on an open file without waiting.
+    Returns:
+        True if the lock was taken.
+    '''
+    try:
+        if os.name == 'nt':
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+
+def unlock(f):
+    '''Release a lock taken with try_lock.'''
+    if os.name == 'nt':
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def remove_probe(bm, face, verts):
+    '''Remove a probe face with its edges and verts, last created first.'''
+    edges = face.edges[:]
+    bm.faces.remove(face)
+    for edge in reversed(edges):
+        bm.edges.remove(edge)
+    for vert in reversed(verts):
+        bm.verts.remove(vert)
+
+
+def free_face_slots(bm):
+    '''Find the free face slots of bm, in the order new faces will use them.
+    Probe faces are added until one lands after every existing face; the
+    others filled free slots. Removing the probes in reverse puts every slot
+    back as it was, and a free slot after the last face behaves the same as
+    no free slot.
+    Returns:
+        positions: position of each free slot among the faces of bm plus
+            the free slots.
+    '''
+    probes = []
+    try:
+        while True:
+            verts = [bm.verts.new((0, 0, 0)) for _ in range(3)]
+            probes.append((bm.faces.new(verts), verts))
+            bm.faces.index_update()
+            if probes[-1][0].index == len(bm.faces) - 1:
+                break
+        bm.faces.index_update()
+        return [face.index for face, _ in probes[:-1]]
+    finally:
+        for face, verts in reversed(probes):
+            remove_probe(bm, face, verts)
+
+
+def publish(path, bm, state):
+    '''Write bm and the random state as a cache entry, atomically.
+    If another process published the entry first, its entry is kept.'''
+    free_faces = free_face_slots(bm)
+    bm.verts.index_update()
+    temp_path = '%s.tmp-%d' % (path, os.getpid())
+    shutil.rmtree(temp_path, ignore_errors=True)
+    os.makedirs(temp_path)
+    try:
+        np.save(os.path.join(temp_path, 'positions.npy'),
+                np.array([vert.co for vert in bm.verts], dtype=np.float32).reshape(-1, 3))
+        np.save(os.path.join(temp_path, 'edges.npy'),
+                np.array([[vert.index for vert in edge.verts] for edge in bm.edges],
+                         dtype=np.int32).reshape(-1, 2))
+        np.save(os.path.join(temp_path, 'loop_verts.npy'),
+                np.array([vert.index for face in bm.faces for vert in face.verts], dtype=np.int32))
+        np.save(os.path.join(temp_path, 'loop_totals.npy'),
+                np.array([len(face.verts) for face in bm.faces], dtype=np.int32))
+        np.save(os.path.join(temp_path, 'materials.npy'),
+                np.array([face.material_index for face in bm.faces], dtype=np.int32))
+        with open(os.path.join(temp_path, 'meta.json'), 'w') as f:
+            json.dump({'random_state': state, 'free_faces': free_faces}, f)
+        os.rename(temp_path, path)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+    finally:
+        shutil.rmtree(temp_path, ignore_errors=True)
+
+
+def load(path, bm):
+    '''Build a published hull into bm and restore the random state after it.
+    Vertices, edges and faces are created in their original order, with
+    placeholder faces in the free slots that are removed again afterwards.
+    Args:
+        path (str): entry directory.
+        bm: empty bmesh object.
+    Returns:
+        True if the entry was loaded, False if it isn't published.
+    '''
+    if not os.path.isdir(path):
+        return False
+    positions = np.load(os.path.join(path, 'positions.npy')).tolist()
+    edges = np.load(os.path.join(path, 'edges.npy')).tolist()
+    loop_verts = np.load(os.path.join(path, 'loop_verts.npy')).tolist()
+    loop_totals = np.load(os.path.join(path, 'loop_totals.npy')).tolist()
+    materials = np.load(os.path.join(path, 'materials.npy')).tolist()
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+
+    verts = [bm.verts.new(co) for co in positions]
+    for a, b in edges:
+        bm.edges.new((verts[a], verts[b]))
+    # Placeholder verts go after the real ones, so their slots free up at the end
+    placeholders = {position: [bm.verts.new((0, 0, 0)) for _ in range(3)]
+                    for position in meta['free_faces']}
+    start = 0
+    faces = iter(zip(loop_totals, materials))
+    for position in range(len(loop_totals) + len(placeholders)):
+        if position in placeholders:
+            placeholders[position] = (bm.faces.new(placeholders[position]), placeholders[position])
+            continue
+        total, material_index = next(faces)
+        face = bm.faces.new([verts[i] for i in loop_verts[start:start + total]])
+        face.material_index = material_index
+        start += total
+    # The slot freed last is used first
+    for position in reversed(meta['free_faces']):
+        remove_probe(bm, *placeholders[position])
+    bm.normal_update()
+    version, internal_state, gauss_next = meta['random_state']
+    setstate((version, tuple(internal_state), gauss_next))
+    return True
+
+
+def cached_hull_steps(cache_dir, random_seed, bm, create_hull, *hull_args):
+    '''Run a hull stage through the cache, as a drop in for create_hull.
+    The random generator must already be seeded with random_seed.
+    Args:
+        cache_dir (str): cache directory, shared by all processes.
+        random_seed: seed the generator was seeded with.
+        bm: empty bmesh object to build the hull in.
+        create_hull: create_hull_steps or create_hull_lofted_steps.
+        hull_args: its x/y/z_segments and num_hull_segments_min/max.
+    Yields:
+        progress: generation progress (0-100).
+    '''
+    key = hull_key(random_seed, create_hull.__name__, hull_args)
+    if key is None:
+        yield from create_hull(bm, *hull_args)
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    path = entry_path(cache_dir, key)
+    if load(path, bm):
+        yield 5
+        return
+    with open(path + '.lock', 'a+') as lock:
+        # Another process holding the lock is building this hull: wait for it
+        while not try_lock(lock):
+            time.sleep(0.02)
+            yield 5
+        try:
+            if load(path, bm):
+                yield 5
+                return
+            yield from create_hull(bm, *hull_args)
+            publish(path, bm, getstate())
+        finally:
+            unlock(lock)
+
+
+def compare_cached_hull(random_seed, cache_dir, **params):
+    '''Check a seed generates the same ship body with and without the cache.
+    Runs the hull, asymmetry and detail stages three times: without the
+    cache, building and publishing the entry, and loading the entry. The
+    random state is restored afterwards.
+    Args:
+        random_seed: seed to check.
+        cache_dir (str): cache directory to use.
+        params: generate_spaceship keyword arguments.
+    Returns:
+        report: dict with 'same_topology', 'same_materials' and the
+            'max_distance' between matching vertices, of the loaded run
+            against the uncached one.
+    '''
+    import bmesh
+    from add_mesh_SpaceshipGenerator import spaceship_generator
+    from add_mesh_SpaceshipGenerator.seed_search import stage_params
+    params = stage_params(params)
+    create_hull = (spaceship_generator.create_hull_lofted_steps if params['loft_hull']
+                   else spaceship_generator.create_hull_steps)
+    hull_args = (params['x_segments'],
+                 params['y_segments'],
+                 params['z_segments'],
+                 params['num_hull_segments_min'],
+                 params['num_hull_segments_max'])
+    state = getstate()
+    meshes = []
+    try:
+        for cached in (False, True, True):
+            bm = bmesh.new()
+            meshes.append(bm)
+            spaceship_generator.seed_generator(random_seed)
+            if cached:
+                spaceship_generator.run_steps(cached_hull_steps(cache_dir, random_seed, bm,
+                                                                create_hull, *hull_args))
+            else:
+                spaceship_generator.run_steps(create_hull(bm, *hull_args))
+            if params['create_asymmetry_segments']:
+                spaceship_generator.run_steps(spaceship_generator.add_asymmetry_steps(
+                    bm, params['num_asymmetry_segments_min'], params['num_asymmetry_segments_max']))
+            if params['create_face_detail']:
+                for detail, faces in spaceship_generator.categorize_faces(bm).items():
+                    for face in faces:
+                        spaceship_generator.DETAIL_FUNCTIONS[detail](bm, face)
+            bm.verts.index_update()
+        uncached, _, loaded = meshes
+        same_topology = (len(uncached.verts) == len(loaded.verts) and
+                         [[v.index for v in f.verts] for f in uncached.faces] ==
+                         [[v.index for v in f.verts] for f in loaded.faces])
+        same_materials = ([f.material_index for f in uncached.faces] ==
+                          [f.material_index for f in loaded.faces])
+        max_distance = max(((a.co - b.co).length for a, b in zip(uncached.verts, loaded.verts)),
+                           default=0.0)
+    finally:
+        for bm in meshes:
+            bm.free()
+        setstate(state)
+    return {'same_topology': same_topology, 'same_materials': same_materials, 'max_distance': max_distance}
+
+
+def clear_cache(cache_dir):
+    '''Remove every entry, lock and unfinished entry from a cache directory.'''
+    for name in os.listdir(cache_dir):
+        if name.startswith('hull-'):
+            path = os.path.join(cache_dir, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+
+
+if __name__ == "__main__":
+    import bmesh
+    from add_mesh_SpaceshipGenerator import spaceship_generator
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    count = int(argv[1]) if len(argv) > 1 else 100
+    start = time.perf_counter()
+    for i in range(count):
+        bm = bmesh.new()
+        try:
+            spaceship_generator.seed_generator(str(i))
+            spaceship_generator.run_steps(cached_hull_steps(argv[0], str(i), bm,
+                                                            spaceship_generator.create_hull_steps,
+                                                            True, False, False, 3, 6))
+        finally:
+            bm.free()
+    print("%d hulls cached in %.2fs" % (count, time.perf_counter() - start))
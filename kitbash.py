@@ -0,0 +1,480 @@
+# Kitbash part library.
+# Instead of growing every hull from a cube, generated ships are cut into
+# reusable parts once, and new ships are assembled by snapping parts
+# together: a merge plus a transform per part instead of a full procedural
+# generation.
+#
+# harvest_ship runs the hull, asymmetry and detail stages of
+# generate_spaceship for a seed, then cuts the detailed ship into:
+#   tail, mid, nose  hull sections sliced across X, with 'rear' and/or
+#                    'front' connectors on their cut planes
+#   pod              the asymmetry pieces sticking out of the hull, with a
+#                    'base' connector where they grew from the hull
+# The hull sections also keep the frames the pods were cut from as 'mounts'.
+# Cut planes and holes are capped, so every part is a closed piece.
+#
+# A connector is a 4x4 frame with its Z axis pointing out of the part, and
+# the (x, y) extent of the opening. assemble_ship chains a tail, a few mid
+# sections and a nose by turning each part's 'rear' connector onto the
+# previous 'front' one, scaled to fit, and puts random pods on the mounts.
+#
+# The library can be saved to a single .npz file and loaded again, so it
+# only has to be harvested once:
+#
+#   blender -b --python kitbash.py -- <library.npz> [<number of ships>]
+
+import json
+import os
+import sys
+import time
+from math import pi
+from random import Random, getstate, setstate, seed
+import bpy
+import bmesh
+import numpy as np
+from mathutils import Matrix, Vector
+from add_mesh_SpaceshipGenerator import spaceship_generator
+from add_mesh_SpaceshipGenerator.fleet import build_mesh, transform_positions
+from add_mesh_SpaceshipGenerator.seed_search import build_hull, stage_params
+from add_mesh_SpaceshipGenerator.spaceship_generator import DETAIL_FUNCTIONS
+
+# Turns a connector frame around to face another one
+FLIP = Matrix.Rotation(pi, 4, 'Y')
+
+
+def new_library():
+    '''Create an empty part library.
+    Returns:
+        library: dict with 'seeds' (harvested seeds) and 'parts' (list of
+            part dicts with 'kind', 'seed', 'arrays', 'connectors' and 'mounts').
+    '''
+    return {'seeds': [], 'parts': []}
+
+
+def connector_frame(center, normal, verts):
+    '''Build a connector frame at center with Z along normal, and measure
+    the extent of verts in it.
+    Returns:
+        matrix, size: 4x4 Matrix and (x, y) extent.
+    '''
+    z_axis = normal.normalized()
+    up = Vector((0, 0, 1)) if abs(z_axis.z) < 0.9 else Vector((1, 0, 0))
+    x_axis = up.cross(z_axis).normalized()
+    y_axis = z_axis.cross(x_axis)
+    matrix = Matrix.Translation(center) @ Matrix((x_axis, y_axis, z_axis)).transposed().to_4x4()
+    xs = [x_axis.dot(co - center) for co in verts] or [0.0]
+    ys = [y_axis.dot(co - center) for co in verts] or [0.0]
+    return matrix, (max(xs) - min(xs), max(ys) - min(ys))
+
+
+def bmesh_arrays(bm, detail_layer=None):
+    '''Read a bmesh into the flat buffers of fleet.build_mesh.
+    Returns:
+        arrays: dict with 'positions' (V, 3) float32, 'loop_verts' (L,),
+            'loop_starts' (F,), 'materials' (F,) and 'details' (F,) int32.
+    '''
+    bm.verts.index_update()
+    positions = np.array([vert.co for vert in bm.verts], dtype=np.float32).reshape(-1, 3)
+    loop_verts = np.array([vert.index for face in bm.faces for vert in face.verts], dtype=np.int32)
+    totals = np.array([len(face.verts) for face in bm.faces], dtype=np.int32)
+    loop_starts = (np.cumsum(totals) - totals).astype(np.int32)
+    materials = np.array([face.material_index for face in bm.faces], dtype=np.int32)
+    details = np.array([face[detail_layer] if detail_layer else 0 for face in bm.faces], dtype=np.int32)
+    return {'positions': positions,
+            'loop_verts': loop_verts,
+            'loop_starts': loop_starts,
+            'materials': materials,
+            'details': details}
+
+
+def extract_faces(bm, layer_name, value):
+    '''Copy the faces of bm with value in an int face layer into a new
+    bmesh, capping the holes left behind.
+    Args:
+        bm: source bmesh.
+        layer_name (str): name of the int face layer.
+        value (int): layer value of the faces to keep.
+    Returns:
+        part_bm: the new bmesh, to free by the caller.
+    '''
+    part_bm = bm.copy()
+    # Layers belong to one bmesh, so look it up again on the copy
+    layer = part_bm.faces.layers.int.get(layer_name)
+    bmesh.ops.delete(part_bm, geom=[face for face in part_bm.faces if face[layer] != value], context='FACES')
+    bmesh.ops.holes_fill(part_bm, edges=part_bm.edges[:], sides=0)
+    return part_bm
+
+
+def slice_x(bm, low, high):
+    '''Cut the part of bm between the planes x = low and x = high into a new
+    capped bmesh. Either bound can be None to keep that side.'''
+    part_bm = bm.copy()
+    for x, normal in ((high, (1, 0, 0)), (low, (-1, 0, 0))):
+        if x is not None:
+            bmesh.ops.bisect_plane(part_bm,
+                                   geom=part_bm.verts[:] + part_bm.edges[:] + part_bm.faces[:],
+                                   dist=0.0001,
+                                   plane_co=(x, 0, 0),
+                                   plane_no=normal,
+                                   clear_outer=True)
+    bmesh.ops.holes_fill(part_bm, edges=part_bm.edges[:], sides=0)
+    return part_bm
+
+
+def cut_connector(bm, x, normal_x):
+    '''Get the connector on the cut plane x of a sliced section.'''
+    verts = [vert.co.copy() for vert in bm.verts if abs(vert.co.x - x) < 0.001]
+    if not verts:
+        return Matrix.Translation((x, 0, 0)), (0.0, 0.0)
+    center = Vector((x,
+                     (min(co.y for co in verts) + max(co.y for co in verts)) / 2,
+                     (min(co.z for co in verts) + max(co.z for co in verts)) / 2))
+    return connector_frame(center, Vector((normal_x, 0, 0)), verts)
+
+
+def harvest_ship(library, random_seed, section_count=3, **params):
+    '''Generate the body of a ship and add its parts to the library.
+    Runs the hull, asymmetry and detail stages as generate_spaceship would,
+    without symmetry, materials, the bevel or touching the scene. The random
+    state is restored afterwards.
+    Args:
+        library: library from new_library or load_library.
+        random_seed: seed of the ship.
+        section_count (int): number of hull sections to cut, at least 2.
+        params: generate_spaceship keyword arguments.
+    Returns:
+        parts: the parts added.
+    '''
+    params = stage_params(params)
+    section_count = max(2, section_count)
+    state = getstate()
+    bm = bmesh.new()
+    parts = []
+    try:
+        spaceship_generator.seed_generator(random_seed)
+        build_hull(bm, dict(params, create_asymmetry_segments=False))
+        hull_faces = set(bm.faces)
+        if params['create_asymmetry_segments']:
+            spaceship_generator.run_steps(spaceship_generator.add_asymmetry_steps(
+                bm, params['num_asymmetry_segments_min'], params['num_asymmetry_segments_max']))
+
+        # Group the faces added by the asymmetry stage into pods, and frame
+        # the opening each one grew out of
+        part_layer = bm.faces.layers.int.new('part')
+        pod_frames = []
+        unvisited = set(bm.faces) - hull_faces
+        while unvisited:
+            group = [unvisited.pop()]
+            for face in group:
+                for edge in face.edges:
+                    for other in edge.link_faces:
+                        if other in unvisited:
+                            unvisited.remove(other)
+                            group.append(other)
+            for face in group:
+                face[part_layer] = len(pod_frames) + 1
+            group_set = set(group)
+            boundary = [vert.co.copy() for vert in {vert for face in group for edge in face.edges
+                                                    if any(other not in group_set for other in edge.link_faces)
+                                                    for vert in edge.verts}]
+            center = sum(boundary, Vector()) / max(1, len(boundary))
+            centroid = sum((face.calc_center_median() for face in group), Vector()) / len(group)
+            pod_frames.append(connector_frame(center, centroid - center, boundary))
+
+        # Add the detail, labelled like generate_spaceship does
+        detail_layer = bm.faces.layers.int.new('detail')
+        if params['create_face_detail']:
+            for detail, faces in spaceship_generator.categorize_faces(bm).items():
+                for face in faces:
+                    if face.is_valid:
+                        face[detail_layer] = detail
+                    DETAIL_FUNCTIONS[detail](bm, face)
+
+        for index, (frame, size) in enumerate(pod_frames, 1):
+            part_bm = extract_faces(bm, 'part', index)
+            try:
+                bmesh.ops.transform(part_bm, matrix=frame.inverted(), verts=part_bm.verts)
+                arrays = bmesh_arrays(part_bm, part_bm.faces.layers.int.get('detail'))
+            finally:
+                part_bm.free()
+            parts.append({'kind': 'pod',
+                          'seed': str(random_seed),
+                          'arrays': arrays,
+                          'connectors': {'base': (Matrix.Identity(4), size)},
+                          'mounts': []})
+
+        hull_bm = extract_faces(bm, 'part', 0)
+        try:
+            x_min = min(vert.co.x for vert in hull_bm.verts)
+            x_max = max(vert.co.x for vert in hull_bm.verts)
+            cuts = [x_min + (x_max - x_min) * i / section_count for i in range(1, section_count)]
+            bounds = list(zip([None] + cuts, cuts + [None]))
+            for i, (low, high) in enumerate(bounds):
+                part_bm = slice_x(hull_bm, low, high)
+                try:
+                    connectors = {}
+                    if low is not None:
+                        connectors['rear'] = cut_connector(part_bm, low, -1)
+                    if high is not None:
+                        connectors['front'] = cut_connector(part_bm, high, 1)
+                    arrays = bmesh_arrays(part_bm, part_bm.faces.layers.int.get('detail'))
+                finally:
+                    part_bm.free()
+                mounts = [(frame, size) for frame, size in pod_frames
+                          if (low is None or frame.translation.x >= low) and
+                          (high is None or frame.translation.x < high)]
+                parts.append({'kind': 'tail' if i == 0 else 'nose' if i == len(bounds) - 1 else 'mid',
+                              'seed': str(random_seed),
+                              'arrays': arrays,
+                              'connectors': connectors,
+                              'mounts': mounts})
+        finally:
+            hull_bm.free()
+    finally:
+        bm.free()
+        setstate(state)
+    library['parts'] += parts
+    library['seeds'].append(str(random_seed))
+    return parts
+
+
+def build_library(seeds, path=None, section_count=3, **params):
+    '''Harvest the parts of many ships, optionally persisted to path.
+    If path exists the library is loaded from it and only the seeds not
+    harvested yet are generated, then it is saved back.
+    Args:
+        seeds: seeds of the ships to harvest.
+        path (str): .npz file to keep the library in between runs.
+        section_count (int): number of hull sections per ship.
+        params: generate_spaceship keyword arguments.
+    Returns:
+        library
+    '''
+    library = load_library(path) if path and os.path.exists(path) else new_library()
+    done = set(library['seeds'])
+    todo = [str(random_seed) for random_seed in seeds if str(random_seed) not in done]
+    for random_seed in todo:
+        harvest_ship(library, random_seed, section_count, **params)
+    if path and todo:
+        save_library(library, path)
+    print("Kitbash library: %d parts from %d ships" % (len(library['parts']), len(library['seeds'])))
+    return library
+
+
+def frame_to_json(frame, size):
+    '''Get a connector or mount as JSON friendly lists.'''
+    return {'matrix': [value for row in frame for value in row], 'size': list(size)}
+
+
+def frame_from_json(entry):
+    '''Inverse of frame_to_json.'''
+    values = entry['matrix']
+    return Matrix([values[row * 4:row * 4 + 4] for row in range(4)]), tuple(entry['size'])
+
+
+def save_library(library, path):
+    '''Write a library to one .npz file, atomically.'''
+    arrays = {}
+    meta = {'seeds': library['seeds'], 'parts': []}
+    for i, part in enumerate(library['parts']):
+        for name, array in part['arrays'].items():
+            arrays['part%d_%s' % (i, name)] = array
+        meta['parts'].append({'kind': part['kind'],
+                              'seed': part['seed'],
+                              'connectors': {name: frame_to_json(*connector)
+                                             for name, connector in part['connectors'].items()},
+                              'mounts': [frame_to_json(*mount) for mount in part['mounts']]})
+    arrays['meta'] = np.array(json.dumps(meta))
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(temp_path, path)
+
+
+def load_library(path):
+    '''Read a library written by save_library.'''
+    with np.load(path) as data:
+        meta = json.loads(str(data['meta']))
+        parts = []
+        for i, part in enumerate(meta['parts']):
+            prefix = 'part%d_' % i
+            parts.append({'kind': part['kind'],
+                          'seed': part['seed'],
+                          'arrays': {name[len(prefix):]: data[name] for name in data.files
+                                     if name.startswith(prefix)},
+                          'connectors': {name: frame_from_json(entry)
+                                         for name, entry in part['connectors'].items()},
+                          'mounts': [frame_from_json(entry) for entry in part['mounts']]})
+    return {'seeds': meta['seeds'], 'parts': parts}
+
+
+def fit_scale(target_size, size, limit=2.0):
+    '''Get the connector space scale fitting an opening of size onto one of
+    target_size, clamped to [1 / limit, limit] so parts don't get squashed.'''
+    factors = [min(limit, max(1.0 / limit, target / source)) if source > 1e-6 else 1.0
+               for target, source in zip(target_size, size)]
+    return Matrix.Diagonal((factors[0], factors[1], 1.0, 1.0))
+
+
+def snap(target, part_connector):
+    '''Get the transform putting a part's connector onto the target
+    connector, facing it and scaled to fit.
+    Args:
+        target: (matrix, size) connector to attach to, in ship space.
+        part_connector: (matrix, size) connector of the part, in part space.
+    '''
+    target_matrix, target_size = target
+    matrix, size = part_connector
+    return target_matrix @ FLIP @ fit_scale(target_size, size) @ matrix.inverted()
+
+
+def place_parts(library, rng, mid_sections=(1, 3), pod_chance=0.5):
+    '''Pick the parts of a ship and snap them together.
+    Each section's rear connector goes onto the front connector of the
+    section before it, and pods go onto the mounts of their section.
+    Args:
+        library: library with at least one tail, nose and, if mid_sections
+            allows any, mid section.
+        rng: Random to draw from.
+        mid_sections: (min, max) number of mid sections, inclusive.
+        pod_chance (float): chance of putting a pod on each mount.
+    Returns:
+        placed: list of (part index, transform) in ship space.
+    '''
+    parts = library['parts']
+    by_kind = {}
+    for index, part in enumerate(parts):
+        by_kind.setdefault(part['kind'], []).append(index)
+    if 'tail' not in by_kind or 'nose' not in by_kind:
+        raise ValueError("The kitbash library has no tail or nose sections")
+
+    chain = [rng.choice(by_kind['tail'])]
+    chain += [rng.choice(by_kind['mid']) for _ in range(rng.randint(*mid_sections))] if 'mid' in by_kind else []
+    chain.append(rng.choice(by_kind['nose']))
+
+    placed = []
+    section_transform = Matrix.Identity(4)
+    for i, index in enumerate(chain):
+        part = parts[index]
+        if i:
+            previous = parts[chain[i - 1]]
+            front_matrix, front_size = previous['connectors']['front']
+            section_transform = snap((section_transform @ front_matrix, front_size), part['connectors']['rear'])
+        placed.append((index, section_transform))
+        for mount_matrix, mount_size in part['mounts']:
+            if 'pod' in by_kind and rng.random() < pod_chance:
+                pod = rng.choice(by_kind['pod'])
+                base_matrix, base_size = parts[pod]['connectors']['base']
+                # Pods point out of the mount, so no flip
+                placed.append((pod, section_transform @ mount_matrix @ fit_scale(mount_size, base_size) @
+                               base_matrix.inverted()))
+    return placed
+
+
+def assemble_ship(library,
+                  random_seed=None,
+                  mid_sections=(1, 3),
+                  pod_chance=0.5,
+                  apply_bevel_modifier=True,
+                  assign_materials=True,
+                  materials=None):
+    '''Assemble a new spaceship from library parts.
+    Draws from its own generator, and seeds the material colors from it
+    with the shared random state saved and restored around them, so the
+    shared random state is untouched.
+    Args:
+        library: library with at least one tail, nose and, if mid_sections
+            allows any, mid section.
+        random_seed: seed of the assembly.
+        mid_sections: (min, max) number of mid sections, inclusive.
+        pod_chance (float): chance of putting a pod on each mount.
+        apply_bevel_modifier (bool): whether to add the bevel modifier.
+        assign_materials (bool): whether to assign the spaceship materials.
+        materials: materials to reuse, in Material order, instead of
+            creating new ones.
+    Returns:
+        obj: the 'Spaceship' object, with the parts used as the
+            'kitbash_parts' custom property.
+    '''
+    rng = Random(random_seed)
+    parts = library['parts']
+    placed = place_parts(library, rng, mid_sections, pod_chance)
+
+    positions = []
+    loop_verts = []
+    loop_starts = []
+    face_materials = []
+    details = []
+    vertex_offset = 0
+    loop_offset = 0
+    for index, transform in placed:
+        arrays = parts[index]['arrays']
+        positions.append(transform_positions(arrays['positions'], transform))
+        loop_verts.append(arrays['loop_verts'] + vertex_offset)
+        loop_starts.append(arrays['loop_starts'] + loop_offset)
+        face_materials.append(arrays['materials'])
+        details.append(arrays['details'])
+        vertex_offset += len(arrays['positions'])
+        loop_offset += len(arrays['loop_verts'])
+    positions = np.concatenate(positions)
+    positions -= positions.mean(axis=0)
+
+    mesh = build_mesh('Mesh',
+                      positions,
+                      np.concatenate(loop_verts),
+                      np.concatenate(loop_starts),
+                      np.concatenate(face_materials))
+    mesh.attributes.new('detail', 'INT', 'FACE').data.foreach_set('value', np.concatenate(details))
+    if materials is None:
+        state = getstate()
+        try:
+            seed(rng.randrange(1 << 30))
+            materials = spaceship_generator.create_materials()
+        finally:
+            setstate(state)
+    for material in materials:
+        if not assign_materials:
+            placeholder = bpy.data.materials.new(name="Material")
+            placeholder['spaceship_material'] = material.name
+            material = placeholder
+        mesh.materials.append(material)
+    obj = bpy.data.objects.new('Spaceship', mesh)
+    bpy.context.collection.objects.link(obj)
+    obj['kitbash_parts'] = [index for index, _ in placed]
+
+    if apply_bevel_modifier:
+        bevel_modifier = obj.modifiers.new('Bevel', 'BEVEL')
+        bevel_modifier.width = rng.uniform(5, 20)
+        bevel_modifier.offset_type = 'PERCENT'
+        bevel_modifier.segments = 2
+        bevel_modifier.profile = 0.25
+        bevel_modifier.limit_method = 'NONE'
+    return obj
+
+
+def benchmark_kitbash(library, count=100, **params):
+    '''Compare generate_spaceship with assemble_ship.
+    Returns:
+        results: dict of the seconds per ship for 'generate' and 'assemble'.
+    '''
+    start = time.perf_counter()
+    for i in range(count):
+        spaceship_generator.generate_spaceship(str(i), **params)
+        spaceship_generator.reset_scene()
+    results = {'generate': (time.perf_counter() - start) / count}
+    materials = spaceship_generator.create_materials()
+    start = time.perf_counter()
+    for i in range(count):
+        assemble_ship(library, str(i), materials=materials)
+    results['assemble'] = (time.perf_counter() - start) / count
+    spaceship_generator.reset_scene()
+    for key, value in results.items():
+        print("%s: %.4fs per ship" % (key, value))
+    return results
+
+
+if __name__ == "__main__":
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    path = argv[0] if argv else None
+    count = int(argv[1]) if len(argv) > 1 else 20
+    benchmark_kitbash(build_library((str(i) for i in range(count)), path))
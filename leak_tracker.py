@@ -0,0 +1,176 @@
+# Datablock accounting for repeated spaceship generation.
+# Snapshots bpy.data before and after each generate_spaceship call so any
+# growth (meshes, objects, materials, textures, images...) can be attributed
+# to the generator, and runs a leak check over many seeds.
+
+import os
+import bpy
+from contextlib import contextmanager
+from add_mesh_SpaceshipGenerator import spaceship_generator
+
+# bpy.data collections the generator can add to
+DATA_COLLECTIONS = ('objects',
+                    'meshes',
+                    'materials',
+                    'textures',
+                    'images',
+                    'node_groups',
+                    'collections')
+
+# Per generation records of this session, see track
+session = []
+
+
+class DatablockLeakError(Exception):
+    '''Raised by leak_check when generation leaves datablocks behind.'''
+
+
+def estimate_size(block):
+    '''Roughly estimate the memory used by a datablock, in bytes.
+    Only meshes and images are counted, everything else is small.
+    '''
+    if isinstance(block, bpy.types.Mesh):
+        return (len(block.vertices) * 12 +
+                len(block.edges) * 8 +
+                len(block.loops) * 8 +
+                len(block.polygons) * 12)
+    if isinstance(block, bpy.types.Image):
+        if block.packed_file:
+            return block.packed_file.size
+        width, height = block.size
+        return width * height * block.channels * (4 if block.is_float else 1)
+    return 0
+
+
+def process_memory():
+    '''Get the resident memory of this process in bytes, if the platform tells us.'''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def snapshot():
+    '''Take a snapshot of the datablocks in bpy.data.
+    Returns:
+        snap: dict with per collection 'names' (set of datablock names) and
+            'bytes' (estimated size), plus the process 'rss'.
+    '''
+    snap = {'names': {}, 'bytes': {}, 'rss': process_memory()}
+    for name in DATA_COLLECTIONS:
+        blocks = getattr(bpy.data, name)
+        snap['names'][name] = {block.name_full for block in blocks}
+        snap['bytes'][name] = sum(estimate_size(block) for block in blocks)
+    return snap
+
+
+def diff(before, after):
+    '''Compare two snapshots.
+    Returns:
+        growth: dict with per collection 'counts' and 'bytes' deltas, the
+            'added' and 'removed' datablock names, and the 'rss' delta.
+    '''
+    growth = {'counts': {}, 'bytes': {}, 'added': {}, 'removed': {}, 'rss': None}
+    for name in DATA_COLLECTIONS:
+        old_names = before['names'][name]
+        new_names = after['names'][name]
+        growth['counts'][name] = len(new_names) - len(old_names)
+        growth['bytes'][name] = after['bytes'][name] - before['bytes'][name]
+        growth['added'][name] = sorted(new_names - old_names)
+        growth['removed'][name] = sorted(old_names - new_names)
+    if before['rss'] is not None and after['rss'] is not None:
+        growth['rss'] = after['rss'] - before['rss']
+    return growth
+
+
+def print_growth(label, growth):
+    '''Print the non-zero parts of a diff.'''
+    print("%s:" % label)
+    for name in DATA_COLLECTIONS:
+        if growth['counts'][name] or growth['bytes'][name]:
+            print("  %s: %+d (%+d bytes) added %s" % (
+                name, growth['counts'][name], growth['bytes'][name], growth['added'][name][:8]))
+    if growth['rss'] is not None:
+        print("  rss: %+d bytes" % growth['rss'])
+
+
+@contextmanager
+def track(label='generation'):
+    '''Attribute any datablock growth inside the with block to label.
+    The record is appended to session and also yielded, its 'growth' is
+    filled in when the block exits.
+    '''
+    record = {'label': label, 'growth': None}
+    before = snapshot()
+    try:
+        yield record
+    finally:
+        record['growth'] = diff(before, snapshot())
+        session.append(record)
+
+
+def generate_tracked(*args, **kwargs):
+    '''Call generate_spaceship, recording what it adds to bpy.data in session.
+    Returns:
+        obj: the spaceship object.
+    '''
+    with track('generate_spaceship%r' % (args[:1],)) as record:
+        obj = spaceship_generator.generate_spaceship(*args, **kwargs)
+    print_growth(record['label'], record['growth'])
+    return obj
+
+
+def session_report():
+    '''Print and return the total growth of every generation tracked so far.'''
+    totals = {name: 0 for name in DATA_COLLECTIONS}
+    for record in session:
+        for name, count in record['growth']['counts'].items():
+            totals[name] += count
+    print("%d tracked generations, total growth: %s" % (len(session), totals))
+    return totals
+
+
+def leak_check(seeds, cleanup=spaceship_generator.reset_scene, warmup=1, **params):
+    '''Generate and clean up a spaceship per seed and fail if anything is left behind.
+    The first warmup generations are not measured, so one off work such as
+    loading the cached hull textures doesn't count as a leak.
+    Args:
+        seeds: seeds to generate.
+        cleanup: function removing a generated spaceship.
+        warmup (int): number of unmeasured generations first.
+        params: extra keyword arguments for generate_spaceship.
+    Returns:
+        residue: dict of collection name to datablocks left per ship.
+    Raises:
+        DatablockLeakError: if any collection grew.
+    '''
+    seeds = list(seeds)
+    for i in range(warmup):
+        spaceship_generator.generate_spaceship('warmup%d' % i, **params)
+        cleanup()
+
+    with track('leak_check') as record:
+        for random_seed in seeds:
+            spaceship_generator.generate_spaceship(random_seed, **params)
+            cleanup()
+    growth = record['growth']
+    print_growth("leak_check over %d seeds" % len(seeds), growth)
+
+    residue = {name: count / float(max(1, len(seeds)))
+               for name, count in growth['counts'].items() if count > 0}
+    if residue:
+        raise DatablockLeakError("Datablocks left per ship after cleanup: %s, added: %s" % (
+            residue, {name: growth['added'][name][:8] for name in residue}))
+    return residue
+
+
+if __name__ == "__main__":
+    # blender -b --python leak_tracker.py -- <number of seeds>
+    import sys
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    try:
+        leak_check(str(i) for i in range(int(argv[0]) if argv else 10))
+    except DatablockLeakError as error:
+        print(error)
+        sys.exit(1)
@@ -0,0 +1,372 @@
+# Constraint driven seed search.
+# Instead of generating full ships and throwing most away, each seed first
+# runs only the cheap stages of generate_spaceship on a throwaway bmesh: the
+# hull, the asymmetry segments and the face categorization. Constraints are
+# checked against the hull bounds and a triangle count estimated from the
+# categories, and only seeds passing them go any further. Those then get the
+# detail and symmetry added, still without materials, the bevel or touching
+# the scene, and every constraint is checked again on the finished shape
+# together with final_constraints, the ones that only make sense there (e.g.
+# symmetric_only). The same random sequence as generate_spaceship is used
+# throughout, so a seed that passes generates the ship it was judged on, up
+# to the bevel. The hull check is only a prefilter: mirroring and detail
+# change the bounds, so it can also reject a seed whose finished ship would
+# have passed.
+#
+#   blender -b --python seed_search.py -- --output <dir> --worker 0 --workers 4 \
+#       --spec '{"length": [3, 6], "max_triangles": 40000}' [--max-tries <seeds>]
+
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+import bmesh
+from mathutils import Vector
+from random import random, getstate, setstate
+from add_mesh_SpaceshipGenerator import spaceship_generator
+from add_mesh_SpaceshipGenerator.spaceship_generator import Detail, DETAIL_FUNCTIONS
+
+# Rough triangles added per categorized face, and the factor the bevel
+# modifier multiplies the count by. Use calibrate_estimates to measure them
+# for a given set of generate_spaceship parameters.
+DEFAULT_ESTIMATES = {
+    'triangles': {Detail.exhaust.name: 70,
+                  Detail.grid.name: 160,
+                  Detail.antenna.name: 90,
+                  Detail.weapon.name: 600,
+                  Detail.sphere.name: 320,
+                  Detail.disc.name: 190,
+                  Detail.cylinder.name: 130},
+    'bevel_factor': 7.0,
+}
+
+# generate_spaceship parameters the search stages depend on, with their defaults
+STAGE_PARAMS = {'x_segments': True,
+                'y_segments': False,
+                'z_segments': False,
+                'num_hull_segments_min': 3,
+                'num_hull_segments_max': 6,
+                'create_asymmetry_segments': True,
+                'num_asymmetry_segments_min': 1,
+                'num_asymmetry_segments_max': 5,
+                'create_face_detail': True,
+                'allow_horizontal_symmetry': True,
+                'allow_vertical_symmetry': False,
+                'apply_bevel_modifier': True,
+                'loft_hull': False,
+                'node_detail': False}
+
+
+def aspect_between(low, high):
+    '''Constraint on the length (X) over the largest of the width and height.'''
+    return lambda stats: low <= stats['aspect'] <= high
+
+
+def length_between(low, high):
+    '''Constraint on the length (X size) of the ship.'''
+    return lambda stats: low <= stats['size'][0] <= high
+
+
+def triangles_below(cap):
+    '''Constraint on the estimated triangle count of the final ship.'''
+    return lambda stats: stats['estimated_triangles'] < cap
+
+
+def symmetric_only(axis='x'):
+    '''Constraint for final_constraints: the ship got symmetry along axis.'''
+    return lambda stats: stats['symmetric'][axis]
+
+
+def constraints_from_spec(spec):
+    '''Build constraints from a JSON friendly spec, for worker processes.
+    Args:
+        spec (dict): any of 'aspect': [low, high], 'length': [low, high],
+            'max_triangles': cap and 'symmetric': true.
+    Returns:
+        constraints, final_constraints: lists of predicates.
+    '''
+    constraints = []
+    final_constraints = []
+    if 'aspect' in spec:
+        constraints.append(aspect_between(*spec['aspect']))
+    if 'length' in spec:
+        constraints.append(length_between(*spec['length']))
+    if 'max_triangles' in spec:
+        constraints.append(triangles_below(spec['max_triangles']))
+    if spec.get('symmetric'):
+        final_constraints.append(symmetric_only())
+    return constraints, final_constraints
+
+
+def measure(bm, stats):
+    '''Add the bounds, size, aspect and triangle count of bm to stats.'''
+    bounds_min = Vector([min(vert.co[i] for vert in bm.verts) for i in range(3)])
+    bounds_max = Vector([max(vert.co[i] for vert in bm.verts) for i in range(3)])
+    size = bounds_max - bounds_min
+    stats['bounds_min'] = tuple(bounds_min)
+    stats['bounds_max'] = tuple(bounds_max)
+    stats['size'] = tuple(size)
+    stats['aspect'] = size.x / max(size.y, size.z, 1e-9)
+    stats['triangles'] = sum(len(face.verts) - 2 for face in bm.faces)
+
+
+def stage_params(params):
+    '''Get the STAGE_PARAMS values from generate_spaceship keyword arguments.'''
+    return {name: params.get(name, default) for name, default in STAGE_PARAMS.items()}
+
+
+def build_hull(bm, params):
+    '''Run the hull and asymmetry stages of generate_spaceship into bm.
+    Args:
+        bm: empty bmesh object.
+        params: dict from stage_params.
+    '''
+    create_hull = (spaceship_generator.create_hull_lofted_steps if params['loft_hull']
+                   else spaceship_generator.create_hull_steps)
+    spaceship_generator.run_steps(create_hull(bm,
+                                              params['x_segments'],
+                                              params['y_segments'],
+                                              params['z_segments'],
+                                              params['num_hull_segments_min'],
+                                              params['num_hull_segments_max']))
+    if params['create_asymmetry_segments']:
+        spaceship_generator.run_steps(spaceship_generator.add_asymmetry_steps(
+            bm, params['num_asymmetry_segments_min'], params['num_asymmetry_segments_max']))
+
+
+def estimate_triangles(stats, estimates, apply_bevel_modifier=True):
+    '''Estimate the triangle count of the finished ship from the hull
+    triangles and the number of faces in each category.'''
+    triangles = stats['triangles'] + sum(estimates['triangles'][name] * count
+                                         for name, count in stats['categories'].items())
+    return int(triangles * (estimates['bevel_factor'] if apply_bevel_modifier else 1.0))
+
+
+def evaluate_seed(random_seed,
+                  constraints=(),
+                  final_constraints=(),
+                  estimates=DEFAULT_ESTIMATES,
+                  **params):
+    '''Run the cheap stages for one seed and check the constraints.
+    The random state is left as generate_spaceship would leave it partway,
+    so save it around calls if that matters.
+    Args:
+        random_seed: seed to evaluate.
+        constraints: predicates on the stats (see below), checked on the
+            hull first and again on the finished shape.
+        final_constraints: predicates needing the detail and symmetry, only
+            checked on the finished shape.
+        estimates: triangle estimates, see DEFAULT_ESTIMATES.
+        params: generate_spaceship keyword arguments.
+    Returns:
+        accepted (bool), stats (dict): 'bounds_min', 'bounds_max', 'size',
+            'aspect', 'triangles' (so far, before the bevel), 'categories'
+            (count of faces per Detail name), 'estimated_triangles' and
+            'stage' (the last stage run). After the final stage 'symmetric'
+            holds the 'x' and 'y' symmetry flags.
+    '''
+    params = stage_params(params)
+    spaceship_generator.seed_generator(random_seed)
+    bm = bmesh.new()
+    try:
+        build_hull(bm, params)
+        stats = {'stage': 'hull', 'categories': {}}
+        measure(bm, stats)
+        categories = spaceship_generator.categorize_faces(bm) if params['create_face_detail'] else {}
+        stats['categories'] = {detail.name: len(faces) for detail, faces in categories.items()}
+        stats['estimated_triangles'] = estimate_triangles(stats, estimates, params['apply_bevel_modifier'])
+        if not all(constraint(stats) for constraint in constraints):
+            return False, stats
+
+        # Final stage: the detail and symmetry, still only in the bmesh
+        if not params['node_detail']:
+            for detail, faces in categories.items():
+                for face in faces:
+                    DETAIL_FUNCTIONS[detail](bm, face)
+        symmetric = {'x': params['allow_horizontal_symmetry'] and random() > 0.5}
+        if symmetric['x']:
+            bmesh.ops.symmetrize(bm, input=bm.verts[:] + bm.edges[:] + bm.faces[:], direction="-X")
+        symmetric['y'] = params['allow_vertical_symmetry'] and random() > 0.5
+        if symmetric['y']:
+            bmesh.ops.symmetrize(bm, input=bm.verts[:] + bm.edges[:] + bm.faces[:], direction="-Y")
+        stats['stage'] = 'final'
+        stats['symmetric'] = symmetric
+        measure(bm, stats)
+        bevel = estimates['bevel_factor'] if params['apply_bevel_modifier'] else 1.0
+        stats['estimated_triangles'] = int(stats['triangles'] * bevel)
+        return all(constraint(stats) for constraint in (*constraints, *final_constraints)), stats
+    finally:
+        bm.free()
+
+
+def search_seeds(constraints=(),
+                 count=1,
+                 seeds=None,
+                 final_constraints=(),
+                 estimates=DEFAULT_ESTIMATES,
+                 max_tries=None,
+                 **params):
+    '''Find seeds whose ships meet the constraints.
+    Args:
+        constraints: predicates on the stats, see evaluate_seed.
+        count (int): number of seeds to find.
+        seeds: seeds to try in order, '0', '1', '2'... by default.
+        final_constraints: predicates needing the detail and symmetry.
+        estimates: triangle estimates, see DEFAULT_ESTIMATES.
+        max_tries (int): give up after trying this many seeds.
+        params: generate_spaceship keyword arguments.
+    Returns:
+        found: list of (seed, stats), generate the ships with
+            generate_spaceship(seed, **params).
+    '''
+    state = getstate()
+    found = []
+    tries = 0
+    rejected = {'hull': 0, 'final': 0}
+    seeds = seeds if seeds is not None else (str(i) for i in range(sys.maxsize))
+    try:
+        for random_seed in seeds:
+            if len(found) >= count or (max_tries is not None and tries >= max_tries):
+                break
+            tries += 1
+            accepted, stats = evaluate_seed(random_seed, constraints, final_constraints, estimates, **params)
+            if accepted:
+                found.append((random_seed, stats))
+            else:
+                rejected[stats['stage']] += 1
+    finally:
+        setstate(state)
+    print("search_seeds: %d found in %d tries, rejected %d at the hull, %d at the final stage" % (
+        len(found), tries, rejected['hull'], rejected['final']))
+    return found
+
+
+def calibrate_estimates(seeds, **params):
+    '''Measure the triangles each Detail adds and the bevel factor.
+    Generates full ships, so run it once per set of parameters.
+    Returns:
+        estimates: dict like DEFAULT_ESTIMATES.
+    '''
+    import bpy
+    totals = {detail.name: [0, 0] for detail in DETAIL_FUNCTIONS}
+    bevel_ratios = []
+    state = getstate()
+    try:
+        for random_seed in seeds:
+            # Triangles added per category, from the detail stage alone
+            spaceship_generator.seed_generator(random_seed)
+            bm = bmesh.new()
+            try:
+                build_hull(bm, stage_params(params))
+                for detail, faces in spaceship_generator.categorize_faces(bm).items():
+                    for face in faces:
+                        before = sum(len(f.verts) - 2 for f in bm.faces)
+                        DETAIL_FUNCTIONS[detail](bm, face)
+                        totals[detail.name][0] += sum(len(f.verts) - 2 for f in bm.faces) - before
+                        totals[detail.name][1] += 1
+            finally:
+                bm.free()
+
+            # Bevel factor, from a full generation
+            obj = spaceship_generator.generate_spaceship(random_seed, **params)
+            base = sum(len(poly.vertices) - 2 for poly in obj.data.polygons)
+            evaluated = obj.evaluated_get(bpy.context.evaluated_depsgraph_get())
+            mesh = evaluated.to_mesh()
+            mesh.calc_loop_triangles()
+            bevel_ratios.append(len(mesh.loop_triangles) / float(max(1, base)))
+            evaluated.to_mesh_clear()
+            spaceship_generator.reset_scene()
+    finally:
+        setstate(state)
+    estimates = {'triangles': {name: (total / count if count else DEFAULT_ESTIMATES['triangles'][name])
+                               for name, (total, count) in totals.items()},
+                 'bevel_factor': sum(bevel_ratios) / max(1, len(bevel_ratios))}
+    print("calibrate_estimates: %s" % estimates)
+    return estimates
+
+
+def launch_search(spec, count, output_dir, workers=4, blender='blender', params=None, timeout=None,
+                  max_tries=100000):
+    '''Spread a search over background Blender processes.
+    Worker i tries the seeds i, i + workers, i + 2 * workers... and appends
+    each seed it accepts to '<output_dir>/found-w<i>.jsonl'. The found files
+    of an earlier search in output_dir are removed first. The workers are
+    stopped once count seeds are found between them.
+    Args:
+        spec (dict): constraints, see constraints_from_spec.
+        count (int): number of seeds to find.
+        output_dir (str): directory for the results.
+        workers (int): number of processes.
+        blender (str): Blender executable.
+        params (dict): generate_spaceship keyword arguments.
+        timeout (float): seconds to give up after.
+        max_tries (int): seeds each worker tries before giving up, None for
+            no limit.
+    Returns:
+        found: list of (seed, stats).
+    '''
+    os.makedirs(output_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(output_dir, 'found-w*.jsonl')):
+        os.remove(path)
+    processes = []
+    for i in range(workers):
+        command = [blender, '-b', '--python', os.path.abspath(__file__), '--',
+                   '--output', output_dir,
+                   '--worker', str(i),
+                   '--workers', str(workers),
+                   '--spec', json.dumps(spec),
+                   '--params', json.dumps(params or {})]
+        if max_tries is not None:
+            command += ['--max-tries', str(max_tries)]
+        processes.append(subprocess.Popen(command))
+    deadline = None if timeout is None else time.monotonic() + timeout
+    try:
+        while True:
+            found = read_found(output_dir)
+            if (len(found) >= count or all(process.poll() is not None for process in processes) or
+                    (deadline is not None and time.monotonic() > deadline)):
+                return found[:count]
+            time.sleep(0.2)
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+
+
+def read_found(output_dir):
+    '''Read the seeds accepted so far by the workers of launch_search.'''
+    found = []
+    for path in sorted(glob.glob(os.path.join(output_dir, 'found-w*.jsonl'))):
+        with open(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # Still being written
+                found.append((entry['seed'], entry['stats']))
+    return found
+
+
+if __name__ == "__main__":
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    parser = argparse.ArgumentParser(description="Search spaceship seeds meeting constraints")
+    parser.add_argument('--output', required=True)
+    parser.add_argument('--worker', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--spec', default='{}', help="constraints as JSON, see constraints_from_spec")
+    parser.add_argument('--params', default='{}', help="generate_spaceship keyword arguments as JSON")
+    parser.add_argument('--max-tries', type=int, default=None, help="seeds to try before giving up")
+    args = parser.parse_args(argv)
+    constraints, final_constraints = constraints_from_spec(json.loads(args.spec))
+    params = json.loads(args.params)
+    os.makedirs(args.output, exist_ok=True)
+    tries = args.max_tries if args.max_tries is not None else sys.maxsize
+    with open(os.path.join(args.output, 'found-w%d.jsonl' % args.worker), 'w') as f:
+        for i in range(args.worker, min(sys.maxsize, args.worker + tries * args.workers), args.workers):
+            accepted, stats = evaluate_seed(str(i), constraints, final_constraints, **params)
+            if accepted:
+                f.write(json.dumps({'seed': str(i), 'stats': stats}) + '\n')
+                f.flush()
@@ -0,0 +1,473 @@
+# Compact quantized binary format for streaming generated spaceships.
+# Positions are quantized to 16 bits within the ship bounds, normals are
+# octahedral encoded into two 16 bit values, and triangles are stored in
+# vertex cache optimized order with a per triangle material table.
+#
+# File layout (little endian, every section starts on a 4 byte boundary):
+#   header          see HEADER below
+#   material names  material_count x 32 byte utf-8, zero padded
+#   positions       vertex_count x 3 x uint16
+#   normals         vertex_count x 2 x int16
+#   indices         triangle_count x 3 x uint16 (uint32 if FLAG_INDEX32)
+#   materials       triangle_count x uint8
+#
+# The reader only needs numpy, so game tools can load ships without Blender,
+# and it maps the file instead of copying it.
+
+import mmap
+import os
+import struct
+import time
+import json
+import numpy as np
+
+MAGIC = b'SHIP'
+VERSION = 1
+FLAG_INDEX32 = 1
+HEADER = struct.Struct('<4sHHIII6f')
+NAME_SIZE = 32
+
+
+def align(offset, alignment=4):
+    '''Round offset up to the next multiple of alignment.'''
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def section_offsets(vertex_count, triangle_count, material_count, index_size):
+    '''Get the byte offset of every section, and the total file size.
+    Args:
+        vertex_count (int): number of vertices.
+        triangle_count (int): number of triangles.
+        material_count (int): number of material names.
+        index_size (int): 2 or 4 bytes per index.
+    Returns:
+        offsets: dict of section name to byte offset, plus 'end'.
+    '''
+    offsets = {}
+    offset = HEADER.size + material_count * NAME_SIZE
+    for name, size in (('positions', vertex_count * 3 * 2),
+                       ('normals', vertex_count * 2 * 2),
+                       ('indices', triangle_count * 3 * index_size),
+                       ('materials', triangle_count)):
+        offset = align(offset)
+        offsets[name] = offset
+        offset += size
+    offsets['end'] = align(offset)
+    return offsets
+
+
+def oct_encode(normals):
+    '''Octahedral encode unit normals into two snorm16 values each.
+    Args:
+        normals: (N, 3) float array of unit vectors.
+    Returns:
+        encoded: (N, 2) int16 array.
+    '''
+    n = normals / np.maximum(np.abs(normals).sum(axis=1, keepdims=True), 1e-12)
+    x, y, z = n[:, 0], n[:, 1], n[:, 2]
+    sign_x = np.where(x >= 0, 1.0, -1.0)
+    sign_y = np.where(y >= 0, 1.0, -1.0)
+    folded = z < 0
+    ox = np.where(folded, (1 - np.abs(y)) * sign_x, x)
+    oy = np.where(folded, (1 - np.abs(x)) * sign_y, y)
+    encoded = np.stack((ox, oy), axis=1)
+    return np.round(np.clip(encoded, -1, 1) * 32767).astype(np.int16)
+
+
+def oct_decode(encoded):
+    '''Decode octahedral encoded normals.
+    Args:
+        encoded: (N, 2) int16 array from oct_encode.
+    Returns:
+        normals: (N, 3) float32 array of unit vectors.
+    '''
+    f = encoded.astype(np.float32) / 32767
+    x, y = f[:, 0], f[:, 1]
+    z = 1 - np.abs(x) - np.abs(y)
+    t = np.clip(-z, 0, None)
+    x = x + np.where(x >= 0, -t, t)
+    y = y + np.where(y >= 0, -t, t)
+    n = np.stack((x, y, z), axis=1)
+    return n / np.linalg.norm(n, axis=1, keepdims=True)
+
+
+def quantize_positions(positions):
+    '''Quantize positions to uint16 within their bounding box.
+    Args:
+        positions: (N, 3) float array.
+    Returns:
+        quantized: (N, 3) uint16 array.
+        bounds_min: (3,) float32 array.
+        bounds_max: (3,) float32 array.
+    '''
+    bounds_min = positions.min(axis=0).astype(np.float32) if len(positions) else np.zeros(3, np.float32)
+    bounds_max = positions.max(axis=0).astype(np.float32) if len(positions) else np.zeros(3, np.float32)
+    extent = np.maximum(bounds_max - bounds_min, 1e-12)
+    quantized = np.round((positions - bounds_min) / extent * 65535)
+    return np.clip(quantized, 0, 65535).astype(np.uint16), bounds_min, bounds_max
+
+
+def dequantize_positions(ship):
+    '''Get float positions back from a ship read with parse_ship or read_ship.'''
+    extent = ship['bounds_max'] - ship['bounds_min']
+    return ship['positions'].astype(np.float32) / 65535 * extent + ship['bounds_min']
+
+
+def optimize_vertex_cache(indices, vertex_count, cache_size=16):
+    '''Reorder triangles for the post-transform vertex cache (Tipsify).
+    Sander, Nehab and Barczak, "Fast Triangle Reordering for Vertex Locality
+    and Reduced Overdraw", 2007.
+    Args:
+        indices: (T, 3) int array of triangle vertex indices.
+        vertex_count (int): number of vertices.
+        cache_size (int): size of the modelled vertex cache.
+    Returns:
+        order: (T,) array of triangle indices in the new order.
+    '''
+    triangles = indices.tolist()
+    flat = indices.reshape(-1)
+    live = np.bincount(flat, minlength=vertex_count)
+    starts = np.concatenate(([0], np.cumsum(live))).tolist()
+    adjacency = (np.argsort(flat, kind='stable') // 3).tolist()
+    live = live.tolist()
+    cache_time = [0] * vertex_count
+    emitted = bytearray(len(triangles))
+    order = []
+    dead_end = []
+    timestamp = cache_size + 1
+    cursor = 0
+    fan = 0 if vertex_count else -1
+    while fan >= 0:
+        candidates = []
+        for t in adjacency[starts[fan]:starts[fan + 1]]:
+            if emitted[t]:
+                continue
+            emitted[t] = 1
+            order.append(t)
+            for v in triangles[t]:
+                dead_end.append(v)
+                candidates.append(v)
+                live[v] -= 1
+                if timestamp - cache_time[v] > cache_size:
+                    cache_time[v] = timestamp
+                    timestamp += 1
+
+        # Prefer a candidate that will still be in the cache once its triangles are emitted
+        fan = -1
+        best_priority = -1
+        for v in candidates:
+            if live[v] > 0:
+                priority = 0
+                if timestamp - cache_time[v] + 2 * live[v] <= cache_size:
+                    priority = timestamp - cache_time[v]
+                if priority > best_priority:
+                    fan, best_priority = v, priority
+        if fan < 0:
+            while dead_end:
+                v = dead_end.pop()
+                if live[v] > 0:
+                    fan = v
+                    break
+        if fan < 0:
+            while cursor < vertex_count:
+                if live[cursor] > 0:
+                    fan = cursor
+                    break
+                cursor += 1
+    return np.array(order, dtype=np.int64)
+
+
+def encode_ship(positions, normals, indices, materials, material_names=()):
+    '''Encode triangle buffers into the compact binary format.
+    Args:
+        positions: (N, 3) float array of vertex positions.
+        normals: (N, 3) float array of unit vertex normals.
+        indices: (T, 3) int array of triangle vertex indices.
+        materials: (T,) int array of material indices per triangle.
+        material_names: names for the material indices.
+    Returns:
+        data: the encoded ship as bytes.
+    '''
+    indices = np.asarray(indices, dtype=np.int64).reshape(-1, 3)
+    materials = np.asarray(materials, dtype=np.uint8)
+
+    # Triangles in cache friendly order, then vertices in first use order
+    order = optimize_vertex_cache(indices, len(positions))
+    indices = indices[order]
+    materials = materials[order]
+    used, first_use = np.unique(indices.reshape(-1), return_index=True)
+    vertex_order = used[np.argsort(first_use)]
+    remap = np.zeros(len(positions), dtype=np.int64)
+    remap[vertex_order] = np.arange(len(vertex_order))
+    indices = remap[indices]
+    positions = np.asarray(positions, dtype=np.float64)[vertex_order]
+    normals = np.asarray(normals, dtype=np.float64)[vertex_order]
+
+    vertex_count = len(positions)
+    triangle_count = len(indices)
+    index32 = vertex_count > 65535
+    index_dtype = np.uint32 if index32 else np.uint16
+    offsets = section_offsets(vertex_count, triangle_count, len(material_names), 4 if index32 else 2)
+
+    quantized, bounds_min, bounds_max = quantize_positions(positions)
+    data = bytearray(offsets['end'])
+    HEADER.pack_into(data, 0, MAGIC, VERSION, FLAG_INDEX32 if index32 else 0,
+                     vertex_count, triangle_count, len(material_names),
+                     *bounds_min.tolist(), *bounds_max.tolist())
+    for i, name in enumerate(material_names):
+        encoded_name = name.encode('utf-8')[:NAME_SIZE]
+        start = HEADER.size + i * NAME_SIZE
+        data[start:start + len(encoded_name)] = encoded_name
+    for name, array in (('positions', quantized),
+                        ('normals', oct_encode(normals)),
+                        ('indices', indices.astype(index_dtype)),
+                        ('materials', materials)):
+        raw = array.astype(array.dtype.newbyteorder('<')).tobytes()
+        data[offsets[name]:offsets[name] + len(raw)] = raw
+    return bytes(data)
+
+
+def parse_ship(buffer):
+    '''Parse an encoded ship without copying its buffers.
+    Args:
+        buffer: bytes, memoryview or mmap holding the encoded ship.
+    Returns:
+        ship: dict of numpy views into buffer ('positions', 'normals',
+            'indices', 'materials'), plus 'bounds_min', 'bounds_max' and
+            'material_names'. Use dequantize_positions and oct_decode to get
+            floats back.
+    '''
+    magic, version, flags, vertex_count, triangle_count, material_count, *bounds = \
+        HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a spaceship file")
+    if version != VERSION:
+        raise ValueError("Unsupported spaceship file version: %d" % version)
+    index32 = bool(flags & FLAG_INDEX32)
+    offsets = section_offsets(vertex_count, triangle_count, material_count, 4 if index32 else 2)
+    material_names = []
+    for i in range(material_count):
+        start = HEADER.size + i * NAME_SIZE
+        material_names.append(bytes(buffer[start:start + NAME_SIZE]).rstrip(b'\0').decode('utf-8'))
+    return {
+        'positions': np.frombuffer(buffer, '<u2', vertex_count * 3, offsets['positions']).reshape(-1, 3),
+        'normals': np.frombuffer(buffer, '<i2', vertex_count * 2, offsets['normals']).reshape(-1, 2),
+        'indices': np.frombuffer(buffer, '<u4' if index32 else '<u2', triangle_count * 3,
+                                 offsets['indices']).reshape(-1, 3),
+        'materials': np.frombuffer(buffer, np.uint8, triangle_count, offsets['materials']),
+        'bounds_min': np.array(bounds[:3], dtype=np.float32),
+        'bounds_max': np.array(bounds[3:], dtype=np.float32),
+        'material_names': material_names,
+    }
+
+
+def read_ship(filepath):
+    '''Memory map a ship file and parse it without copying.
+    Args:
+        filepath (str): path to the .ship file.
+    Returns:
+        ship: see parse_ship. The arrays keep the mapping alive.
+    '''
+    with open(filepath, 'rb') as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return parse_ship(mapping)
+
+
+def triangle_buffers(obj, apply_modifiers=True):
+    '''Get flat shaded triangle buffers from a Blender mesh object.
+    Corners sharing a vertex and a normal become one vertex.
+    Args:
+        obj: mesh object, e.g. from generate_spaceship.
+        apply_modifiers (bool): whether to use the evaluated mesh (with the bevel).
+    Returns:
+        buffers: dict with 'positions' (N, 3), 'normals' (N, 3), 'indices' (T, 3),
+            'materials' (T,), 'details' (T,) (the spaceship_generator.Detail of
+            each triangle, 0 if the mesh has no 'detail' attribute) and
+            'material_names'.
+    '''
+    import bpy  # Only the writer needs Blender
+
+    if apply_modifiers:
+        source = obj.evaluated_get(bpy.context.evaluated_depsgraph_get())
+    else:
+        source = obj
+    mesh = source.to_mesh()
+    try:
+        mesh.calc_loop_triangles()
+        co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        mesh.vertices.foreach_get('co', co)
+        loop_verts = np.empty(len(mesh.loops), dtype=np.int64)
+        mesh.loops.foreach_get('vertex_index', loop_verts)
+        loop_normals = np.empty(len(mesh.loops) * 3, dtype=np.float32)
+        mesh.corner_normals.foreach_get('vector', loop_normals)
+        tri_loops = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int64)
+        mesh.loop_triangles.foreach_get('loops', tri_loops)
+        materials = np.empty(len(mesh.loop_triangles), dtype=np.int64)
+        mesh.loop_triangles.foreach_get('material_index', materials)
+        details = np.zeros(len(mesh.loop_triangles), dtype=np.int64)
+        detail_attribute = mesh.attributes.get('detail')
+        if detail_attribute is not None and detail_attribute.domain == 'FACE':
+            face_details = np.empty(len(mesh.polygons), dtype=np.int64)
+            detail_attribute.data.foreach_get('value', face_details)
+            tri_faces = np.empty(len(mesh.loop_triangles), dtype=np.int64)
+            mesh.loop_triangles.foreach_get('polygon_index', tri_faces)
+            details = face_details[tri_faces]
+        material_names = [mat.name if mat else '' for mat in mesh.materials]
+    finally:
+        source.to_mesh_clear()
+
+    co = co.reshape(-1, 3)
+    loop_normals = loop_normals.reshape(-1, 3)
+    # One output vertex per distinct (vertex, quantized normal) pair
+    keys = np.column_stack((loop_verts[tri_loops], oct_encode(loop_normals[tri_loops])))
+    keys, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    corners = tri_loops[first]
+    return {
+        'positions': co[loop_verts[corners]],
+        'normals': loop_normals[corners],
+        'indices': inverse.reshape(-1, 3),
+        'materials': materials,
+        'details': details,
+        'material_names': material_names,
+    }
+
+
+def sidecar_path(filepath, kind, extension=None):
+    '''Get the path export_ship writes a sidecar of filepath to, e.g.
+    sidecar_path('a.ship', 'collision') is 'a.collision.ship'.'''
+    root, own_extension = os.path.splitext(filepath)
+    return root + '.' + kind + (own_extension if extension is None else extension)
+
+
+def export_ship(obj, filepath, apply_modifiers=True):
+    '''Write a spaceship object to a .ship file.
+    If the spaceship has a collision hull child (generate_spaceship with
+    collision_hull=True) it is written next to it, see sidecar_path, with
+    the convex piece number of each triangle as its material. The placed
+    features (exhausts, turret mounts, antenna tips...) are written next to
+    it as '.features.json'.
+    Args:
+        obj: mesh object, e.g. from generate_spaceship.
+        filepath (str): path of the file to write.
+        apply_modifiers (bool): whether to export the evaluated mesh (with the bevel).
+    Returns:
+        size: number of bytes written.
+    '''
+    buffers = triangle_buffers(obj, apply_modifiers)
+    data = encode_ship(buffers['positions'],
+                       buffers['normals'],
+                       buffers['indices'],
+                       np.minimum(buffers['materials'], 255),
+                       buffers['material_names'])
+    with open(filepath, 'wb') as f:
+        f.write(data)
+
+    for child in obj.children:
+        if 'collision_pieces' in child:
+            buffers = triangle_buffers(child, apply_modifiers=False)
+            with open(sidecar_path(filepath, 'collision'), 'wb') as f:
+                f.write(encode_ship(buffers['positions'],
+                                    buffers['normals'],
+                                    buffers['indices'],
+                                    np.minimum(buffers['materials'], 255)))
+    if 'features' in obj:
+        with open(sidecar_path(filepath, 'features', '.json'), 'w') as f:
+            f.write(obj['features'])
+    return len(data)
+
+
+GLB_COMPONENTS = {5121: np.uint8, 5123: np.uint16, 5125: np.uint32, 5126: np.float32}
+GLB_WIDTHS = {'SCALAR': 1, 'VEC2': 2, 'VEC3': 3, 'VEC4': 4}
+
+
+def read_glb_arrays(filepath):
+    '''Read the position, normal and index arrays of every primitive in a .glb
+    file into numpy, for a like for like read comparison with read_ship.
+    Args:
+        filepath (str): path to the .glb file.
+    Returns:
+        arrays: list of (positions, normals, indices) per primitive.
+    '''
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    json_length = struct.unpack_from('<I', data, 12)[0]
+    gltf = json.loads(data[20:20 + json_length])
+    binary = memoryview(data)[20 + json_length + 8:]
+
+    def accessor(index):
+        acc = gltf['accessors'][index]
+        view = gltf['bufferViews'][acc['bufferView']]
+        width = GLB_WIDTHS[acc['type']]
+        offset = view.get('byteOffset', 0) + acc.get('byteOffset', 0)
+        array = np.frombuffer(binary, GLB_COMPONENTS[acc['componentType']], acc['count'] * width, offset)
+        return array.reshape(-1, width)
+
+    arrays = []
+    for mesh in gltf['meshes']:
+        for primitive in mesh['primitives']:
+            attributes = primitive['attributes']
+            arrays.append((accessor(attributes['POSITION']),
+                           accessor(attributes['NORMAL']),
+                           accessor(primitive['indices'])))
+    return arrays
+
+
+def benchmark_against_gltf(obj, directory, repeat=5):
+    '''Compare size and throughput of the .ship format with binary glTF.
+    Args:
+        obj: spaceship object to export.
+        directory (str): directory to write the test files to.
+        repeat (int): number of timed runs per measurement.
+    Returns:
+        results: dict of sizes (bytes) and best times (seconds).
+    '''
+    import bpy  # Only the writer needs Blender
+
+    ship_path = os.path.join(directory, obj.name + '.ship')
+    glb_path = os.path.join(directory, obj.name + '.glb')
+
+    def best_time(func):
+        best = None
+        for i in range(repeat):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def export_glb():
+        bpy.ops.object.select_all(action='DESELECT')
+        obj.select_set(True)
+        bpy.ops.export_scene.gltf(filepath=glb_path,
+                                  export_format='GLB',
+                                  use_selection=True,
+                                  export_apply=True,
+                                  export_materials='NONE')
+
+    def read_ship_decoded():
+        ship = read_ship(ship_path)
+        dequantize_positions(ship)
+        oct_decode(ship['normals'])
+
+    results = {
+        'ship_write': best_time(lambda: export_ship(obj, ship_path)),
+        'glb_write': best_time(export_glb),
+        'ship_read': best_time(lambda: read_ship(ship_path)),
+        'ship_read_decoded': best_time(read_ship_decoded),
+        'glb_read': best_time(lambda: read_glb_arrays(glb_path)),
+    }
+    results['ship_size'] = os.path.getsize(ship_path)
+    results['glb_size'] = os.path.getsize(glb_path)
+    for key, value in results.items():
+        print("%s: %s" % (key, value))
+    return results
+
+
+if __name__ == "__main__":
+    # blender -b --python ship_format.py -- <output directory>
+    import sys
+    import tempfile
+    from add_mesh_SpaceshipGenerator import spaceship_generator
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    ship = spaceship_generator.generate_spaceship('benchmark')
+    benchmark_against_gltf(ship, argv[0] if argv else tempfile.gettempdir())
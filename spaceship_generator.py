@@ -6,11 +6,14 @@
 
 import os
 import os.path
+import json
+import time
 import bpy
 import bmesh
+import numpy as np
 from math import sqrt, radians
-from mathutils import Vector, Matrix
-from random import random, seed, uniform, randint, randrange
+from mathutils import Vector, Matrix, geometry
+from random import Random, random, seed, uniform, randint, randrange, getstate, setstate
 from enum import IntEnum
 from colorsys import hls_to_rgb
 
@@ -24,9 +27,15 @@ def resource_path(*path_components):
 def reset_scene():
     '''Delete all existing spaceships and unused materials from the scene
     '''
-    for item in bpy.data.objects:
-        item.select = item.name.startswith('Spaceship')
-    bpy.ops.object.delete()
+    meshes = set()
+    for item in bpy.data.objects[:]:
+        if item.name.startswith('Spaceship'):
+            if item.type == 'MESH':
+                meshes.add(item.data)
+            bpy.data.objects.remove(item)
+    for mesh in meshes:
+        if not mesh.users:
+            bpy.data.meshes.remove(mesh)
     for material in bpy.data.materials:
         if not material.users:
             bpy.data.materials.remove(material)
@@ -35,6 +44,86 @@ def reset_scene():
             bpy.data.textures.remove(texture)
 
 
+def remove_spaceship(obj, remove_materials=True):
+    '''Remove a generated spaceship, its children (such as the collision
+    hull) and their meshes.
+    Args:
+        obj: spaceship object.
+        remove_materials (bool): whether to also remove the materials made
+            by create_materials that nothing else uses anymore.
+    '''
+    materials = set(obj.data.materials) if remove_materials else set()
+    for item in [*obj.children, obj]:
+        mesh = item.data
+        bpy.data.objects.remove(item)
+        if mesh is not None and not mesh.users:
+            bpy.data.meshes.remove(mesh)
+    for material in materials:
+        if material is not None and 'spaceship_material' in material and not material.users:
+            bpy.data.materials.remove(material)
+
+
+def extrude_faces(bm, faces, translate_forwards=0.0, scales=None, extruded_face_list=None):
+    '''Extrude a set of faces in one operator call, each along its own normal.
+    The translation and scaling are applied straight to the new vertices, so
+    extruding a whole set costs a single bmesh operator call.
+    Args:
+        bm: bmesh object.
+        faces: faces to extrude.
+        translate_forwards: distance to extrude, or a list with one distance per face.
+        scales: optional scale of each extruded face in local face space, either a
+            number or (x, y, z) for all faces, or a list with one per face (None to skip).
+        extruded_face_list: list to append extruded faces to.
+    Returns:
+        new_faces: the new faces created by extrusion, in the same order as faces.
+    '''
+    if not isinstance(translate_forwards, list):
+        translate_forwards = [translate_forwards] * len(faces)
+    if not isinstance(scales, list):
+        scales = [scales] * len(faces)
+
+    # Remember which input faces use each vertex, as the output order isn't guaranteed
+    owners = {}
+    if len(faces) > 1:
+        for i, face in enumerate(faces):
+            for vert in face.verts:
+                owners.setdefault(vert, set()).add(i)
+
+    result = bmesh.ops.extrude_discrete_faces(bm, faces=faces)['faces']
+    if extruded_face_list != None:
+        extruded_face_list += result[:]
+    if len(faces) > 1:
+        new_faces = [None] * len(faces)
+        for new_face in result:
+            # Each new vertex has a side edge back to the vertex it was copied from
+            sources = None
+            for vert in new_face.verts:
+                for edge in vert.link_edges:
+                    vert_owners = owners.get(edge.other_vert(vert))
+                    if vert_owners is not None:
+                        sources = vert_owners if sources is None else sources & vert_owners
+                        break
+            new_faces[min(sources)] = new_face
+    else:
+        new_faces = result[:1]
+
+    moved_verts = []
+    for new_face, distance, scale in zip(new_faces, translate_forwards, scales):
+        if distance:
+            offset = new_face.normal * distance
+            for vert in new_face.verts:
+                vert.co += offset
+            if scale is None:
+                moved_verts += new_face.verts[:]
+        if scale is not None:
+            if isinstance(scale, (int, float)):
+                scale_face(bm, new_face, scale, scale, scale)
+            else:
+                scale_face(bm, new_face, *scale)
+    update_face_normals(moved_verts)
+    return new_faces
+
+
 def extrude_face(bm, face, translate_forwards=0.0, extruded_face_list=None):
     '''Extrude a face along its normal by translate_forwards units.
     Args: 
@@ -45,14 +134,7 @@ def extrude_face(bm, face, translate_forwards=0.0, extruded_face_list=None):
     Returns:
         new_face: the new face created by extrusion.
     '''
-    new_faces = bmesh.ops.extrude_discrete_faces(bm, faces=[face])['faces']
-    if extruded_face_list != None:
-        extruded_face_list += new_faces[:]
-    new_face = new_faces[0]
-    bmesh.ops.translate(bm,
-                        vec=new_face.normal * translate_forwards,
-                        verts=new_face.verts)
-    return new_face
+    return extrude_faces(bm, [face], translate_forwards, None, extruded_face_list)[0]
 
 
 def ribbed_extrude_face(bm, face, translate_forwards, num_ribs=3, rib_scale=0.9):
@@ -70,11 +152,9 @@ def ribbed_extrude_face(bm, face, translate_forwards, num_ribs=3, rib_scale=0.9)
     new_face = face
     for i in range(num_ribs):
         new_face = extrude_face(bm, new_face, translate_forwards_per_rib * 0.25)
-        new_face = extrude_face(bm, new_face, 0.0)
-        scale_face(bm, new_face, rib_scale, rib_scale, rib_scale)
+        new_face = extrude_faces(bm, [new_face], 0.0, rib_scale)[0]
         new_face = extrude_face(bm, new_face, translate_forwards_per_rib * 0.5)
-        new_face = extrude_face(bm, new_face, 0.0)
-        scale_face(bm, new_face, 1 / rib_scale, 1 / rib_scale, 1 / rib_scale)
+        new_face = extrude_faces(bm, [new_face], 0.0, 1 / rib_scale)[0]
         new_face = extrude_face(bm, new_face, translate_forwards_per_rib * 0.25)
     return new_face
 
@@ -82,11 +162,20 @@ def ribbed_extrude_face(bm, face, translate_forwards, num_ribs=3, rib_scale=0.9)
 def scale_face(bm, face, scale_x, scale_y, scale_z):
     '''Scale a face in local face space.'''
     face_space = get_face_matrix(face)
-    face_space.invert()
-    bmesh.ops.scale(bm,
-                    vec=Vector((scale_x, scale_y, scale_z)),
-                    space=face_space,
-                    verts=face.verts)
+    to_face_space = face_space.inverted()
+    scale = Vector((scale_x, scale_y, scale_z))
+    for vert in face.verts:
+        vert.co = face_space @ ((to_face_space @ vert.co) * scale)
+    update_face_normals(face.verts)
+
+
+def update_face_normals(verts):
+    '''Recalculate the normals of all faces using any of verts.
+    The bmesh translate/scale operators recalculate every normal in the mesh,
+    moving vertices directly only needs the faces around them updated.
+    '''
+    for face in {face for vert in verts for face in vert.link_faces}:
+        face.normal_update()
 
 
 def get_face_matrix(face, pos=None):
@@ -97,11 +186,28 @@ def get_face_matrix(face, pos=None):
     Returns:
         mat: 4x4 matrix.
     '''
-    x_axis = (face.verts[1].co - face.verts[0].co).normalized()
-    z_axis = -face.normal
-    y_axis = z_axis.cross(x_axis)
     if not pos:
         pos = face.calc_center_bounds()
+    return get_ring_matrix([face.verts[0].co, face.verts[1].co], face.normal, pos)
+
+
+def get_ring_matrix(ring, normal, pos=None):
+    '''Get a 4x4 matrix representing the orientation of a ring of positions,
+    the same way get_face_matrix does for a face.
+    Args:
+        ring: list of Vector positions, in face vertex order.
+        normal: normal of the ring.
+        pos: optional position override, the center of the ring's bounds by default.
+    Returns:
+        mat: 4x4 matrix.
+    '''
+    x_axis = (ring[1] - ring[0]).normalized()
+    z_axis = -normal
+    y_axis = z_axis.cross(x_axis)
+    if not pos:
+        bounds_min = Vector([min(co[i] for co in ring) for i in range(3)])
+        bounds_max = Vector([max(co[i] for co in ring) for i in range(3)])
+        pos = (bounds_min + bounds_max) * 0.5
 
     # Construct a 4x4 matrix from axes + position:
     # http://i.stack.imgur.com/3TnQP.png
@@ -158,14 +264,48 @@ def is_rear_face(face):
     return face.normal.x < -0.95
 
 
-def add_exhaust_to_face(bm, face):
+def record_feature(features, detail, matrix, size):
+    '''Record a placed feature, such as an exhaust or a turret mount.
+    Args:
+        features: list of features to append to, or None to not record.
+        detail (Detail): type of the feature.
+        matrix: 4x4 frame of the feature, oriented like get_face_matrix
+            (local Z points into the hull).
+        size: (x, y, z) extent of the feature in its frame.
+    '''
+    if features is not None:
+        features.append({'type': detail, 'matrix': matrix.copy(), 'size': tuple(size)})
+
+
+def inherit_face_layers(bm, face, result):
+    '''Copy the int layers of face (such as 'detail') onto the faces created
+    by a bmesh create_* operator, like extrusion and subdivision already do.
+    Args:
+        bm: bmesh object.
+        face: face the new geometry was created on.
+        result: result of the bmesh create_* operator.
+    '''
+    layers = bm.faces.layers.int.values()
+    if not layers:
+        return
+    new_faces = {new_face for vert in result['verts'] for new_face in vert.link_faces}
+    for layer in layers:
+        value = face[layer]
+        for new_face in new_faces:
+            new_face[layer] = value
+
+
+def add_exhaust_to_face(bm, face, features=None):
     '''Add an exhaust shape to a face.
     Args:
         bm: bmesh object.
         face: face to add exhaust to.
+        features: optional list to record the placed features in, see record_feature.
     '''
     if not face.is_valid:
         return
+    face_matrix = get_face_matrix(face)
+    face_width, face_height = get_face_width_and_height(face)
 
     # The more square the face is, the more grid divisions it might have
     num_cuts = randint(1, int(4 - get_aspect_ratio(face)))
@@ -176,29 +316,31 @@ def add_exhaust_to_face(bm, face):
                                        use_grid_fill=True)
 
     exhaust_length = uniform(0.1, 0.2)
+    record_feature(features, Detail.exhaust, face_matrix, (face_width, face_height, exhaust_length))
     scale_outer = 1 / uniform(1.3, 1.6)
     scale_inner = 1 / uniform(1.05, 1.1)
-    for face in result['geom']:
-        if isinstance(face, bmesh.types.BMFace):
-            if is_rear_face(face):
-                face.material_index = Material.hull_dark
-                face = extrude_face(bm, face, exhaust_length)
-                scale_face(bm, face, scale_outer, scale_outer, scale_outer)
-                extruded_face_list = []
-                face = extrude_face(bm, face, -exhaust_length * 0.9, extruded_face_list)
-                for extruded_face in extruded_face_list:
-                    extruded_face.material_index = Material.exhaust_burn
-                scale_face(bm, face, scale_inner, scale_inner, scale_inner)
-
-
-def add_grid_to_face(bm, face):
+    rear_faces = [face for face in result['geom']
+                  if isinstance(face, bmesh.types.BMFace) and is_rear_face(face)]
+    for face in rear_faces:
+        face.material_index = Material.hull_dark
+    faces = extrude_faces(bm, rear_faces, exhaust_length, scale_outer)
+    extruded_face_list = []
+    extrude_faces(bm, faces, -exhaust_length * 0.9, scale_inner, extruded_face_list)
+    for extruded_face in extruded_face_list:
+        extruded_face.material_index = Material.exhaust_burn
+
+
+def add_grid_to_face(bm, face, features=None):
     '''Add a grid pattern to a face.
     Args:    
         bm: bmesh object.
         face: face to add grid to.
+        features: optional list to record the placed features in, see record_feature.
     '''
     if not face.is_valid:
         return
+    face_matrix = get_face_matrix(face)
+    face_width, face_height = get_face_width_and_height(face)
     result = bmesh.ops.subdivide_edges(bm,
                                        edges=face.edges[:],
                                        cuts=randint(2, 4),
@@ -206,23 +348,21 @@ def add_grid_to_face(bm, face):
                                        use_grid_fill=True,
                                        use_single_edge=False)
     grid_length = uniform(0.025, 0.15)
+    record_feature(features, Detail.grid, face_matrix, (face_width, face_height, grid_length))
     scale = 0.8
-    for face in result['geom']:
-        if isinstance(face, bmesh.types.BMFace):
-            material_index = Material.hull_lights if random() > 0.5 else Material.hull
-            extruded_face_list = []
-            face = extrude_face(bm, face, grid_length, extruded_face_list)
-            for extruded_face in extruded_face_list:
-                if abs(face.normal.z) < 0.707:  # side face
-                    extruded_face.material_index = material_index
-            scale_face(bm, face, scale, scale, scale)
-
-
-def add_cylinders_to_face(bm, face):
+    cells = [face for face in result['geom'] if isinstance(face, bmesh.types.BMFace)]
+    material_indices = [Material.hull_lights if random() > 0.5 else Material.hull for face in cells]
+    for face, material_index in zip(extrude_faces(bm, cells, grid_length, scale), material_indices):
+        if abs(face.normal.z) < 0.707:  # side face
+            face.material_index = material_index
+
+
+def add_cylinders_to_face(bm, face, features=None):
     '''Add cylinders to a face in a grid pattern.
     Args:
         bm: bmesh object.
         face: face to add cylinders to.
+        features: optional list to record the placed features in, see record_feature.
     '''
     if not face.is_valid or len(face.verts[:]) < 4:
         return
@@ -240,23 +380,28 @@ def add_cylinders_to_face(bm, face):
             face.verts[2].co, (h + 1) / float(horizontal_step + 1))
         for v in range(vertical_step):
             pos = top.lerp(bottom, (v + 1) / float(vertical_step + 1))
-            cylinder_matrix = get_face_matrix(face, pos) * \
-                Matrix.Rotation(radians(90), 3, 'X').to_4x4()
-            bmesh.ops.create_cone(bm,
-                                  cap_ends=True,
-                                  cap_tris=False,
-                                  segments=num_segments,
-                                  radius1=cylinder_size,
-                                  radius2=cylinder_size,
-                                  depth=cylinder_depth,
-                                  matrix=cylinder_matrix)
-
-
-def add_weapons_to_face(bm, face):
+            face_matrix = get_face_matrix(face, pos)
+            cylinder_matrix = face_matrix @ Matrix.Rotation(radians(90), 3, 'X').to_4x4()
+            result = bmesh.ops.create_cone(bm,
+                                           cap_ends=True,
+                                           cap_tris=False,
+                                           segments=num_segments,
+                                           radius1=cylinder_size,
+                                           radius2=cylinder_size,
+                                           depth=cylinder_depth,
+                                           matrix=cylinder_matrix)
+            inherit_face_layers(bm, face, result)
+            # In the face frame the cylinder lies along Y
+            record_feature(features, Detail.cylinder, face_matrix,
+                           (cylinder_size * 2, cylinder_depth, cylinder_size * 2))
+
+
+def add_weapons_to_face(bm, face, features=None):
     '''Add weapon turrets to a face in a grid pattern.
     Args:
         bm: bmesh object.
         face: face to add weapons to.
+        features: optional list to record the placed features in, see record_feature.
     '''
     if not face.is_valid or len(face.verts[:]) < 4:
         return
@@ -274,85 +419,93 @@ def add_weapons_to_face(bm, face):
             face.verts[2].co, (h + 1) / float(horizontal_step + 1))
         for v in range(vertical_step):
             pos = top.lerp(bottom, (v + 1) / float(vertical_step + 1))
-            face_matrix = get_face_matrix(face, pos + face.normal * weapon_depth * 0.5) * \
+            face_matrix = get_face_matrix(face, pos + face.normal * weapon_depth * 0.5) @ \
                 Matrix.Rotation(radians(uniform(0, 90)), 3, 'Z').to_4x4()
 
-            # Turret foundation
-            bmesh.ops.create_cone(bm,
-                                  cap_ends=True,
-                                  cap_tris=False,
-                                  segments=num_segments,
-                                  radius1=weapon_size * 0.9,
-                                  radius2=weapon_size,
-                                  depth=weapon_depth,
-                                  matrix=face_matrix)
+            # Turret foundation, recorded as the turret mount
+            record_feature(features, Detail.weapon, face_matrix, (weapon_size * 2, weapon_size * 2, weapon_depth))
+            result = bmesh.ops.create_cone(bm,
+                                           cap_ends=True,
+                                           cap_tris=False,
+                                           segments=num_segments,
+                                           radius1=weapon_size * 0.9,
+                                           radius2=weapon_size,
+                                           depth=weapon_depth,
+                                           matrix=face_matrix)
+            inherit_face_layers(bm, face, result)
 
             # Turret left guard
-            left_guard_mat = face_matrix * \
-                Matrix.Rotation(radians(90), 3, 'Y').to_4x4() * \
+            left_guard_mat = face_matrix @ \
+                Matrix.Rotation(radians(90), 3, 'Y').to_4x4() @ \
                 Matrix.Translation(Vector((0, 0, weapon_size * 0.6))).to_4x4()
-            bmesh.ops.create_cone(bm,
-                                  cap_ends=True,
-                                  cap_tris=False,
-                                  segments=num_segments,
-                                  radius1=weapon_size * 0.6,
-                                  radius2=weapon_size * 0.5,
-                                  depth=weapon_depth * 2,
-                                  matrix=left_guard_mat)
+            result = bmesh.ops.create_cone(bm,
+                                           cap_ends=True,
+                                           cap_tris=False,
+                                           segments=num_segments,
+                                           radius1=weapon_size * 0.6,
+                                           radius2=weapon_size * 0.5,
+                                           depth=weapon_depth * 2,
+                                           matrix=left_guard_mat)
+            inherit_face_layers(bm, face, result)
 
             # Turret right guard
-            right_guard_mat = face_matrix * \
-                Matrix.Rotation(radians(90), 3, 'Y').to_4x4() * \
+            right_guard_mat = face_matrix @ \
+                Matrix.Rotation(radians(90), 3, 'Y').to_4x4() @ \
                 Matrix.Translation(Vector((0, 0, weapon_size * -0.6))).to_4x4()
-            bmesh.ops.create_cone(bm,
-                                  cap_ends=True,
-                                  cap_tris=False,
-                                  segments=num_segments,
-                                  radius1=weapon_size * 0.5,
-                                  radius2=weapon_size * 0.6,
-                                  depth=weapon_depth * 2,
-                                  matrix=right_guard_mat)
+            result = bmesh.ops.create_cone(bm,
+                                           cap_ends=True,
+                                           cap_tris=False,
+                                           segments=num_segments,
+                                           radius1=weapon_size * 0.5,
+                                           radius2=weapon_size * 0.6,
+                                           depth=weapon_depth * 2,
+                                           matrix=right_guard_mat)
+            inherit_face_layers(bm, face, result)
 
             # Turret housing
             upward_angle = uniform(0, 45)
-            turret_house_mat = face_matrix * \
-                Matrix.Rotation(radians(upward_angle), 3, 'X').to_4x4() * \
+            turret_house_mat = face_matrix @ \
+                Matrix.Rotation(radians(upward_angle), 3, 'X').to_4x4() @ \
                 Matrix.Translation(Vector((0, weapon_size * -0.4, 0))).to_4x4()
-            bmesh.ops.create_cone(bm,
-                                  cap_ends=True,
-                                  cap_tris=False,
-                                  segments=8,
-                                  radius1=weapon_size * 0.4,
-                                  radius2=weapon_size * 0.4,
-                                  depth=weapon_depth * 5,
-                                  matrix=turret_house_mat)
+            result = bmesh.ops.create_cone(bm,
+                                           cap_ends=True,
+                                           cap_tris=False,
+                                           segments=8,
+                                           radius1=weapon_size * 0.4,
+                                           radius2=weapon_size * 0.4,
+                                           depth=weapon_depth * 5,
+                                           matrix=turret_house_mat)
+            inherit_face_layers(bm, face, result)
 
             # Turret barrels L + R
-            bmesh.ops.create_cone(bm,
-                                  cap_ends=True,
-                                  cap_tris=False,
-                                  segments=8,
-                                  radius1=weapon_size * 0.1,
-                                  radius2=weapon_size * 0.1,
-                                  depth=weapon_depth * 6,
-                                  matrix=turret_house_mat *
-                                  Matrix.Translation(Vector((weapon_size * 0.2, 0, -weapon_size))).to_4x4())
-            bmesh.ops.create_cone(bm,
-                                  cap_ends=True,
-                                  cap_tris=False,
-                                  segments=8,
-                                  radius1=weapon_size * 0.1,
-                                  radius2=weapon_size * 0.1,
-                                  depth=weapon_depth * 6,
-                                  matrix=turret_house_mat *
-                                  Matrix.Translation(Vector((weapon_size * -0.2, 0, -weapon_size))).to_4x4())
-
-
-def add_sphere_to_face(bm, face):
+            result = bmesh.ops.create_cone(bm,
+                                           cap_ends=True,
+                                           cap_tris=False,
+                                           segments=8,
+                                           radius1=weapon_size * 0.1,
+                                           radius2=weapon_size * 0.1,
+                                           depth=weapon_depth * 6,
+                                           matrix=turret_house_mat @
+                                           Matrix.Translation(Vector((weapon_size * 0.2, 0, -weapon_size))).to_4x4())
+            inherit_face_layers(bm, face, result)
+            result = bmesh.ops.create_cone(bm,
+                                           cap_ends=True,
+                                           cap_tris=False,
+                                           segments=8,
+                                           radius1=weapon_size * 0.1,
+                                           radius2=weapon_size * 0.1,
+                                           depth=weapon_depth * 6,
+                                           matrix=turret_house_mat @
+                                           Matrix.Translation(Vector((weapon_size * -0.2, 0, -weapon_size))).to_4x4())
+            inherit_face_layers(bm, face, result)
+
+
+def add_sphere_to_face(bm, face, features=None):
     '''Add a sphere to a face.
     Args:
         bm: bmesh object.
         face: face to add sphere to.
+        features: optional list to record the placed features in, see record_feature.
     '''
     if not face.is_valid:
         return
@@ -365,16 +518,19 @@ def add_sphere_to_face(bm, face):
                                         subdivisions=3,
                                         radius=sphere_size,
                                         matrix=sphere_matrix)
+    inherit_face_layers(bm, face, result)
+    record_feature(features, Detail.sphere, sphere_matrix, (sphere_size * 2,) * 3)
     for vert in result['verts']:
         for face in vert.link_faces:
             face.material_index = Material.hull
 
 
-def add_surface_antenna_to_face(bm, face):
+def add_surface_antenna_to_face(bm, face, features=None):
     '''Add surface antennas to a face.
     Args:
         bm: bmesh object.
         face: face to add antennas to.
+        features: optional list to record the placed features in, see record_feature.
     '''
     if not face.is_valid or len(face.verts[:]) < 4:
         return
@@ -396,7 +552,9 @@ def add_surface_antenna_to_face(bm, face):
                 material_index = Material.hull if random() > 0.5 else Material.hull_dark
                 num_segments = int(uniform(3, 6))
 
-                # Spire
+                # Spire, recorded at its tip
+                record_feature(features, Detail.antenna, get_face_matrix(face, pos + face.normal * depth),
+                               (base_diameter * 2, base_diameter * 2, depth))
                 result = bmesh.ops.create_cone(bm,
                                                cap_ends=False,
                                                cap_tris=False,
@@ -405,6 +563,7 @@ def add_surface_antenna_to_face(bm, face):
                                                radius2=base_diameter,
                                                depth=depth,
                                                matrix=get_face_matrix(face, pos + face.normal * depth * 0.5))
+                inherit_face_layers(bm, face, result)
                 for vert in result['verts']:
                     for vert_face in vert.link_faces:
                         vert_face.material_index = material_index
@@ -418,29 +577,34 @@ def add_surface_antenna_to_face(bm, face):
                                                radius2=base_diameter * uniform(1.5, 2),
                                                depth=depth_short,
                                                matrix=get_face_matrix(face, pos + face.normal * depth_short * 0.45))
+                inherit_face_layers(bm, face, result)
                 for vert in result['verts']:
                     for vert_face in vert.link_faces:
                         vert_face.material_index = material_index
 
 
-def add_disc_to_face(bm, face):
+def add_disc_to_face(bm, face, features=None):
     '''Add a glowing disc to a face.
     Args:
         bm: bmesh object.
         face: face to add disc
+        features: optional list to record the placed features in, see record_feature.
     '''
     if not face.is_valid:
         return
     face_width, face_height = get_face_width_and_height(face)
     depth = 0.125 * min(face_width, face_height)
-    bmesh.ops.create_cone(bm,
-                          cap_ends=True,
-                          cap_tris=False,
-                          segments=32,
-                          radius1=depth * 3,
-                          radius2=depth * 4,
-                          depth=depth,
-                          matrix=get_face_matrix(face, face.calc_center_bounds() + face.normal * depth * 0.5))
+    result = bmesh.ops.create_cone(bm,
+                                   cap_ends=True,
+                                   cap_tris=False,
+                                   segments=32,
+                                   radius1=depth * 3,
+                                   radius2=depth * 4,
+                                   depth=depth,
+                                   matrix=get_face_matrix(face, face.calc_center_bounds() + face.normal * depth * 0.5))
+    inherit_face_layers(bm, face, result)
+    pad_matrix = get_face_matrix(face, face.calc_center_bounds() + face.normal * depth * 1.05)
+    record_feature(features, Detail.disc, pad_matrix, (depth * 4.5, depth * 4.5, depth))
     result = bmesh.ops.create_cone(bm,
                                    cap_ends=False,
                                    cap_tris=False,
@@ -448,7 +612,8 @@ def add_disc_to_face(bm, face):
                                    radius1=depth * 1.25,
                                    radius2=depth * 2.25,
                                    depth=0.0,
-                                   matrix=get_face_matrix(face, face.calc_center_bounds() + face.normal * depth * 1.05))
+                                   matrix=pad_matrix)
+    inherit_face_layers(bm, face, result)
     for vert in result['verts']:
         for face in vert.link_faces:
             face.material_index = Material.glow_disc
@@ -462,8 +627,190 @@ class Material(IntEnum):
     glow_disc = 4       # Emissive landing pad disc material
 
 
+class Detail(IntEnum):
+    hull = 0            # Hull face without added detail
+    exhaust = 1         # Engine exhaust
+    grid = 2            # Greeble grid
+    antenna = 3         # Surface antennas
+    weapon = 4          # Turrets
+    sphere = 5          # Spheres
+    disc = 6            # Glowing landing pad discs
+    cylinder = 7        # Cylinder rows
+
+
+def categorize_faces(bm):
+    '''Spin the wheel for every hull face: pick the detail to add to it, and
+    light up some of the faces left plain.
+    Args:
+        bm: bmesh object of the hull.
+    Returns:
+        categories: dict of Detail to the list of faces to add it to, in the
+            order the detail gets added.
+    '''
+    engine_faces = []
+    grid_faces = []
+    antenna_faces = []
+    weapon_faces = []
+    sphere_faces = []
+    disc_faces = []
+    cylinder_faces = []
+    for face in bm.faces[:]:
+        # Skip any long thin faces as it'll probably look stupid
+        if get_aspect_ratio(face) > 3:
+            continue
+
+        # Spin the wheel! Let's categorize + assign some materials
+        val = random()
+        if is_rear_face(face):  # rear face
+            if not engine_faces or val > 0.75:
+                engine_faces.append(face)
+            elif val > 0.5:
+                cylinder_faces.append(face)
+            elif val > 0.25:
+                grid_faces.append(face)
+            else:
+                face.material_index = Material.hull_lights
+        elif face.normal.x > 0.9:  # front face
+            if face.normal.dot(face.calc_center_bounds()) > 0 and val > 0.7:
+                antenna_faces.append(face)  # front facing antenna
+                face.material_index = Material.hull_lights
+            elif val > 0.4:
+                grid_faces.append(face)
+            else:
+                face.material_index = Material.hull_lights
+        elif face.normal.z > 0.9:  # top face
+            if face.normal.dot(face.calc_center_bounds()) > 0 and val > 0.7:
+                antenna_faces.append(face)  # top facing antenna
+            elif val > 0.6:
+                grid_faces.append(face)
+            elif val > 0.3:
+                cylinder_faces.append(face)
+        elif face.normal.z < -0.9:  # bottom face
+            if val > 0.75:
+                disc_faces.append(face)
+            elif val > 0.5:
+                grid_faces.append(face)
+            elif val > 0.25:
+                weapon_faces.append(face)
+        elif abs(face.normal.y) > 0.9:  # side face
+            if not weapon_faces or val > 0.75:
+                weapon_faces.append(face)
+            elif val > 0.6:
+                grid_faces.append(face)
+            elif val > 0.4:
+                sphere_faces.append(face)
+            else:
+                face.material_index = Material.hull_lights
+    return {Detail.exhaust: engine_faces,
+            Detail.grid: grid_faces,
+            Detail.antenna: antenna_faces,
+            Detail.weapon: weapon_faces,
+            Detail.sphere: sphere_faces,
+            Detail.disc: disc_faces,
+            Detail.cylinder: cylinder_faces}
+
+
+# Function adding each Detail to a face
+DETAIL_FUNCTIONS = {Detail.exhaust: add_exhaust_to_face,
+                    Detail.grid: add_grid_to_face,
+                    Detail.antenna: add_surface_antenna_to_face,
+                    Detail.weapon: add_weapons_to_face,
+                    Detail.sphere: add_sphere_to_face,
+                    Detail.disc: add_disc_to_face,
+                    Detail.cylinder: add_cylinders_to_face}
+
+
 img_cache = {}
 
+# Estimated seconds to add each Detail to a face, used to plan the detail
+# within a time budget. Measure them with measure_detail_costs.
+DETAIL_COSTS = {Detail.exhaust: 0.002,
+                Detail.grid: 0.006,
+                Detail.antenna: 0.006,
+                Detail.weapon: 0.004,
+                Detail.sphere: 0.003,
+                Detail.disc: 0.001,
+                Detail.cylinder: 0.002}
+
+# Details to keep first when over budget, most important first
+DETAIL_PRIORITY = (Detail.exhaust,
+                   Detail.weapon,
+                   Detail.cylinder,
+                   Detail.disc,
+                   Detail.sphere,
+                   Detail.antenna,
+                   Detail.grid)
+
+# Cheaper Detail to fall back to before skipping a face altogether
+DETAIL_FALLBACKS = {Detail.weapon: Detail.cylinder,
+                    Detail.sphere: Detail.disc}
+
+
+def plan_detail(categories, time_budget, costs=DETAIL_COSTS):
+    '''Choose the Detail to actually add to each categorized face so the
+    estimated cost fits in time_budget. Faces of the lowest priority Detail
+    fall back to a cheaper Detail first, then are skipped, working up
+    DETAIL_PRIORITY until the estimate fits. Only depends on the categories,
+    so a seed and budget always give the same plan.
+    Args:
+        categories: dict of Detail to faces, from categorize_faces.
+        time_budget (float): seconds available for the detail.
+        costs: estimated seconds per face for each Detail.
+    Returns:
+        choices: dict of Detail to a list with the Detail to add, or None to
+            skip, for each of its faces.
+        estimated (float): estimated seconds of the plan.
+    '''
+    choices = {detail: [detail] * len(faces) for detail, faces in categories.items()}
+    estimated = sum(costs[detail] * len(faces) for detail, faces in categories.items())
+    for fallback_pass in (True, False):
+        for detail in reversed(DETAIL_PRIORITY):
+            row = choices.get(detail, [])
+            for i in reversed(range(len(row))):
+                if estimated <= time_budget:
+                    return choices, estimated
+                if fallback_pass:
+                    fallback = DETAIL_FALLBACKS.get(detail)
+                    if row[i] == detail and fallback is not None:
+                        estimated -= costs[detail] - costs[fallback]
+                        row[i] = fallback
+                elif row[i] is not None:
+                    estimated -= costs[row[i]]
+                    row[i] = None
+    return choices, estimated
+
+
+def measure_detail_costs(seeds, **hull_params):
+    '''Time each Detail on the hulls of a few seeds, for DETAIL_COSTS.
+    The random state is restored afterwards.
+    Args:
+        seeds: seeds of the hulls to detail.
+        hull_params: create_hull_steps keyword arguments.
+    Returns:
+        costs: dict of Detail to the mean seconds per face.
+    '''
+    state = getstate()
+    totals = {detail: [0.0, 0] for detail in DETAIL_FUNCTIONS}
+    try:
+        for random_seed in seeds:
+            bm = bmesh.new()
+            try:
+                seed_generator(random_seed)
+                run_steps(create_hull_steps(bm, **hull_params))
+                run_steps(add_asymmetry_steps(bm))
+                for detail, faces in categorize_faces(bm).items():
+                    for face in faces:
+                        start = time.perf_counter()
+                        DETAIL_FUNCTIONS[detail](bm, face)
+                        totals[detail][0] += time.perf_counter() - start
+                        totals[detail][1] += 1
+            finally:
+                bm.free()
+    finally:
+        setstate(state)
+    return {detail: (total / count if count else DETAIL_COSTS[detail])
+            for detail, (total, count) in totals.items()}
+
 
 def create_texture(name: str, tex_type: str, filename: str, use_alpha: bool = True):
     '''Create a texture from an image file.
@@ -475,10 +822,14 @@ def create_texture(name: str, tex_type: str, filename: str, use_alpha: bool = Tr
     Returns:
         tex: the created texture.
     '''
-    if filename in img_cache:
-        # Image has been cached already, so just use that.
-        img = img_cache[(filename, use_alpha)]
-    else:
+    img = img_cache.get((filename, use_alpha))
+    if img is not None:
+        try:
+            img.name
+        except ReferenceError:
+            # The cached image was removed from bpy.data, load it again
+            img = None
+    if img is None:
         # We haven't cached this asset yet, so load it from disk.
         try:
             img = bpy.data.images.load(filename)
@@ -535,6 +886,7 @@ def create_materials():
     for material in Material:
         new_mat = bpy.data.materials.new(material.name)
         new_mat.use_nodes = True
+        new_mat['spaceship_material'] = material.name
         ret.append(new_mat)
 
     # Choose a base color for the spaceship hull
@@ -606,79 +958,203 @@ def create_materials():
     return ret
 
 
-def generate_spaceship(random_seed: str = "",
-                       x_segments: bool = True,
-                       y_segments: bool = False,
-                       z_segments: bool = False,
-                       num_hull_segments_min: int = 3,
-                       num_hull_segments_max: int = 6,
-                       create_asymmetry_segments: bool = True,
-                       num_asymmetry_segments_min: int = 1,
-                       num_asymmetry_segments_max: int = 5,
-                       create_face_detail: bool = True,
-                       allow_horizontal_symmetry: bool = True,
-                       allow_vertical_symmetry: bool = False,
-                       apply_bevel_modifier: bool = True,
-                       assign_materials: bool = True):
-    '''Generate a spaceship mesh.
+def compact_topology(bm, merge_distance=0.0001, dissolve_angle=radians(0.1)):
+    '''Clean up redundant geometry left behind by the extrusion helpers.
+    Zero-length extrusions (ribbed_extrude_face, add_exhaust_to_face) leave
+    coincident vertices and empty edge loops, and extrude_discrete_faces leaves
+    faces disconnected. This merges vertices by distance, dissolves degenerate
+    and zero-area faces and dissolves flat edge loops that carry no shape,
+    keeping material boundaries intact.
     Args:
-        random_seed (str): random seed for the generator.
+        bm: bmesh object to compact in place.
+        merge_distance: distance below which vertices are merged.
+        dissolve_angle: angle (radians) below which adjacent faces count as coplanar.
+    Returns:
+        report: dict with the vertex and face counts before and after.
+    '''
+    report = {'verts_before': len(bm.verts), 'faces_before': len(bm.faces)}
+    bmesh.ops.remove_doubles(bm, verts=bm.verts[:], dist=merge_distance)
+    bmesh.ops.dissolve_degenerate(bm, dist=merge_distance, edges=bm.edges[:])
+    bmesh.ops.dissolve_limit(bm,
+                             angle_limit=dissolve_angle,
+                             use_dissolve_boundaries=False,
+                             verts=bm.verts[:],
+                             edges=bm.edges[:],
+                             delimit={'MATERIAL'})
+    report['verts_after'] = len(bm.verts)
+    report['faces_after'] = len(bm.faces)
+    return report
+
+
+def farthest_points(points, count):
+    '''Pick up to count points spread as far apart as possible, starting with
+    the point farthest from their centroid.
+    Args:
+        points: list of Vectors.
+        count (int): number of points to keep.
+    Returns:
+        chosen: list of Vectors.
+    '''
+    if len(points) <= count:
+        return points
+    centroid = sum(points, Vector()) / len(points)
+    chosen = [max(points, key=lambda point: (point - centroid).length_squared)]
+    distances = [(point - chosen[0]).length_squared for point in points]
+    while len(chosen) < count:
+        farthest = max(range(len(points)), key=distances.__getitem__)
+        chosen.append(points[farthest])
+        distances = [min(distance, (point - points[farthest]).length_squared)
+                     for distance, point in zip(distances, points)]
+    return chosen
+
+
+def create_collision_hull(bm, max_pieces=1, max_verts_per_piece=32):
+    '''Wrap a coarse ship body in a convex hull, or a few convex pieces.
+    The faces are split into max_pieces slabs along X holding a similar number
+    of faces each, and the vertices of each slab are wrapped in a convex hull.
+    Neighbouring slabs share the vertices between them, so the pieces overlap
+    rather than leave gaps. A slab with more than max_verts_per_piece vertices
+    is hulled around the most spread out subset of them instead.
+    Args:
+        bm: bmesh of the coarse body, e.g. after the hull and asymmetry stages.
+        max_pieces (int): number of convex pieces to split the body into.
+        max_verts_per_piece (int): upper limit on the vertices of each piece.
+    Returns:
+        collision_bm: new bmesh with one closed convex island per piece, the
+            faces of each piece have the piece number as material index.
+    '''
+    faces = sorted(bm.faces, key=lambda face: face.calc_center_median().x)
+    pieces = max(1, min(max_pieces, len(faces)))
+    collision_bm = bmesh.new()
+    for piece in range(pieces):
+        slab = faces[piece * len(faces) // pieces:(piece + 1) * len(faces) // pieces]
+        points = list({vert.co.to_tuple(): vert.co.copy() for face in slab for vert in face.verts}.values())
+        points = farthest_points(points, max(4, max_verts_per_piece))
+        if len(points) < 4:
+            continue
+        verts = [collision_bm.verts.new(point) for point in points]
+        result = bmesh.ops.convex_hull(collision_bm, input=verts)
+        # Drop the points that ended up inside the hull (or a flat slab)
+        leftover = set(result['geom_interior'] + result['geom_unused'])
+        bmesh.ops.delete(collision_bm,
+                         geom=[vert for vert in verts if vert in leftover],
+                         context='VERTS')
+        for face in result['geom']:
+            if isinstance(face, bmesh.types.BMFace) and face.is_valid:
+                face.material_index = piece
+    collision_bm.normal_update()
+    return collision_bm
+
+
+def symmetrize_features(features, axis, threshold=0.0001):
+    '''Apply a bmesh.ops.symmetrize from the negative to the positive side of
+    an axis to recorded features. Features on the positive side are dropped
+    like the geometry they sit on, features on the negative side are kept and
+    mirrored.
+    Args:
+        features: list of features from record_feature.
+        axis (int): 0 for direction "-X", 1 for "-Y".
+        threshold (float): distance from the mirror plane counted as on it.
+    Returns:
+        features: the symmetrized list.
+    '''
+    plane_normal = Vector((0, 0, 0))
+    plane_normal[axis] = 1
+    mirror = Matrix.Scale(-1, 4, plane_normal)
+    # Also flip the local X axis, so mirrored frames stay right handed
+    flip = Matrix.Scale(-1, 4, Vector((1, 0, 0)))
+    result = []
+    for feature in features:
+        offset = feature['matrix'].translation[axis]
+        if offset > threshold:
+            continue
+        result.append(feature)
+        if offset < -threshold:
+            result.append(dict(feature, matrix=mirror @ feature['matrix'] @ flip))
+    return result
+
+
+def features_to_json(features, decimals=4):
+    '''Convert recorded features to compact JSON, a list with the 'type'
+    (Detail name), 'position', 'rotation' (w, x, y, z quaternion) and 'size'
+    of each feature.'''
+    items = []
+    for feature in features:
+        position, rotation, _ = feature['matrix'].decompose()
+        items.append({'type': Detail(feature['type']).name,
+                      'position': [round(value, decimals) for value in position],
+                      'rotation': [round(value, decimals) for value in rotation],
+                      'size': [round(value, decimals) for value in feature['size']]})
+    return json.dumps(items, separators=(',', ':'))
+
+
+def mesh_center_of_mass(me):
+    '''Get the surface center of mass of a mesh straight from its buffers,
+    as origin_set(type='ORIGIN_CENTER_OF_MASS') computes it: the area
+    weighted centroids of the triangle fans of the faces.
+    Args:
+        me: mesh datablock.
+    Returns:
+        center: Vector.
+    '''
+    positions = np.empty(len(me.vertices) * 3, dtype=np.float32)
+    me.vertices.foreach_get('co', positions)
+    positions = positions.reshape(-1, 3).astype(np.float64)
+    loop_verts = np.empty(len(me.loops), dtype=np.int32)
+    me.loops.foreach_get('vertex_index', loop_verts)
+    loop_starts = np.empty(len(me.polygons), dtype=np.int32)
+    me.polygons.foreach_get('loop_start', loop_starts)
+    loop_totals = np.empty(len(me.polygons), dtype=np.int32)
+    me.polygons.foreach_get('loop_total', loop_totals)
+
+    # Fan triangle (first, i, i + 1) of every face loop i but the first and last
+    starts = np.repeat(loop_starts, loop_totals)
+    offsets = np.arange(len(loop_verts)) - starts
+    loops = np.flatnonzero((offsets >= 1) & (offsets <= np.repeat(loop_totals, loop_totals) - 2))
+    a = positions[loop_verts[starts[loops]]]
+    b = positions[loop_verts[loops]]
+    c = positions[loop_verts[loops + 1]]
+    areas = np.linalg.norm(np.cross(b - a, c - a), axis=1) * 0.5
+    total_area = areas.sum()
+    if total_area == 0.0:
+        return Vector(positions.mean(axis=0)) if len(positions) else Vector()
+    return Vector(((a + b + c) / 3.0 * areas[:, None]).sum(axis=0) / total_area)
+
+
+def create_base_cube(bm):
+    '''Let's start with a unit BMesh cube scaled randomly.
+    Args:
+        bm: empty bmesh object.
+    Returns:
+        scale_vector: the random scale applied to the cube.
+    '''
+    bmesh.ops.create_cube(bm, size=1)
+    scale_vector = Vector(
+        (uniform(0.75, 2.0), uniform(0.75, 2.0), uniform(0.75, 2.0)))
+    bmesh.ops.scale(bm, vec=scale_vector, verts=bm.verts)
+    return scale_vector
+
+
+def create_hull_steps(bm,
+                      x_segments: bool = True,
+                      y_segments: bool = False,
+                      z_segments: bool = False,
+                      num_hull_segments_min: int = 3,
+                      num_hull_segments_max: int = 6):
+    '''Build the basic hull from a randomly scaled cube, one segment per step.
+    Args:
+        bm: empty bmesh object to build the hull in.
         x_segments (bool): whether to segment the hull along the X axis.
         y_segments (bool): whether to segment the hull along the Y axis.
         z_segments (bool): whether to segment the hull along the Z axis.
         num_hull_segments_min (int): minimum number of hull segments.
         num_hull_segments_max (int): maximum number of hull segments.
-        create_asymmetry_segments (bool): whether to add asymmetrical hull segments.
-        num_asymmetry_segments_min (int): minimum number of asymmetry segments.
-        num_asymmetry_segments_max (int): maximum number of asymmetry segments.
-        create_face_detail (bool): whether to add detail to the hull faces.
-        allow_horizontal_symmetry (bool): whether to allow horizontal symmetry.
-        allow_vertical_symmetry (bool): whether to allow vertical symmetry.
-        apply_bevel_modifier (bool): whether to apply a bevel modifier.
-        assign_materials (bool): whether to assign materials to the spaceship.
+    Yields:
+        progress: generation progress (0-100).
     '''
-    if random_seed is not None:
-        if type(random_seed) == str:
-            if random_seed != "":
-                seed(random_seed)
-        elif type(random_seed) == int:
-            seed(random_seed)
-    else:
-        seed()
-
-    # Print each input parameter
-    print("random_seed: " + str(random_seed))
-    print("x_segments: " + str(x_segments))
-    print("y_segments: " + str(y_segments))
-    print("z_segments: " + str(z_segments))
-    print("num_hull_segments_min: " + str(num_hull_segments_min))
-    print("num_hull_segments_max: " + str(num_hull_segments_max))
-    print("create_asymmetry_segments: " + str(create_asymmetry_segments))
-    print("num_asymmetry_segments_min: " + str(num_asymmetry_segments_min))
-    print("num_asymmetry_segments_max: " + str(num_asymmetry_segments_max))
-    print("create_face_detail: " + str(create_face_detail))
-    print("allow_horizontal_symmetry: " + str(allow_horizontal_symmetry))
-    print("allow_vertical_symmetry: " + str(allow_vertical_symmetry))
-    print("apply_bevel_modifier: " + str(apply_bevel_modifier))
-    print("assign_materials: " + str(assign_materials))
-
-    if num_hull_segments_min is None or type(num_hull_segments_min) != int:
-        num_hull_segments_min = 3
-
-    if num_hull_segments_max is None or type(num_hull_segments_max) != int:
-        num_hull_segments_max = 6
-
-    wm = bpy.context.window_manager
-
-    wm.progress_begin(0, 100)
-    # Let's start with a unit BMesh cube scaled randomly
-    bm = bmesh.new()
-    bmesh.ops.create_cube(bm, size=1)
-    scale_vector = Vector(
-        (uniform(0.75, 2.0), uniform(0.75, 2.0), uniform(0.75, 2.0)))
-    bmesh.ops.scale(bm, vec=scale_vector, verts=bm.verts)
+    scale_vector = create_base_cube(bm)
 
-    wm.progress_update(5)
+    yield 5
     # Extrude out the hull along the X axis, adding some semi-random perturbations
     for face in bm.faces[:]:
         isX = x_segments and abs(face.normal.x) > 0.5
@@ -740,160 +1216,680 @@ def generate_spaceship(random_seed: str = "",
                     rib_scale = uniform(0.75, 0.95)
                     face = ribbed_extrude_face(
                         bm, face, hull_segment_length, randint(2, 4), rib_scale)
+                yield 5
+
+
+def plan_hull(bm,
+              scale_vector,
+              x_segments: bool = True,
+              y_segments: bool = False,
+              z_segments: bool = False,
+              num_hull_segments_min: int = 3,
+              num_hull_segments_max: int = 6):
+    '''Plan the hull segments of create_hull_steps without touching the mesh.
+    Draws random numbers in exactly the same order as create_hull_steps, and
+    records the chain of cross-section transforms for each extruded face.
+    Args:
+        bm: bmesh object holding the base cube.
+        scale_vector: the random scale of the base cube.
+        Others: same as create_hull_steps.
+    Returns:
+        plan: list of (face, steps) where steps is a list of ('extrude', distance),
+            ('scale', (x, y, z)), ('translate', Vector) or ('rotate', Matrix).
+    '''
+    plan = []
+    for face in bm.faces[:]:
+        isX = x_segments and abs(face.normal.x) > 0.5
+        isY = y_segments and abs(face.normal.y) > 0.5
+        isZ = z_segments and abs(face.normal.z) > 0.5
+        if isX or isY or isZ:
+            steps = []
+            hull_segment_length = uniform(0.3, 1)
+            num_hull_segments = randrange(num_hull_segments_min, num_hull_segments_max)
+            hull_segment_range = range(num_hull_segments)
+            for i in hull_segment_range:
+                if (isY or isZ) and i > 5:
+                    break
+                is_last_hull_segment = i == hull_segment_range[-1]
+                if (isY or isZ) and i == 5:
+                    is_last_hull_segment = True
 
-    wm.progress_update(25)
-    # Add some large asymmetrical sections of the hull that stick out
-    if create_asymmetry_segments:
-        for face in bm.faces[:]:
-            # Skip any long thin faces as it'll probably look stupid
-            if get_aspect_ratio(face) > 4:
-                continue
-            if random() > 0.85:
-                hull_piece_length = uniform(0.1, 0.4)
-                hull_segments = randrange(num_asymmetry_segments_min, num_asymmetry_segments_max)
-                for i in range(hull_segments):
-                    face = extrude_face(bm, face, hull_piece_length)
-
-                    # Maybe apply some scaling
-                    if random() > 0.25:
-                        s = 1 / uniform(1.1, 1.5)
-                        scale_face(bm, face, s, s, s)
-
-    wm.progress_update(35)
-    # Now the basic hull shape is built, let's categorize + add detail to all the faces
-    if create_face_detail:
-        engine_faces = []
-        grid_faces = []
-        antenna_faces = []
-        weapon_faces = []
-        sphere_faces = []
-        disc_faces = []
-        cylinder_faces = []
-        for face in bm.faces[:]:
-            # Skip any long thin faces as it'll probably look stupid
-            if get_aspect_ratio(face) > 3:
-                continue
-
-            # Spin the wheel! Let's categorize + assign some materials
-            val = random()
-            if is_rear_face(face):  # rear face
-                if not engine_faces or val > 0.75:
-                    engine_faces.append(face)
-                elif val > 0.5:
-                    cylinder_faces.append(face)
-                elif val > 0.25:
-                    grid_faces.append(face)
-                else:
-                    face.material_index = Material.hull_lights
-            elif face.normal.x > 0.9:  # front face
-                if face.normal.dot(face.calc_center_bounds()) > 0 and val > 0.7:
-                    antenna_faces.append(face)  # front facing antenna
-                    face.material_index = Material.hull_lights
-                elif val > 0.4:
-                    grid_faces.append(face)
-                else:
-                    face.material_index = Material.hull_lights
-            elif face.normal.z > 0.9:  # top face
-                if face.normal.dot(face.calc_center_bounds()) > 0 and val > 0.7:
-                    antenna_faces.append(face)  # top facing antenna
-                elif val > 0.6:
-                    grid_faces.append(face)
-                elif val > 0.3:
-                    cylinder_faces.append(face)
-            elif face.normal.z < -0.9:  # bottom face
-                if val > 0.75:
-                    disc_faces.append(face)
-                elif val > 0.5:
-                    grid_faces.append(face)
-                elif val > 0.25:
-                    weapon_faces.append(face)
-            elif abs(face.normal.y) > 0.9:  # side face
-                if not weapon_faces or val > 0.75:
-                    weapon_faces.append(face)
-                elif val > 0.6:
-                    grid_faces.append(face)
-                elif val > 0.4:
-                    sphere_faces.append(face)
+                val = random()
+                if val > 0.1:
+                    steps.append(('extrude', hull_segment_length))
+                    if random() > 0.75:
+                        steps.append(('extrude', hull_segment_length * 0.25))
+                    if random() > 0.5:
+                        sy = uniform(1.2, 1.5)
+                        sz = uniform(1.2, 1.5)
+                        if is_last_hull_segment or random() > 0.5:
+                            sy = 1 / sy
+                            sz = 1 / sz
+                        steps.append(('scale', (1, sy, sz)))
+                    if random() > 0.5:
+                        sideways_translation = Vector(
+                            (0, 0, uniform(0.1, 0.4) * scale_vector.z * hull_segment_length))
+                        if random() > 0.5:
+                            sideways_translation = -sideways_translation
+                        steps.append(('translate', sideways_translation))
+                    if x_segments and random() > 0.5:
+                        angle = 5
+                        if random() > 0.5:
+                            angle = -angle
+                        steps.append(('rotate', Matrix.Rotation(radians(angle), 3, 'Y')))
                 else:
-                    face.material_index = Material.hull_lights
-
-        wm.progress_update(40)
-        # Now we've categorized, let's actually add the detail
-        for face in engine_faces:
-            add_exhaust_to_face(bm, face)
-        wm.progress_update(42)
-        for face in grid_faces:
-            add_grid_to_face(bm, face)
-        wm.progress_update(47)
-        for face in antenna_faces:
-            add_surface_antenna_to_face(bm, face)
-        wm.progress_update(52)
-        for face in weapon_faces:
-            add_weapons_to_face(bm, face)
-        wm.progress_update(57)
-        for face in sphere_faces:
-            add_sphere_to_face(bm, face)
-        wm.progress_update(62)
-        for face in disc_faces:
-            add_disc_to_face(bm, face)
-        wm.progress_update(67)
-        for face in cylinder_faces:
-            add_cylinders_to_face(bm, face)
-
-    wm.progress_update(70)
-
-    # Apply horizontal symmetry sometimes
-    if allow_horizontal_symmetry and random() > 0.5:
-        bmesh.ops.symmetrize(bm, input=bm.verts[:] + bm.edges[:] + bm.faces[:], direction="-X")  # 1
-
-    wm.progress_update(75)
-
-    # Apply vertical symmetry sometimes - this can cause spaceship "islands", so disabled by default
-    if allow_vertical_symmetry and random() > 0.5:
-        bmesh.ops.symmetrize(bm, input=bm.verts[:] + bm.edges[:] + bm.faces[:], direction="-Y")  # 2
-
-    wm.progress_update(80)
-
-    # Finish up, write the bmesh into a new mesh
-    me = bpy.data.meshes.new('Mesh')
-    bm.to_mesh(me)
-    bm.free()
-
-    # Add the mesh to the scene
-    scene = bpy.context.scene
-    obj = bpy.data.objects.new('Spaceship', me)
-    bpy.context.collection.objects.link(obj)
+                    rib_scale = uniform(0.75, 0.95)
+                    num_ribs = randint(2, 4)
+                    translate_forwards_per_rib = hull_segment_length / float(num_ribs)
+                    for rib in range(num_ribs):
+                        steps += [('extrude', translate_forwards_per_rib * 0.25),
+                                  ('extrude', 0.0),
+                                  ('scale', (rib_scale, rib_scale, rib_scale)),
+                                  ('extrude', translate_forwards_per_rib * 0.5),
+                                  ('extrude', 0.0),
+                                  ('scale', (1 / rib_scale, 1 / rib_scale, 1 / rib_scale)),
+                                  ('extrude', translate_forwards_per_rib * 0.25)]
+            plan.append((face, steps))
+    return plan
+
+
+def loft_rings(ring, steps):
+    '''Apply a chain of cross-section transforms to a ring of positions.
+    Uses the same math as extrude_faces and scale_face on a face.
+    Args:
+        ring: list of Vector positions, in face vertex order.
+        steps: transforms from plan_hull.
+    Returns:
+        rings: the ring at each extrusion, starting with the input ring and
+            ending with the final cap.
+    '''
+    rings = [ring]
+    for step, value in steps:
+        if step == 'extrude':
+            offset = geometry.normal(ring) * value
+            ring = [co + offset for co in ring] if value else ring[:]
+            rings.append(ring)
+        elif step == 'scale':
+            face_space = get_ring_matrix(ring, geometry.normal(ring))
+            to_face_space = face_space.inverted()
+            scale = Vector(value)
+            ring = [face_space @ ((to_face_space @ co) * scale) for co in ring]
+        elif step == 'translate':
+            ring = [co + value for co in ring]
+        elif step == 'rotate':
+            ring = [value @ co for co in ring]
+        rings[-1] = ring
+    return rings
+
+
+def build_lofted_hull(bm, plan):
+    '''Build the planned hull segments as lofted tubes in a single pass.
+    Faces are created and removed in the same order extrude_discrete_faces
+    would, so the resulting mesh has the same element order as the extrusion
+    path and later stages draw the same random numbers.
+    Args:
+        bm: bmesh object holding the base cube.
+        plan: plan from plan_hull.
+    '''
+    for face, steps in plan:
+        rings = loft_rings([vert.co.copy() for vert in face.verts], steps)
+        cap = face
+        cap_verts = face.verts[:]
+        num_verts = len(cap_verts)
+        for ring in rings[1:]:
+            new_verts = [bm.verts.new(co) for co in ring]
+            new_cap = bm.faces.new(new_verts, cap)
+            for j in range(num_verts):
+                k = (j + 1) % num_verts
+                bm.faces.new((cap_verts[k], new_verts[k], new_verts[j], cap_verts[j]), cap)
+            bm.faces.remove(cap)
+            cap = new_cap
+            cap_verts = new_verts
+    bm.normal_update()
+
+
+def create_hull_lofted_steps(bm,
+                             x_segments: bool = True,
+                             y_segments: bool = False,
+                             z_segments: bool = False,
+                             num_hull_segments_min: int = 3,
+                             num_hull_segments_max: int = 6):
+    '''Build the same hull as create_hull_steps, but by lofting cross-sections.
+    The whole chain of segment transforms is planned first, then the hull is
+    built in one pass without bmesh operators, so the build time no longer
+    grows with the square of the segment count. Matches create_hull_steps up
+    to float rounding, see compare_hull_engines.
+    Args:
+        Same as create_hull_steps.
+    Yields:
+        progress: generation progress (0-100).
+    '''
+    scale_vector = create_base_cube(bm)
+    yield 5
+    build_lofted_hull(bm, plan_hull(bm,
+                                    scale_vector,
+                                    x_segments,
+                                    y_segments,
+                                    z_segments,
+                                    num_hull_segments_min,
+                                    num_hull_segments_max))
+    yield 5
+
+
+def compare_hull_engines(random_seed, **hull_params):
+    '''Build a hull with both create_hull_steps and create_hull_lofted_steps.
+    The random state is restored afterwards.
+    Args:
+        random_seed: seed for both builds.
+        hull_params: create_hull_steps keyword arguments.
+    Returns:
+        report: dict with 'same_topology' and the 'max_distance' between
+            matching vertices.
+    '''
+    state = getstate()
+    meshes = []
+    try:
+        for create_hull in (create_hull_steps, create_hull_lofted_steps):
+            bm = bmesh.new()
+            meshes.append(bm)
+            seed_generator(random_seed)
+            run_steps(create_hull(bm, **hull_params))
+            bm.verts.index_update()
+        extruded, lofted = meshes
+        same_topology = (len(extruded.verts) == len(lofted.verts) and
+                         [[v.index for v in f.verts] for f in extruded.faces] ==
+                         [[v.index for v in f.verts] for f in lofted.faces])
+        max_distance = max(((a.co - b.co).length for a, b in zip(extruded.verts, lofted.verts)),
+                           default=0.0)
+    finally:
+        for bm in meshes:
+            bm.free()
+        setstate(state)
+    return {'same_topology': same_topology, 'max_distance': max_distance}
+
+
+def add_asymmetry_steps(bm,
+                        num_asymmetry_segments_min: int = 1,
+                        num_asymmetry_segments_max: int = 5):
+    '''Add some large asymmetrical sections of the hull that stick out.
+    Args:
+        bm: bmesh object holding the hull.
+        num_asymmetry_segments_min (int): minimum number of asymmetry segments.
+        num_asymmetry_segments_max (int): maximum number of asymmetry segments.
+    Yields:
+        progress: generation progress (0-100).
+    '''
+    for face in bm.faces[:]:
+        # Skip any long thin faces as it'll probably look stupid
+        if get_aspect_ratio(face) > 4:
+            continue
+        if random() > 0.85:
+            hull_piece_length = uniform(0.1, 0.4)
+            hull_segments = randrange(num_asymmetry_segments_min, num_asymmetry_segments_max)
+            for i in range(hull_segments):
+                face = extrude_face(bm, face, hull_piece_length)
+
+                # Maybe apply some scaling
+                if random() > 0.25:
+                    s = 1 / uniform(1.1, 1.5)
+                    scale_face(bm, face, s, s, s)
+            yield 25
+
+
+def seed_generator(random_seed):
+    '''Seed the random number generator the way generate_spaceship expects.
+    Args:
+        random_seed (str|int): seed to use; '' keeps the current state and None reseeds from the OS.
+    '''
+    if random_seed is not None:
+        if type(random_seed) == str:
+            if random_seed != "":
+                seed(random_seed)
+        elif type(random_seed) == int:
+            seed(random_seed)
+    else:
+        seed()
 
-    # Select and make active
-    current_state = bpy.data.objects["Spaceship"].select_get()
-    bpy.context.view_layer.objects.active = obj
-    obj.select_set(True)
 
-    # Recenter the object to its center of mass
-    bpy.ops.object.origin_set(type='ORIGIN_CENTER_OF_MASS')
-    ob = bpy.context.object
-    ob.location = (0, 0, 0)
+def generate_spaceship_steps(random_seed: str = "",
+                             x_segments: bool = True,
+                             y_segments: bool = False,
+                             z_segments: bool = False,
+                             num_hull_segments_min: int = 3,
+                             num_hull_segments_max: int = 6,
+                             create_asymmetry_segments: bool = True,
+                             num_asymmetry_segments_min: int = 1,
+                             num_asymmetry_segments_max: int = 5,
+                             create_face_detail: bool = True,
+                             allow_horizontal_symmetry: bool = True,
+                             allow_vertical_symmetry: bool = False,
+                             apply_bevel_modifier: bool = True,
+                             assign_materials: bool = True,
+                             compact: bool = False,
+                             loft_hull: bool = False,
+                             node_detail: bool = False,
+                             collision_hull: bool = False,
+                             collision_pieces: int = 1,
+                             collision_max_verts: int = 32,
+                             collection=None,
+                             time_budget: float = 0.0,
+                             hull_cache: str = "",
+                             on_stage=None):
+    '''Generate a spaceship mesh as a sequence of small resumable steps.
+    Each step yields the current progress (0-100), so callers such as a modal
+    operator can spread the work over several timer events. The spaceship
+    object is returned through StopIteration, see run_steps. Closing the
+    generator early frees the bmesh and leaves nothing behind in the scene.
+    Args:
+        Same as generate_spaceship, plus:
+        on_stage: optional callback called as on_stage(bm, stage_name) after
+            the 'hull', 'asymmetry', 'detail' and 'symmetry' stages.
+    Returns:
+        obj: the spaceship object (via StopIteration.value).
+    '''
+    seed_generator(random_seed)
+
+    if num_hull_segments_min is None or type(num_hull_segments_min) != int:
+        num_hull_segments_min = 3
+
+    if num_hull_segments_max is None or type(num_hull_segments_max) != int:
+        num_hull_segments_max = 6
+
+    bm = bmesh.new()
+    coarse_bm = None
+    collision_me = None
+    try:
+        create_hull = create_hull_lofted_steps if loft_hull else create_hull_steps
+        hull_args = (x_segments,
+                     y_segments,
+                     z_segments,
+                     num_hull_segments_min,
+                     num_hull_segments_max)
+        if hull_cache:
+            from add_mesh_SpaceshipGenerator import hull_cache as cache
+            yield from cache.cached_hull_steps(hull_cache, random_seed, bm, create_hull, *hull_args)
+        else:
+            yield from create_hull(bm, *hull_args)
+        if on_stage:
+            on_stage(bm, 'hull')
+
+        yield 25
+        if create_asymmetry_segments:
+            yield from add_asymmetry_steps(bm,
+                                           num_asymmetry_segments_min,
+                                           num_asymmetry_segments_max)
+        if on_stage:
+            on_stage(bm, 'asymmetry')
+
+        # Keep the coarse body, before any detail, for the collision hull
+        if collision_hull:
+            coarse_bm = bm.copy()
+
+        yield 35
+        # Label every face with the Detail it belongs to, written to the mesh
+        # as the 'detail' face attribute. New geometry inherits the label of
+        # the face it was built from.
+        detail_layer = bm.faces.layers.int.new('detail')
+        features = []
+        if node_detail:
+            # The detail node group only needs a per face seed, drawn from its
+            # own generator so the shared random sequence stays as it is
+            detail_random = Random(random_seed)
+            seed_layer = bm.faces.layers.int.new('detail_seed')
+
+        # Within a time budget, plan which detail to degrade up front, and
+        # stop adding detail if the time spent on it still runs out
+        degraded = None
+        if time_budget and not node_detail:
+            degraded = {'time_budget': time_budget,
+                        'estimated': 0.0,
+                        'fallback': {},
+                        'skipped': {},
+                        'deadline_hit': False}
+            detail_time = 0.0
+
+        # Now the basic hull shape is built, let's categorize + add detail to all the faces
+        if create_face_detail:
+            categories = categorize_faces(bm)
+            if degraded:
+                choices, degraded['estimated'] = plan_detail(categories, time_budget)
+            else:
+                choices = {detail: [detail] * len(faces) for detail, faces in categories.items()}
+
+            yield 40
+            # Now we've categorized, let's actually add the detail, one face per step
+            for (detail, faces), progress in zip(categories.items(), (40, 42, 47, 52, 57, 62, 67)):
+                for face, choice in zip(faces, choices[detail]):
+                    if degraded:
+                        if choice is not None and detail_time > time_budget:
+                            choice = None
+                            degraded['deadline_hit'] = True
+                        if choice is None:
+                            degraded['skipped'][detail.name] = degraded['skipped'].get(detail.name, 0) + 1
+                            continue
+                        if choice != detail:
+                            degraded['fallback'][detail.name] = degraded['fallback'].get(detail.name, 0) + 1
+                    if face.is_valid:
+                        face[detail_layer] = choice
+                    if node_detail:
+                        face[seed_layer] = detail_random.randrange(1 << 30)
+                    else:
+                        start = time.perf_counter()
+                        DETAIL_FUNCTIONS[choice](bm, face, features)
+                        if degraded:
+                            detail_time += time.perf_counter() - start
+                    yield progress
+            if on_stage:
+                on_stage(bm, 'detail')
+
+        yield 70
+
+        # Apply horizontal symmetry sometimes
+        if allow_horizontal_symmetry and random() > 0.5:
+            bmesh.ops.symmetrize(bm, input=bm.verts[:] + bm.edges[:] + bm.faces[:], direction="-X")  # 1
+            if coarse_bm:
+                bmesh.ops.symmetrize(coarse_bm,
+                                     input=coarse_bm.verts[:] + coarse_bm.edges[:] + coarse_bm.faces[:],
+                                     direction="-X")
+            features = symmetrize_features(features, 0)
+
+        yield 75
+
+        # Apply vertical symmetry sometimes - this can cause spaceship "islands", so disabled by default
+        if allow_vertical_symmetry and random() > 0.5:
+            bmesh.ops.symmetrize(bm, input=bm.verts[:] + bm.edges[:] + bm.faces[:], direction="-Y")  # 2
+            if coarse_bm:
+                bmesh.ops.symmetrize(coarse_bm,
+                                     input=coarse_bm.verts[:] + coarse_bm.edges[:] + coarse_bm.faces[:],
+                                     direction="-Y")
+            features = symmetrize_features(features, 1)
+        if on_stage:
+            on_stage(bm, 'symmetry')
+
+        yield 80
+
+        # Optionally strip redundant geometry before writing the mesh
+        compact_report = None
+        if compact:
+            compact_report = compact_topology(bm)
+
+        # Finish up, write the bmesh into a new mesh, centered on its center of mass
+        me = bpy.data.meshes.new('Mesh')
+        bm.to_mesh(me)
+        center = mesh_center_of_mass(me)
+        me.transform(Matrix.Translation(-center))
+
+        if coarse_bm:
+            collision_bm = create_collision_hull(coarse_bm, collision_pieces, collision_max_verts)
+            collision_me = bpy.data.meshes.new('Collision')
+            collision_bm.to_mesh(collision_me)
+            collision_bm.free()
+    finally:
+        bm.free()
+        if coarse_bm:
+            coarse_bm.free()
+
+    # Add the mesh to the scene, or only to the given collection without
+    # touching the selection
+    obj = bpy.data.objects.new('Spaceship', me)
+    if collection is None:
+        collection = bpy.context.collection
+        collection.objects.link(obj)
+        bpy.context.view_layer.objects.active = obj
+        obj.select_set(True)
+    else:
+        collection.objects.link(obj)
+
+    if collision_me:
+        # Shift the collision hull by the same amount as the ship
+        collision_me.transform(Matrix.Translation(-center))
+    # And the features, stored as a JSON custom property
+    for feature in features:
+        feature['matrix'] = Matrix.Translation(-center) @ feature['matrix']
+    obj['features'] = features_to_json(features)
+    if degraded:
+        obj['degraded'] = json.dumps(degraded)
+    if compact_report:
+        obj['compact_topology'] = compact_report
+
+    # Let the detail node group build the face detail, before the bevel
+    if node_detail:
+        from add_mesh_SpaceshipGenerator import detail_nodes
+        detail_nodes.add_detail_modifier(obj, detail_random.randrange(1 << 30))
 
     # Add a fairly broad bevel modifier to angularize shape
     if apply_bevel_modifier:
-        bevel_modifier = ob.modifiers.new('Bevel', 'BEVEL')
+        bevel_modifier = obj.modifiers.new('Bevel', 'BEVEL')
         bevel_modifier.width = uniform(5, 20)
         bevel_modifier.offset_type = 'PERCENT'
         bevel_modifier.segments = 2
         bevel_modifier.profile = 0.25
         bevel_modifier.limit_method = 'NONE'
 
-    wm.progress_update(90)
+    try:
+        yield 90
+
+        # Add materials to the spaceship
+        me = obj.data
+        materials = create_materials()
+        for mat in materials:
+            if assign_materials:
+                me.materials.append(mat)
+            else:
+                placeholder = bpy.data.materials.new(name="Material")
+                placeholder['spaceship_material'] = mat.name
+                me.materials.append(placeholder)
+        if node_detail:
+            detail_nodes.set_detail_materials(obj, me.materials)
+
+        # Add the collision hull as a hidden wireframe child of the spaceship
+        if collision_me:
+            collision_ob = bpy.data.objects.new('Spaceship Collision', collision_me)
+            collection.objects.link(collision_ob)
+            collision_ob.parent = obj
+            collision_ob.display_type = 'WIRE'
+            collision_ob.hide_render = True
+            collision_ob['collision_pieces'] = len({poly.material_index for poly in collision_me.polygons})
+
+        yield 100
+    except GeneratorExit:
+        # Closed after the ship was linked: take the half built ship out again
+        remove_spaceship(obj)
+        if collision_me and not collision_me.users:
+            bpy.data.meshes.remove(collision_me)
+        raise
+    return obj
 
-    # Add materials to the spaceship
-    me = ob.data
-    materials = create_materials()
-    for mat in materials:
-        if assign_materials:
-            me.materials.append(mat)
-        else:
-            me.materials.append(bpy.data.materials.new(name="Material"))
 
-    wm.progress_update(100)
-    wm.progress_end()
+def run_steps(steps, on_progress=None):
+    '''Run a step generator such as generate_spaceship_steps to completion.
+    Args:
+        steps: generator yielding progress values.
+        on_progress: optional callback called with each progress value.
+    Returns:
+        The value returned by the generator.
+    '''
+    while True:
+        try:
+            progress = next(steps)
+        except StopIteration as stop:
+            return stop.value
+        if on_progress:
+            on_progress(progress)
+
+
+def generate_spaceship_preview(random_seed: str = "",
+                               x_segments: bool = True,
+                               y_segments: bool = False,
+                               z_segments: bool = False,
+                               num_hull_segments_min: int = 3,
+                               num_hull_segments_max: int = 6,
+                               create_asymmetry_segments: bool = True,
+                               num_asymmetry_segments_min: int = 1,
+                               num_asymmetry_segments_max: int = 5):
+    '''Quickly generate a coarse, hull-only preview of a spaceship.
+    Only the hull and asymmetry stages run: no detail, symmetry, bevel or
+    materials. The random state is restored afterwards, so a following
+    generate_spaceship call with the same arguments builds the same ship the
+    preview was taken from.
+    Args:
+        Same as the first nine arguments of generate_spaceship.
+    Returns:
+        obj: the 'Spaceship Preview' object, moved to center it on the
+            origin. The mesh itself is left where the generator built it,
+            so later stages written into it stay centered the same way.
+    '''
+    state = getstate()
+    bm = bmesh.new()
+    try:
+        seed_generator(random_seed)
+        if num_hull_segments_min is None or type(num_hull_segments_min) != int:
+            num_hull_segments_min = 3
+        if num_hull_segments_max is None or type(num_hull_segments_max) != int:
+            num_hull_segments_max = 6
+        run_steps(create_hull_steps(bm,
+                                    x_segments,
+                                    y_segments,
+                                    z_segments,
+                                    num_hull_segments_min,
+                                    num_hull_segments_max))
+        if create_asymmetry_segments:
+            run_steps(add_asymmetry_steps(bm,
+                                          num_asymmetry_segments_min,
+                                          num_asymmetry_segments_max))
+
+        center = sum((v.co for v in bm.verts), Vector()) / max(1, len(bm.verts))
+        me = bpy.data.meshes.new('Spaceship Preview')
+        bm.to_mesh(me)
+    finally:
+        bm.free()
+        setstate(state)
+
+    obj = bpy.data.objects.new('Spaceship Preview', me)
+    # Roughly match the recentering done on the final ship
+    obj.location = -center
+    bpy.context.collection.objects.link(obj)
+    return obj
+
+
+def generate_spaceship(random_seed: str = "",
+                       x_segments: bool = True,
+                       y_segments: bool = False,
+                       z_segments: bool = False,
+                       num_hull_segments_min: int = 3,
+                       num_hull_segments_max: int = 6,
+                       create_asymmetry_segments: bool = True,
+                       num_asymmetry_segments_min: int = 1,
+                       num_asymmetry_segments_max: int = 5,
+                       create_face_detail: bool = True,
+                       allow_horizontal_symmetry: bool = True,
+                       allow_vertical_symmetry: bool = False,
+                       apply_bevel_modifier: bool = True,
+                       assign_materials: bool = True,
+                       compact: bool = False,
+                       loft_hull: bool = False,
+                       node_detail: bool = False,
+                       collision_hull: bool = False,
+                       collision_pieces: int = 1,
+                       collision_max_verts: int = 32,
+                       collection=None,
+                       on_progress=None,
+                       time_budget: float = 0.0,
+                       hull_cache: str = ""):
+    '''Generate a spaceship mesh.
+    Args:
+        random_seed (str): random seed for the generator.
+        x_segments (bool): whether to segment the hull along the X axis.
+        y_segments (bool): whether to segment the hull along the Y axis.
+        z_segments (bool): whether to segment the hull along the Z axis.
+        num_hull_segments_min (int): minimum number of hull segments.
+        num_hull_segments_max (int): maximum number of hull segments.
+        create_asymmetry_segments (bool): whether to add asymmetrical hull segments.
+        num_asymmetry_segments_min (int): minimum number of asymmetry segments.
+        num_asymmetry_segments_max (int): maximum number of asymmetry segments.
+        create_face_detail (bool): whether to add detail to the hull faces.
+        allow_horizontal_symmetry (bool): whether to allow horizontal symmetry.
+        allow_vertical_symmetry (bool): whether to allow vertical symmetry.
+        apply_bevel_modifier (bool): whether to apply a bevel modifier.
+        assign_materials (bool): whether to assign materials to the spaceship.
+        compact (bool): whether to run compact_topology before writing the mesh.
+        loft_hull (bool): whether to build the hull with create_hull_lofted_steps.
+        node_detail (bool): whether to build the face detail with the
+            detail_nodes Geometry Nodes modifier instead of bmesh. The
+            modifier's detail isn't recorded in the 'features' property.
+        collision_hull (bool): whether to add a 'Spaceship Collision' child
+            with convex pieces around the body before detail, see
+            create_collision_hull.
+        collision_pieces (int): number of convex pieces of the collision hull.
+        collision_max_verts (int): upper limit on the vertices per piece.
+        collection: collection to link the spaceship to. By default it goes
+            into the current collection and becomes the selected, active
+            object; with a collection the context isn't used at all.
+        on_progress: callback called with the progress (0-100), instead of
+            the window manager progress bar.
+        time_budget (float): seconds allowed for the face detail, the stage
+            whose cost varies most between seeds, or 0 for no limit. The
+            detail is planned to fit with plan_detail, falling back to
+            cheaper detail or skipping the least important faces. If the
+            detail still takes longer than the budget, the remaining faces
+            are skipped too. What was degraded is stored as JSON in the
+            'degraded' custom property; the output is deterministic for a
+            seed and budget unless its 'deadline_hit' is true.
+        hull_cache (str): directory of a hull_cache shared between
+            processes, to build the hull of each seed and hull parameters
+            only once. Empty to always build it.
+    '''
+    # Print each input parameter
+    print("random_seed: " + str(random_seed))
+    print("x_segments: " + str(x_segments))
+    print("y_segments: " + str(y_segments))
+    print("z_segments: " + str(z_segments))
+    print("num_hull_segments_min: " + str(num_hull_segments_min))
+    print("num_hull_segments_max: " + str(num_hull_segments_max))
+    print("create_asymmetry_segments: " + str(create_asymmetry_segments))
+    print("num_asymmetry_segments_min: " + str(num_asymmetry_segments_min))
+    print("num_asymmetry_segments_max: " + str(num_asymmetry_segments_max))
+    print("create_face_detail: " + str(create_face_detail))
+    print("allow_horizontal_symmetry: " + str(allow_horizontal_symmetry))
+    print("allow_vertical_symmetry: " + str(allow_vertical_symmetry))
+    print("apply_bevel_modifier: " + str(apply_bevel_modifier))
+    print("assign_materials: " + str(assign_materials))
+    print("compact: " + str(compact))
+    print("loft_hull: " + str(loft_hull))
+    print("node_detail: " + str(node_detail))
+    print("collision_hull: " + str(collision_hull))
+    print("collision_pieces: " + str(collision_pieces))
+    print("collision_max_verts: " + str(collision_max_verts))
+    print("time_budget: " + str(time_budget))
+    print("hull_cache: " + str(hull_cache))
+
+    if on_progress is None:
+        wm = bpy.context.window_manager
+        wm.progress_begin(0, 100)
+    obj = run_steps(generate_spaceship_steps(random_seed,
+                                             x_segments,
+                                             y_segments,
+                                             z_segments,
+                                             num_hull_segments_min,
+                                             num_hull_segments_max,
+                                             create_asymmetry_segments,
+                                             num_asymmetry_segments_min,
+                                             num_asymmetry_segments_max,
+                                             create_face_detail,
+                                             allow_horizontal_symmetry,
+                                             allow_vertical_symmetry,
+                                             apply_bevel_modifier,
+                                             assign_materials,
+                                             compact,
+                                             loft_hull,
+                                             node_detail,
+                                             collision_hull,
+                                             collision_pieces,
+                                             collision_max_verts,
+                                             collection,
+                                             time_budget,
+                                             hull_cache),
+                    on_progress or wm.progress_update)
+    if on_progress is None:
+        wm.progress_end()
     return obj
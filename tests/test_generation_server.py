@@ -0,0 +1,93 @@
+# The protocol and clients are plain Python, so these run without Blender,
+# with a stub handler in place of run_job.
+
+import importlib.util
+import io
+import os
+import socket
+import threading
+import time
+
+spec = importlib.util.spec_from_file_location(
+    'generation_server', os.path.join(os.path.dirname(__file__), os.pardir, 'generation_server.py'))
+generation_server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(generation_server)
+
+
+def stub_handler(job, output_dir):
+    if job.get('fail'):
+        raise RuntimeError("boom")
+    return {'id': job.get('id'), 'ok': True}, job.get('seed', '').encode()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_message_round_trip():
+    stream = io.BytesIO()
+    generation_server.write_message(stream, {'id': '1'}, b'\x00payload\n')
+    generation_server.write_message(stream, {'id': '2'})
+    stream.seek(0)
+    assert generation_server.read_message(stream) == ({'id': '1', 'payload_size': 9}, b'\x00payload\n')
+    assert generation_server.read_message(stream) == ({'id': '2', 'payload_size': 0}, b'')
+    assert generation_server.read_message(stream) == (None, None)
+
+
+def request(job, port):
+    # The worker thread may not be listening yet
+    for _ in range(100):
+        try:
+            return generation_server.request_ship(job, port=port, timeout=5)
+        except ConnectionRefusedError:
+            time.sleep(0.05)
+    raise ConnectionRefusedError(port)
+
+
+def test_socket_worker():
+    port = free_port()
+    worker = threading.Thread(target=generation_server.serve_socket,
+                              kwargs={'port': port, 'handler': stub_handler}, daemon=True)
+    worker.start()
+    header, payload = request({'id': 'a', 'seed': '42'}, port)
+    assert header['ok'] and header['id'] == 'a' and payload == b'42'
+
+    header, payload = request({'id': 'b', 'fail': True}, port)
+    assert not header['ok'] and header['id'] == 'b' and 'boom' in header['error']
+    assert payload == b''
+
+    header, _ = request({'id': 'c', 'command': 'shutdown'}, port)
+    assert header['ok']
+    worker.join(5)
+    assert not worker.is_alive()
+
+
+def test_directory_worker(tmp_path):
+    queue_dir = str(tmp_path)
+    worker = threading.Thread(target=generation_server.serve_directory,
+                              args=(queue_dir, stub_handler), kwargs={'poll_interval': 0.01}, daemon=True)
+    worker.start()
+    try:
+        job_id = generation_server.submit_to_directory(queue_dir, {'seed': '7'}, 'good')
+        header = generation_server.wait_for_result(queue_dir, job_id, timeout=5)
+        assert header['ok'] and header['id'] == 'good'
+        with open(header['path'], 'rb') as f:
+            assert f.read() == b'7'
+
+        job_id = generation_server.submit_to_directory(queue_dir, {'fail': True}, 'failing')
+        header = generation_server.wait_for_result(queue_dir, job_id, timeout=5)
+        assert not header['ok'] and 'boom' in header['error']
+
+        with open(os.path.join(queue_dir, 'broken.job.json'), 'w') as f:
+            f.write('{"seed": ')
+        header = generation_server.wait_for_result(queue_dir, 'broken', timeout=5)
+        assert not header['ok'] and header['id'] == 'broken'
+        assert 'JSONDecodeError' in header['error']
+    finally:
+        open(os.path.join(queue_dir, 'shutdown'), 'w').close()
+        worker.join(5)
+    assert not worker.is_alive()
+    # No job is left claimed without a reply
+    assert not [name for name in os.listdir(queue_dir) if '.claimed.' in name]
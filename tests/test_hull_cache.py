@@ -0,0 +1,14 @@
+# Runs inside Blender with the add-on installed, e.g.
+#   blender -b --python-expr "import pytest; pytest.main(['tests'])"
+
+import pytest
+
+bpy = pytest.importorskip('bpy')
+hull_cache = pytest.importorskip('add_mesh_SpaceshipGenerator.hull_cache')
+
+
+@pytest.mark.parametrize('random_seed', ['1', '2', '3', '4', '5'])
+def test_cached_hull_matches(tmp_path, random_seed):
+    report = hull_cache.compare_cached_hull(random_seed, str(tmp_path))
+    assert report['same_topology'] and report['same_materials']
+    assert report['max_distance'] < 1e-5
@@ -0,0 +1,38 @@
+# Runs inside Blender with the add-on installed, e.g.
+#   blender -b --python-expr "import pytest; pytest.main(['tests'])"
+
+import pytest
+
+bpy = pytest.importorskip('bpy')
+kitbash = pytest.importorskip('add_mesh_SpaceshipGenerator.kitbash')
+
+
+def test_harvest_and_assemble(tmp_path):
+    library = kitbash.new_library()
+    parts = kitbash.harvest_ship(library, '1')
+    kinds = [part['kind'] for part in parts]
+    assert kinds.count('tail') == 1 and kinds.count('nose') == 1
+    assert all(len(part['arrays']['positions']) for part in parts)
+
+    path = str(tmp_path / 'parts.npz')
+    kitbash.save_library(library, path)
+    loaded = kitbash.load_library(path)
+    assert loaded['seeds'] == ['1'] and len(loaded['parts']) == len(parts)
+
+    obj = kitbash.assemble_ship(loaded, '2')
+    assert len(obj.data.polygons) and len(obj.data.materials) == 5
+
+
+def test_sections_line_up_with_pods():
+    from random import Random
+    library = kitbash.new_library()
+    for random_seed in ('1', '2', '3'):
+        kitbash.harvest_ship(library, random_seed)
+    parts = library['parts']
+    placed = kitbash.place_parts(library, Random('4'), mid_sections=(2, 3), pod_chance=1.0)
+    sections = [(index, transform) for index, transform in placed if parts[index]['kind'] != 'pod']
+    assert len(sections) >= 4
+    for (previous, previous_transform), (index, transform) in zip(sections, sections[1:]):
+        front = (previous_transform @ parts[previous]['connectors']['front'][0]).to_translation()
+        rear = (transform @ parts[index]['connectors']['rear'][0]).to_translation()
+        assert (front - rear).length < 1e-4